@@ -0,0 +1,440 @@
+# bench.py
+# ベンチマーク。使い方: python bench.py [stage ...] [--json FILE] [--baseline FILE] [--save-baseline FILE]
+#   stage: parse / seen / render / send / importtime（省略時は全て）
+import argparse
+import hashlib
+import io
+import json
+import os
+import platform
+import sqlite3
+import subprocess
+import sys
+import tempfile
+import time
+from contextlib import redirect_stdout
+
+import seen_store
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+FIXTURE = os.path.join(HERE, "fixtures", "shigaku_event.html")
+HISTORY_SIZES = (1_000, 10_000, 100_000)
+PAGE_SIZES = (1_000, 10_000, 100_000)
+BATCH = 200  # 1回の実行で照合するイベント数（半分が新着）
+
+# 計測結果 {名前: {"seconds": 最小所要時間, ...}}。--json / --baseline で使う
+RESULTS = {}
+QUICK = False  # --quick: 100k のサイズを省く
+
+
+def _timeit(fn, repeat=5):
+    """repeat 回実行して最小の所要時間（秒）を返す"""
+    best = float("inf")
+    for _ in range(repeat):
+        t = time.perf_counter()
+        fn()
+        best = min(best, time.perf_counter() - t)
+    return best
+
+
+def _record(name, seconds, **extra):
+    RESULTS[name] = {"seconds": seconds, **extra}
+    return seconds
+
+
+def _sizes(sizes):
+    return sizes[:2] if QUICK else sizes
+
+
+def _events(start, n):
+    return [{"title": f"イベント{i}", "date": "2025.11.01（土）11:30",
+             "link": f"https://example.com/mypage/shigaku/reserve/?id={i}"} for i in range(start, start + n)]
+
+
+# ---------- parse: フィクスチャと、3形式それぞれの大きな合成ページ ----------
+def _page_table(n):
+    rows = "".join(f"<tr><td>2025/11/{i % 28 + 1:02d}</td><td><a href='/reserve/?id={i}'>イベント{i}</a></td></tr>"
+                   for i in range(n))
+    return f"<html><body><table><tbody>{rows}</tbody></table></body></html>"
+
+
+def _page_generic_list(n):
+    items = "".join(f"<li class='event'><h3>イベント{i}</h3><time>2025/11/{i % 28 + 1:02d}</time>"
+                    f"<a href='/reserve/?id={i}'>詳細</a></li>" for i in range(n))
+    return f"<html><body><ul class='events'>{items}</ul></body></html>"
+
+
+def _page_row_ttl(n):
+    items = "".join(f"<li><a href='/reserve/?id={i}'><span>2025.11.{i % 28 + 1:02d}</span>"
+                    f"<span class='status'>受付中</span>イベント{i}</a></li>" for i in range(n))
+    return f"<html><body><div class='row ttl'><ul>{items}</ul></div></body></html>"
+
+
+LAYOUTS = {"table": _page_table, "generic_list": _page_generic_list, "row_ttl": _page_row_ttl}
+
+
+def bench_parse():
+    import parsers
+    base = "https://example.com/mypage/shigaku/schedule/events/"
+    with open(FIXTURE, "r", encoding="utf-8") as f:
+        fixture = f.read()
+
+    def parse(html):
+        return parsers.parse_events_generic(html, base)
+
+    pages = [("fixture", fixture, 20)]
+    for layout, make in LAYOUTS.items():
+        for size in _sizes(PAGE_SIZES):
+            pages.append((f"{layout}/{size}", make(size), 5 if size < 100_000 else 2))
+
+    rows = []
+    for name, html, repeat in pages:
+        n = len(parse(html))
+        if name != "fixture":
+            assert n == int(name.rsplit("/", 1)[1]), f"{name}: {n}件しか取れていません"
+        rows.append((name, n, _record(f"parse/{name}", _timeit(lambda: parse(html), repeat), events=n)))
+
+    print("parse: parse_events_generic")
+    print(f"{'ページ':>22} {'件数':>8} {'ms':>10} {'µs/件':>8}")
+    for name, n, t in rows:
+        print(f"{name:>22} {n:>8,} {t * 1000:>10.2f} {t * 1e6 / max(n, 1):>8.2f}")
+
+    # 木全体を作る場合と iter_events（→ iter_new）で流す場合の最大メモリ（別プロセスで測る）
+    print(f"\nparse: 最大メモリの増加（{', '.join(LAYOUTS)}、dom=木全体 / stream=iter_events→iter_new）")
+    print(f"{'ページ':>22} {'dom KB':>10} {'stream KB':>10} {'stream ms':>10}")
+    with tempfile.TemporaryDirectory() as tmp:
+        for layout, make in LAYOUTS.items():
+            for size in _sizes(PAGE_SIZES):
+                path = os.path.join(tmp, f"{layout}_{size}.html")
+                with open(path, "w", encoding="utf-8") as f:
+                    f.write(make(size))
+                # ページを読み込むだけのプロセスの最大メモリを差し引く
+                base_kb = _parse_peak(path, layout, size, "load")["rss_kb"]
+                dom = _parse_peak(path, layout, size, "dom")
+                stream = _parse_peak(path, layout, size, "stream")
+                dom_kb, stream_kb = dom["rss_kb"] - base_kb, stream["rss_kb"] - base_kb
+                _record(f"parse_stream/{layout}/{size}", stream["seconds"], events=size,
+                        rss_kb=stream_kb, dom_rss_kb=dom_kb)
+                print(f"{layout + '/' + str(size):>22} {dom_kb:>10,} {stream_kb:>10,} "
+                      f"{stream['seconds'] * 1000:>10.2f}")
+
+
+_PEAK_SCRIPT = """
+import resource, sys, time
+import parsers, seen_store
+
+
+def peak_kb():
+    # ru_maxrss は fork 元（このベンチ）の値を引き継ぐので、Linux では VmHWM を使う
+    try:
+        with open("/proc/self/status") as f:
+            return int(next(l for l in f if l.startswith("VmHWM:")).split()[1])
+    except (OSError, StopIteration):
+        return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+
+
+path, layout, size, mode = sys.argv[1], sys.argv[2], int(sys.argv[3]), sys.argv[4]
+with open(path, "r", encoding="utf-8") as f:
+    html = f.read()
+conn = seen_store.ensure_db(":memory:")
+base = "https://example.com/mypage/shigaku/schedule/events/"
+t = time.perf_counter()
+if mode == "load":
+    n = size
+elif mode == "dom":
+    parsers.STREAM_MIN_CHARS = float("inf")
+    n = len(seen_store.filter_new(conn, parsers.parse_events_generic(html, base, prefer=layout), ""))
+else:
+    n = sum(1 for _ in seen_store.iter_new(conn, parsers.iter_events(html, base, prefer=layout), ""))
+seconds = time.perf_counter() - t
+assert n == size, (layout, size, mode, n)
+print(peak_kb(), seconds)
+"""
+
+
+def _parse_peak(path, layout, size, mode):
+    out = subprocess.run([sys.executable, "-c", _PEAK_SCRIPT, path, layout, str(size), mode], cwd=HERE,
+                         capture_output=True, text=True, check=True).stdout.split()
+    return {"rss_kb": int(out[-2]), "seconds": float(out[-1])}
+
+
+# ---------- seen: 旧実装（1件ずつ SELECT / INSERT・TEXT id）との比較 ----------
+def _legacy_db(path, history):
+    conn = sqlite3.connect(path)
+    conn.execute("CREATE TABLE seen(id TEXT PRIMARY KEY, created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP)")
+    conn.executemany("INSERT INTO seen(id) VALUES(?)", ((_legacy_uid(e),) for e in _events(0, history)))
+    conn.commit()
+    return conn
+
+
+def _legacy_uid(e):
+    basis = f"{e.get('title','')}|{e.get('date','')}|{e.get('link','')}"
+    return hashlib.sha256(basis.encode("utf-8")).hexdigest()
+
+
+def _legacy_round(conn, events):
+    cur = conn.cursor()
+    out = []
+    for e in events:
+        uid = _legacy_uid(e)
+        if cur.execute("SELECT 1 FROM seen WHERE id=?", (uid,)).fetchone():
+            continue
+        out.append(uid)
+    for uid in out:
+        cur.execute("INSERT OR IGNORE INTO seen(id) VALUES(?)", (uid,))
+    conn.commit()
+    # 次の繰り返しでも同じ条件になるよう戻す
+    conn.executemany("DELETE FROM seen WHERE id=?", ((u,) for u in out))
+    conn.commit()
+
+
+def _store_db(path, history):
+    conn = seen_store.ensure_db(path)
+    with conn:
+        conn.executemany("INSERT INTO seen(id) VALUES(?)",
+                         ((seen_store.uid_from_event(e),) for e in _events(0, history)))
+    return conn
+
+
+def _store_round(conn, events):
+    new = seen_store.filter_new(conn, [dict(e) for e in events])
+    seen_store.mark_seen(conn, new)
+    with conn:
+        conn.executemany("DELETE FROM seen WHERE source='' AND id=?", ((e["_uid"],) for e in new))
+
+
+def bench_seen():
+    results = []
+    with tempfile.TemporaryDirectory() as tmp:
+        for history in _sizes(HISTORY_SIZES):
+            events = _events(history - BATCH // 2, BATCH)
+            legacy = _legacy_db(os.path.join(tmp, f"legacy{history}.db"), history)
+            store = _store_db(os.path.join(tmp, f"store{history}.db"), history)
+            with redirect_stdout(io.StringIO()):
+                t_legacy = _timeit(lambda: _legacy_round(legacy, events))
+                t_store = _timeit(lambda: _store_round(store, events))
+            legacy.close()
+            seen_store.close(store)
+            size_legacy = os.path.getsize(os.path.join(tmp, f"legacy{history}.db"))
+            size_store = os.path.getsize(os.path.join(tmp, f"store{history}.db"))
+            _record(f"seen/legacy/{history}", t_legacy, db_bytes=size_legacy)
+            _record(f"seen/store/{history}", t_store, db_bytes=size_store)
+            results.append((history, t_legacy, t_store, size_legacy, size_store))
+
+    print(f"seen: 1回 {BATCH} 件を照合・登録（半分が新着）")
+    print(f"{'履歴件数':>10} {'旧(ms)':>10} {'新(ms)':>10} {'旧DB(KB)':>10} {'新DB(KB)':>10}")
+    for history, t_legacy, t_store, size_legacy, size_store in results:
+        print(f"{history:>10,} {t_legacy * 1000:>10.2f} {t_store * 1000:>10.2f} "
+              f"{size_legacy // 1024:>10,} {size_store // 1024:>10,}")
+
+
+# ---------- render: FORMAT_STYLE ごとの format_event と render_message / render_chunks（templates.py） ----------
+def bench_render():
+    import main
+    rows = []
+    saved = main.CONFIG
+    try:
+        for n in (10, 100, 1_000):
+            events = _events(0, n)
+            for style in ("list", "cards", "compact"):
+                main.CONFIG = saved._replace(format_style=style)
+                t = _timeit(lambda: [main.format_event(e) for e in events], 20)
+                rows.append((f"format_event/{style}", n, _record(f"render/format_event/{style}/{n}", t)))
+            main.CONFIG = saved
+            t = _timeit(lambda: main.render_message(events), 20)
+            rows.append(("render_message", n, _record(f"render/render_message/{n}", t)))
+            t = _timeit(lambda: main.render_chunks(events), 20)
+            rows.append(("render_chunks", n, _record(f"render/render_chunks/{n}", t)))
+            # 断片のキャッシュなし（毎回テンプレートの組み立てから）
+            t = _timeit(lambda: _render_cold(main, events), 20)
+            rows.append(("render_chunks/cold", n, _record(f"render/render_chunks_cold/{n}", t)))
+    finally:
+        main.CONFIG = saved
+
+    print("render: 整形（cold 以外は2回目以降＝整形済み断片のキャッシュあり）")
+    print(f"{'関数':>22} {'件数':>8} {'ms':>10}")
+    for name, n, t in rows:
+        print(f"{name:>22} {n:>8,} {t * 1000:>10.3f}")
+
+
+def _render_cold(main, events):
+    main._RENDERER = None
+    return main.render_chunks(events)
+
+
+# ---------- send: 模擬 LINE API（mock_line.py）への送信（push / multicast・障害あり） ----------
+# (名前, MockOptions の値)。障害ありは宛先100人の push_each / multicast_each で測る
+SEND_SCENARIOS = (
+    ("5xx10%", {"error_rate": 0.1, "error_status": 503, "seed": 1}),
+    ("429", {"rate": 200, "burst": 20, "retry_after": 0.01, "seed": 1}),
+    ("latency20ms", {"latency": 0.02}),
+)
+
+
+def bench_send():
+    import main
+    from line_client import LineClient
+    from mock_line import MockLineServer, MockOptions
+
+    saved_config, saved_client = main.CONFIG, main._LINE_CLIENT
+    message = main.render_chunks(_events(0, 20))
+    main.CONFIG = saved_config._replace(token="bench", dry_run=False, validate_only=False)
+    rows = []
+
+    def run(mock, name, fn, ids, repeat, label):
+        # 再送の待ち時間は短くする（回数と所要時間の傾向を見るため）
+        main._LINE_CLIENT = LineClient("bench", api_base=mock.url, rate_per_sec=0, backoff_base=0.005)
+        try:
+            mock.reset()
+            with redirect_stdout(io.StringIO()):
+                t = _timeit(lambda: fn(ids, message), repeat)
+            stats = mock.stats()
+            reqs, retries = stats["requests"] // repeat, main._LINE_CLIENT.retries // repeat
+            rows.append((name, label, len(ids), reqs, retries,
+                         _record(f"send/{name}/{label}", t, requests=reqs, retries=retries)))
+        finally:
+            main._LINE_CLIENT.close()
+
+    try:
+        with MockLineServer() as mock:
+            for n in (10, 100, 1_000):
+                ids = [f"U{i:032x}" for i in range(n)]
+                for name, fn in (("push_each", main.push_each), ("multicast_each", main.multicast_each)):
+                    if name == "push_each" and n > 100 and QUICK:
+                        continue
+                    run(mock, name, fn, ids, 3, str(n))
+        ids = [f"U{i:032x}" for i in range(100)]
+        for label, options in SEND_SCENARIOS:
+            with MockLineServer(MockOptions(**options)) as mock:
+                for name, fn in (("push_each", main.push_each), ("multicast_each", main.multicast_each)):
+                    run(mock, name, fn, ids, 1, f"100/{label}")
+    finally:
+        main.CONFIG, main._LINE_CLIENT = saved_config, saved_client
+
+    print("send: 模擬 LINE API への送信（クライアント側の流量制限なし）")
+    print(f"{'関数':>16} {'条件':>16} {'宛先数':>8} {'リクエスト':>10} {'再送':>6} {'ms':>10}")
+    for name, label, n, reqs, retries, t in rows:
+        print(f"{name:>16} {label:>16} {n:>8,} {reqs:>10,} {retries:>6,} {t * 1000:>10.1f}")
+
+
+# ---------- importtime: import の重さと副作用の回帰チェック ----------
+# import しただけでは読み込まれてはいけないモジュール（使う経路に入ったときだけ読み込む）
+LAZY_MODULES = ("playwright", "requests", "bs4", "line_client", "crawler")
+IMPORT_BUDGET_MS = float(os.getenv("IMPORT_BUDGET_MS", "100"))
+
+
+def _importtime(module):
+    """python -X importtime -c "import module" の (累積ms, 読み込まれたモジュール, 標準出力)"""
+    r = subprocess.run([sys.executable, "-X", "importtime", "-c", f"import {module}"],
+                       capture_output=True, text=True, cwd=HERE)
+    loaded, total = set(), None
+    for line in r.stderr.splitlines():
+        if not line.startswith("import time:") or "|" not in line:
+            continue
+        _, cumulative, name = (x.strip() for x in line[len("import time:"):].split("|"))
+        if not cumulative.isdigit():
+            continue  # 見出し行
+        loaded.add(name)
+        if name == module:
+            total = int(cumulative) / 1000
+    if r.returncode != 0 or total is None:
+        raise SystemExit(f"import {module} に失敗しました:\n{r.stderr[-2000:]}")
+    return total, loaded, r.stdout
+
+
+def bench_importtime():
+    failures = []
+    print(f"importtime: 予算 {IMPORT_BUDGET_MS:g}ms（IMPORT_BUDGET_MS）/ 遅延読み込み対象: {', '.join(LAZY_MODULES)}")
+    print(f"{'モジュール':>14} {'最小(ms)':>10}  読み込まれた遅延対象")
+    for module in ("main", "parsers", "seen_store", "sources", "scraper_login", "settings", "metrics", "templates"):
+        runs = [_importtime(module) for _ in range(5)]
+        best = min(t for t, _, _ in runs)
+        _record(f"importtime/{module}", best / 1000)
+        loaded, stdout = runs[0][1], runs[0][2]
+        eager = sorted(m for m in loaded if m.split(".")[0] in LAZY_MODULES)
+        print(f"{module:>14} {best:>10.1f}  {', '.join(eager) or '-'}")
+        if eager:
+            failures.append(f"{module}: import 時に {', '.join(eager)} を読み込んでいます")
+        if stdout:
+            failures.append(f"{module}: import 時に出力があります: {stdout[:80]!r}")
+        if module == "main" and best > IMPORT_BUDGET_MS:
+            failures.append(f"main: import {best:.1f}ms が予算 {IMPORT_BUDGET_MS:g}ms を超えています")
+    if failures:
+        raise SystemExit("importtime: 回帰あり\n  " + "\n  ".join(failures))
+
+
+STAGES = {
+    "parse": bench_parse,
+    "seen": bench_seen,
+    "render": bench_render,
+    "send": bench_send,
+    "importtime": bench_importtime,
+}
+
+
+# ---------- JSON 出力とベースライン比較 ----------
+def _report():
+    return {
+        "created_at": time.strftime("%Y-%m-%dT%H:%M:%S%z"),
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "results": RESULTS,
+    }
+
+
+def compare(baseline_path, tolerance):
+    """ベースラインより tolerance（割合）を超えて遅くなった項目の一覧"""
+    with open(baseline_path, "r", encoding="utf-8") as f:
+        baseline = json.load(f)["results"]
+    regressions = []
+    print(f"ベースライン比較: {baseline_path}（許容 +{tolerance:.0%}）")
+    for name, cur in RESULTS.items():
+        base = baseline.get(name)
+        if not base or not base.get("seconds"):
+            continue
+        ratio = cur["seconds"] / base["seconds"]
+        mark = ""
+        if ratio > 1 + tolerance:
+            regressions.append(f"{name}: {base['seconds'] * 1000:.2f}ms → {cur['seconds'] * 1000:.2f}ms (x{ratio:.2f})")
+            mark = "  ← 回帰"
+        print(f"  {name:<36} x{ratio:>5.2f}{mark}")
+    return regressions
+
+
+def _cli(argv):
+    global QUICK
+    ap = argparse.ArgumentParser(prog="bench.py", description="ベンチマーク")
+    ap.add_argument("stages", nargs="*", metavar="stage", help=f"{' / '.join(STAGES)}（省略時は全て）")
+    ap.add_argument("--json", help="結果をJSONで保存するファイル")
+    ap.add_argument("--baseline", help="比較するベースラインのJSON。遅くなっていたら終了コード1")
+    ap.add_argument("--save-baseline", help="結果をベースラインとして保存するファイル")
+    ap.add_argument("--tolerance", type=float, default=float(os.getenv("BENCH_TOLERANCE", "0.5")),
+                    help="回帰とみなす遅くなり方（割合。既定0.5＝1.5倍）")
+    ap.add_argument("--quick", action="store_true", help="100k のサイズを省く")
+    args = ap.parse_args(argv)
+    unknown = [s for s in args.stages if s not in STAGES]
+    if unknown:
+        ap.error(f"不明なステージ: {', '.join(unknown)}")
+    QUICK = args.quick
+
+    for name in args.stages or list(STAGES):
+        STAGES[name]()
+        print()
+
+    report = _report()
+    for path in (args.json, args.save_baseline):
+        if path:
+            with open(path, "w", encoding="utf-8") as f:
+                json.dump(report, f, ensure_ascii=False, indent=2, sort_keys=True)
+            print(f"結果を保存しました: {path}")
+    if args.baseline:
+        regressions = compare(args.baseline, args.tolerance)
+        if regressions:
+            print("回帰あり:\n  " + "\n  ".join(regressions))
+            return 1
+        print("回帰なし")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(_cli(sys.argv[1:]))
@@ -0,0 +1,80 @@
+# changes.py
+# 取得先ごとの前回の一覧（スナップショット）と今回の一覧を比べ、追加・変更・削除に分ける（NOTIFY_CHANGES）
+import logging
+import re
+from datetime import date
+from typing import Dict, Iterable, List, NamedTuple, Optional, Tuple
+
+from identity import canonical_url, identity_basis, normalize_date, normalize_text
+
+# 変更として比べる項目（今回と前回の両方に値があるときだけ。詳細ページの項目は新着にしか付かない）
+COMPARE_FIELDS = ("title", "date", "venue", "deadline")
+# 前回の一覧のうちこの割合より多くの開催前イベントが一度に消えたら、ページの形式が変わったとみなして削除を通知しない
+REMOVED_MAX_RATIO = 0.5
+_DAY_RE = re.compile(r"\d{4}-\d{2}-\d{2}")
+
+
+class Change(NamedTuple):
+    """event: 今回のイベント / before: 前回のイベント / fields: 値が変わった項目"""
+    event: dict
+    before: dict
+    fields: Tuple[str, ...]
+
+
+class EventDiff(NamedTuple):
+    added: List[dict]
+    changed: List[Change]
+    removed: List[dict]
+
+    @property
+    def size(self):
+        return len(self.added) + len(self.changed) + len(self.removed)
+
+
+def event_key(e) -> str:
+    """スナップショットのキー。正規化したリンク（リンクがなければ タイトル|日付）"""
+    return canonical_url(e.get("link")) or "#" + identity_basis(e)
+
+
+def _same(field, a, b):
+    if field == "date":
+        return normalize_date(a) == normalize_date(b)
+    return normalize_text(a) == normalize_text(b)
+
+
+def _day(e) -> Optional[str]:
+    """開催日（YYYY-MM-DD）。日付として読めなければ None"""
+    d = normalize_date(e.get("date"))
+    return d[:10] if _DAY_RE.match(d) else None
+
+
+def diff_events(before: Dict[str, dict], events: Iterable[dict]) -> EventDiff:
+    """before（event_key -> 前回のイベント）と events を比べる。どちらも1回ずつ見るだけ"""
+    current = set()
+    added, changed = [], []
+    for e in events:
+        key = event_key(e)
+        if key in current:  # 同じイベントが一覧に2回載っている
+            continue
+        current.add(key)
+        old = before.get(key)
+        if old is None:
+            added.append(e)
+            continue
+        fields = tuple(f for f in COMPARE_FIELDS if e.get(f) and old.get(f) and not _same(f, e[f], old[f]))
+        if fields:
+            changed.append(Change(e, old, fields))
+    removed = [old for key, old in before.items() if key not in current]
+    return EventDiff(added, changed, removed)
+
+
+def notable(diff: EventDiff, before_count: int, today: Optional[date] = None) -> EventDiff:
+    """通知する分だけに絞る。削除は開催日がまだ来ていないもの（中止・掲載終了）だけ。
+    開催日を過ぎて一覧から消えるのは通常の入れ替わりなので通知しない"""
+    today = (today or date.today()).isoformat()
+    removed = [e for e in diff.removed if (_day(e) or "") >= today]
+    if before_count and len(removed) > before_count * REMOVED_MAX_RATIO:
+        logging.warning(f"前回の一覧のうち開催前の {len(removed)}/{before_count}件が消えました。"
+                        "ページの形式が変わった可能性があるため、削除は通知しません")
+        removed = []
+    return diff._replace(removed=removed)
@@ -0,0 +1,171 @@
+# crawler.py
+# 一覧のページ送りとイベント詳細ページの取得（同時実行数の上限つき・ディスクキャッシュあり）
+import hashlib
+import json
+import logging
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import requests
+from requests.adapters import HTTPAdapter
+
+import metrics
+from parsers import find_next_page, parse_event_detail, parse_events_generic
+from scraper_login import FetchOptions, load_cookies
+
+
+class DiskCache:
+    """URL ごとに本文と ETag / Last-Modified を1ファイル（JSON）で保存する"""
+
+    def __init__(self, directory):
+        self.directory = directory
+        os.makedirs(directory, exist_ok=True)
+
+    def _path(self, url):
+        return os.path.join(self.directory, hashlib.sha256(url.encode("utf-8")).hexdigest()[:32] + ".json")
+
+    def get(self, url):
+        try:
+            with open(self._path(url), "r", encoding="utf-8") as f:
+                entry = json.load(f)
+        except (OSError, ValueError):
+            return None
+        return entry if entry.get("url") == url else None
+
+    def put(self, url, html, etag=None, last_modified=None):
+        entry = {"url": url, "etag": etag, "last_modified": last_modified,
+                 "fetched_at": time.time(), "html": html}
+        path = self._path(url)
+        tmp = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+        with open(tmp, "w", encoding="utf-8") as f:
+            json.dump(entry, f, ensure_ascii=False)
+        os.replace(tmp, path)  # 途中で落ちても壊れたファイルを残さない
+        return entry
+
+
+class Crawler:
+    """ログイン済み cookie で一覧の続きのページと詳細ページを取得する。
+
+    取得は最大 workers 件まで同時に行い、結果は DiskCache に保存する。
+    キャッシュが ttl 秒以内なら通信せず、それより古ければ条件付き GET で確認する。
+    """
+
+    def __init__(self, cache_dir, workers=4, ttl=86400, timeout=30,
+                 user_agent=FetchOptions().user_agent):
+        self.cache = DiskCache(cache_dir)
+        self.workers = max(1, workers)
+        self.ttl = ttl
+        self.timeout = timeout
+        self.stats = {"fetched": 0, "not_modified": 0, "cached": 0, "failed": 0}
+        self._lock = threading.Lock()
+
+        self.session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=2, pool_maxsize=self.workers)
+        self.session.mount("https://", adapter)
+        self.session.mount("http://", adapter)
+        self.session.headers["User-Agent"] = user_agent
+
+    def set_cookies(self, cookies):
+        if cookies:
+            load_cookies(self.session, cookies)
+
+    def _count(self, key):
+        with self._lock:
+            self.stats[key] += 1
+
+    def get(self, url, max_age=None):
+        """url の HTML（取得できずキャッシュもなければ None）。
+        max_age 秒（既定は ttl）以内のキャッシュはそのまま使う"""
+        max_age = self.ttl if max_age is None else max_age
+        entry = self.cache.get(url)
+        if entry and time.time() - entry["fetched_at"] < max_age:
+            self._count("cached")
+            return entry["html"]
+
+        headers = {}
+        if entry:
+            if entry.get("etag"):
+                headers["If-None-Match"] = entry["etag"]
+            if entry.get("last_modified"):
+                headers["If-Modified-Since"] = entry["last_modified"]
+        try:
+            r = self.session.get(url, headers=headers, timeout=self.timeout)
+        except requests.RequestException as e:
+            logging.warning(f"取得失敗: {url}: {e}")
+            self._count("failed")
+            return entry["html"] if entry else None
+
+        if r.status_code == 304 and entry:
+            self._count("not_modified")
+            self.cache.put(url, entry["html"], r.headers.get("ETag") or entry.get("etag"),
+                           r.headers.get("Last-Modified") or entry.get("last_modified"))
+            return entry["html"]
+        if r.status_code != 200:
+            logging.warning(f"取得失敗: {url}: HTTP {r.status_code}")
+            self._count("failed")
+            return entry["html"] if entry else None
+        if "charset" not in r.headers.get("Content-Type", "").lower():
+            r.encoding = r.apparent_encoding
+        if r.history and 'type="password"' in r.text.lower():
+            # ログインページへ戻された（セッション切れ）。キャッシュしない
+            logging.warning(f"取得失敗: {url}: ログインページへリダイレクトされました")
+            self._count("failed")
+            return entry["html"] if entry else None
+        self._count("fetched")
+        metrics.count("bytes_received", len(r.content))
+        self.cache.put(url, r.text, r.headers.get("ETag"), r.headers.get("Last-Modified"))
+        return r.text
+
+    def get_many(self, urls):
+        """{url: html}。重複は1回だけ取得する"""
+        urls = list(dict.fromkeys(u for u in urls if u))
+        if not urls:
+            return {}
+        with ThreadPoolExecutor(max_workers=min(self.workers, len(urls))) as pool:
+            return dict(zip(urls, pool.map(self.get, urls)))
+
+    def follow_pages(self, html, url, max_pages, is_known, prefer=None):
+        """2ページ目以降のイベントを返す。
+
+        既読のイベント（is_known(events) が真）が出てきたページ、max_pages ページ目、
+        または「次のページ」がなくなった時点で止める。
+        """
+        events = []
+        visited = {url}
+        for page in range(2, max_pages + 1):
+            next_url = find_next_page(html, url)
+            if not next_url or next_url in visited:
+                break
+            html = self.get(next_url, max_age=0)  # 一覧は毎回（条件付きで）確認する
+            if html is None:
+                break
+            url = next_url
+            visited.add(url)
+            page_events = parse_events_generic(html, url, prefer=prefer)
+            logging.info(f"ページ {page}: {len(page_events)}件 ({url})")
+            if not page_events:
+                break
+            events.extend(page_events)
+            if is_known(page_events):
+                break
+        return events
+
+    def enrich(self, events):
+        """各イベントの詳細ページ（link）から venue / deadline / body を追加する"""
+        pages = self.get_many(e.get("link") for e in events)
+        for e in events:
+            html = pages.get(e.get("link"))
+            if html:
+                for k, v in parse_event_detail(html, e["link"]).items():
+                    e.setdefault(k, v)
+        return events
+
+    def report(self):
+        s = self.stats
+        logging.info(f"クロール: 取得 {s['fetched']} / 304 {s['not_modified']} / "
+                     f"キャッシュ {s['cached']} / 失敗 {s['failed']}")
+
+    def close(self):
+        self.session.close()
@@ -0,0 +1,108 @@
+# identity.py
+# イベントの同一性判定。表記ゆれ（全角/半角・空白・追跡用クエリ・日付の書き方）を正規化してから
+# id を作り、タイトルの MinHash で「最近見たイベントとほぼ同じ」ものを見つける
+import hashlib
+import random
+import re
+import unicodedata
+from array import array
+from functools import lru_cache
+from typing import List, Optional
+from urllib.parse import parse_qsl, urlencode, urlsplit, urlunsplit
+
+# リンクから取り除くクエリ（アクセス解析用で、同じページを指す）
+TRACKING_PARAMS = frozenset({"fbclid", "gclid", "yclid", "dclid", "msclkid", "mc_cid", "mc_eid", "_ga", "_gl"})
+TRACKING_PREFIXES = ("utm_",)
+_DEFAULT_PORTS = {"http": "80", "https": "443"}
+# 日付・リンクの正規化結果を覚えておく件数（watch モードでは毎回ほぼ同じ一覧を処理する）
+CACHE_SIZE = 10_000
+
+# NFKC 後の日付: 2025/11/07（日）10:00、2025.11.7、2025年11月7日 10時30分 など
+_DATE_RE = re.compile(r"(\d{4})\s*[./年-]\s*(\d{1,2})\s*[./月-]\s*(\d{1,2})\s*日?"
+                      r"(?:\D{0,8}?(\d{1,2})\s*[:時]\s*(\d{2}))?")
+
+# MinHash: NUM_PERM 個のハッシュを BANDS 個の帯に分け、帯が1つでも一致したものだけを比べる（LSH）
+NUM_PERM = 32
+BANDS = 8
+SHINGLE = 3   # 文字 n-gram（日本語は単語に分けにくいので文字単位）
+_PRIME = (1 << 61) - 1
+_rng = random.Random(20251107)  # 保存済みの署名と比べるので固定
+_PERMS = [(_rng.randrange(1, _PRIME), _rng.randrange(0, _PRIME)) for _ in range(NUM_PERM)]
+
+
+def normalize_text(s) -> str:
+    """NFKC（全角英数・記号を半角に）+ 空白の連続を1つにまとめて前後を削る"""
+    if not s:
+        return ""
+    if not unicodedata.is_normalized("NFKC", s):
+        s = unicodedata.normalize("NFKC", s)
+    return " ".join(s.split())
+
+
+@lru_cache(maxsize=CACHE_SIZE)
+def normalize_date(s) -> str:
+    """"2025/11/07（日）10:00" → "2025-11-07T10:00"。読めなければ normalize_text の結果"""
+    text = normalize_text(s)
+    m = _DATE_RE.search(text)
+    if not m:
+        return text
+    y, mo, d, h, mi = m.groups()
+    date = f"{int(y):04d}-{int(mo):02d}-{int(d):02d}"
+    return f"{date}T{int(h):02d}:{mi}" if h else date
+
+
+@lru_cache(maxsize=CACHE_SIZE)
+def canonical_url(url) -> str:
+    """スキーム・ホストを小文字にし、既定ポート・フラグメント・追跡用クエリを除いてクエリを並べ替える"""
+    url = normalize_text(url)
+    if not url:
+        return ""
+    parts = urlsplit(url)
+    scheme = parts.scheme.lower()
+    netloc = parts.netloc.lower()
+    host, _, port = netloc.rpartition(":")
+    if host and _DEFAULT_PORTS.get(scheme) == port:
+        netloc = host
+    query = parts.query
+    if query:
+        pairs = [(k, v) for k, v in parse_qsl(query, keep_blank_values=True)
+                 if k.lower() not in TRACKING_PARAMS and not k.lower().startswith(TRACKING_PREFIXES)]
+        query = urlencode(sorted(pairs))
+    return urlunsplit((scheme, netloc, parts.path or ("/" if netloc else ""), query, ""))
+
+
+def identity_basis(e) -> str:
+    """id の元になる文字列（正規化した タイトル|日付|リンク）"""
+    return f"{normalize_text(e.get('title'))}|{normalize_date(e.get('date'))}|{canonical_url(e.get('link'))}"
+
+
+# ---------- MinHash ----------
+def _shingles(title):
+    text = normalize_text(title).replace(" ", "").lower()
+    if len(text) <= SHINGLE:
+        return {text} if text else set()
+    return {text[i:i + SHINGLE] for i in range(len(text) - SHINGLE + 1)}
+
+
+def signature(title) -> Optional[array]:
+    """タイトルの MinHash 署名（NUM_PERM 個の32ビット値）。タイトルが空なら None"""
+    shingles = _shingles(title)
+    if not shingles:
+        return None
+    values = [int.from_bytes(hashlib.blake2b(s.encode("utf-8"), digest_size=8).digest(), "big") for s in shingles]
+    return array("I", (min((a * v + b) % _PRIME for v in values) & 0xFFFFFFFF for a, b in _PERMS))
+
+
+def band_keys(sig, date="") -> List[int]:
+    """署名の帯ごとのキー。日付が違えば別のイベント（毎月の同名セミナーなど）なのでキーに含める"""
+    rows = NUM_PERM // BANDS
+    keys = []
+    for b in range(BANDS):
+        h = hashlib.blake2b(f"{date}|{b}|".encode("utf-8") + sig[b * rows:(b + 1) * rows].tobytes(), digest_size=8)
+        keys.append(int.from_bytes(h.digest(), "big", signed=True))
+    return keys
+
+
+def similarity(a, b) -> float:
+    """2つの署名から推定したタイトルの Jaccard 類似度"""
+    return sum(x == y for x, y in zip(a, b)) / NUM_PERM
@@ -0,0 +1,140 @@
+# line_client.py
+# LINE Messaging API 用の共有HTTPクライアント（keep-alive・流量制御・リトライ）
+import email.utils
+import logging
+import random
+import threading
+import time
+import uuid
+
+import requests
+from requests.adapters import HTTPAdapter
+
+import metrics
+
+API_BASE = "https://api.line.me"
+# リトライ対象のステータス（429 と 5xx）
+RETRY_STATUS = frozenset((429, 500, 502, 503, 504))
+
+
+def is_accepted_duplicate(r):
+    """同じ X-Line-Retry-Key のリクエストが受理済み（=送信済み）を示す 409 か"""
+    return r.status_code == 409 and bool(r.headers.get("x-line-accepted-request-id"))
+
+
+def raise_for_status(r):
+    """受理済みの 409 は成功扱いにする raise_for_status"""
+    if not is_accepted_duplicate(r):
+        r.raise_for_status()
+
+
+class RateLimiter:
+    """トークンバケット。rate 件/秒で補充、最大 burst 件まで溜まる"""
+
+    def __init__(self, rate, burst=1):
+        self.rate = float(rate)
+        self.burst = max(1, int(burst))
+        self._tokens = float(self.burst)
+        self._last = time.monotonic()
+        self._lock = threading.Lock()
+
+    def acquire(self):
+        if self.rate <= 0:
+            return
+        with self._lock:
+            while True:
+                now = time.monotonic()
+                self._tokens = min(self.burst, self._tokens + (now - self._last) * self.rate)
+                self._last = now
+                if self._tokens >= 1:
+                    self._tokens -= 1
+                    return
+                time.sleep((1 - self._tokens) / self.rate)
+
+
+def _retry_after_seconds(value):
+    """Retry-After（秒数 または HTTP日付）を秒に変換する。解釈できなければ None"""
+    if not value:
+        return None
+    try:
+        return max(0.0, float(value))
+    except ValueError:
+        pass
+    try:
+        when = email.utils.parsedate_to_datetime(value)
+    except (TypeError, ValueError):
+        return None
+    return max(0.0, when.timestamp() - time.time())
+
+
+class LineClient:
+    """1つの requests.Session を使い回して LINE API を呼ぶ。
+
+    429 / 5xx / 通信エラーはジッター付き指数バックオフで再送する（Retry-After があれば従う）。
+    送信系APIには X-Line-Retry-Key を付け、再送しても二重送信にならないようにする。
+    """
+
+    def __init__(self, token, api_base=API_BASE, rate_per_sec=200.0, burst=20,
+                 max_retries=4, backoff_base=1.0, backoff_max=30.0, timeout=20):
+        self.token = token
+        self.api_base = api_base.rstrip("/")
+        self.limiter = RateLimiter(rate_per_sec, burst)
+        self.max_retries = max_retries
+        self.backoff_base = backoff_base
+        self.backoff_max = backoff_max
+        self.timeout = timeout
+        self.retries = 0  # これまでの再送回数（全リクエスト合計）
+
+        self.session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=2, pool_maxsize=8)
+        self.session.mount("https://", adapter)
+        self.session.mount("http://", adapter)
+        self.session.headers.update({
+            "Authorization": f"Bearer {token}",
+            "Content-Type": "application/json",
+        })
+
+    def post(self, path, body, retry_key=True):
+        """path に JSON を POST し、最後の応答を返す（ステータスの確認は呼び出し側で）。
+
+        再送しきっても通信エラーのままなら RequestException を送出する。
+        """
+        url = self.api_base + path
+        headers = {}
+        if retry_key:
+            # 再送しても同じキー → LINE 側で重複が排除される
+            headers["X-Line-Retry-Key"] = str(uuid.uuid4())
+
+        attempt = 0
+        while True:
+            self.limiter.acquire()
+            metrics.count("line_requests")
+            try:
+                r = self.session.post(url, json=body, headers=headers, timeout=self.timeout)
+            except (requests.ConnectionError, requests.Timeout) as e:
+                if attempt >= self.max_retries:
+                    raise
+                delay = self._backoff(attempt)
+                logging.warning(f"LINE API 通信エラー、{delay:.1f}秒後に再送します ({attempt + 1}/{self.max_retries}): {e}")
+            else:
+                if retry_key and is_accepted_duplicate(r):
+                    # 同じ Retry-Key のリクエストは受理済み（前回の再送が届いていた）
+                    logging.info(f"LINE API: 受理済みのリクエストです (request-id: {r.headers['x-line-accepted-request-id']})")
+                    return r
+                if r.status_code not in RETRY_STATUS or attempt >= self.max_retries:
+                    return r
+                delay = _retry_after_seconds(r.headers.get("Retry-After"))
+                if delay is None:
+                    delay = self._backoff(attempt)
+                logging.warning(f"LINE API {r.status_code}、{delay:.1f}秒後に再送します ({attempt + 1}/{self.max_retries})")
+            attempt += 1
+            self.retries += 1
+            metrics.count("line_retries")
+            time.sleep(delay)
+
+    def _backoff(self, attempt):
+        # full jitter: 0〜(base * 2^attempt) の一様乱数（上限 backoff_max）
+        return random.uniform(0, min(self.backoff_max, self.backoff_base * (2 ** attempt)))
+
+    def close(self):
+        self.session.close()
@@ -1,276 +1,470 @@
 # 必要なモジュールのインポート
-import os, sqlite3, hashlib, time, logging, requests, sys
-
-# ★ 追加: .env.dev を任意読み込み（あれば）
-try:
-    from dotenv import load_dotenv
-    load_dotenv(".env.dev")
-except Exception:
-    pass
-
-# ロギング設定 (先に初期化)
-logging.basicConfig(
-    level=os.getenv("LOG_LEVEL", "INFO").upper(),
-    format="%(asctime)s %(levelname)s: %(message)s"
-)
-logging.info("--- 起動 ---")
-
-# 外部モジュールからの関数インポート（イベント情報の解析とHTML取得）
-from parsers import parse_events_generic
-from scraper_login import fetch_events_html
-
-# --- 環境変数から設定値の読み込み ---
-print("--- 環境変数からの設定値読み込み開始 ---")
-# LINE Channel Access Token (メッセージ送信に必要)
-TOKEN = os.getenv("LINE_CHANNEL_ACCESS_TOKEN")
-TARGET_IDS = [s.strip() for s in os.getenv("TARGET_IDS", "").split(",") if s.strip()]
-DB_PATH = os.getenv("DB_PATH", "seen.db")
-MAX_POSTS = int(os.getenv("MAX_POSTS", "10"))
-# ★ 実行モードフラグ
-IS_DRY = os.getenv("DRY_RUN", "false").lower() == "true"
-USE_FIXTURE = bool(os.getenv("HTML_FIXTURE"))
-VALIDATE_ONLY = os.getenv("VALIDATE_ONLY", "false").lower() == "true"
+# import 時には何もしない（設定の読み込み・ログ設定は main() で行う）。
+# requests / Playwright / LINE クライアントは、それを使う経路に入ったときに読み込む
+import os, logging, random, signal, sys, threading
 
-# ---------- Bさん: 通知整形ここから ----------
-# スタイル調整パラメータ（環境変数で上書き可）
-FORMAT_STYLE   = os.getenv("FORMAT_STYLE", "list")   # "list" | "cards" | "compact"
-HEADER_TITLE   = os.getenv("HEADER_TITLE", "🎓 学舎イベント 新着")
-SEPARATOR      = os.getenv("SEPARATOR", "\n\n")      # 複数件の区切り
-BULLET         = os.getenv("BULLET", "● ")
-SHOW_HEADER    = os.getenv("SHOW_HEADER", "true").lower() == "true"
-
-
-def format_event(e: dict) -> str:
-    """1件のイベントをLINEメッセージ化"""
-    title = e.get("title") or "(件名未取得)"
-    date  = e.get("date")
-    link  = e.get("link")
-
-    if FORMAT_STYLE == "cards":
-        lines = [f""]
-        if date:
-            lines.append(f"日付: {date}")
-        if link:
-            lines.append(link)
-        return "\n".join(lines)
-
-    if FORMAT_STYLE == "compact":
-        parts = [title]
-        if date:
-            parts.append(f"({date})")
-        if link:
-            parts.append(link)
-        return " ".join(parts)
-
-    # 既定: 箇条書き
-    body = f"{BULLET}{title}"
-    if date:
-        body += f"\n  └ 日付: {date}"
-    if link:
-        body += f"\n  └ {link}"
-    return body
+import metrics
+import seen_store
+from seen_store import ensure_db, filter_new, mark_seen, load_fetch_state, save_fetch_state
+from scraper_login import Fetcher, print_settings
+from settings import Settings, load_settings
+from sources import Source, SourceWorkers, load_sources, scrape
+from changes import diff_events, event_key, notable
 
+# 実行設定。main() で環境変数から作り直す（テスト等では差し替えてよい）
+CONFIG = Settings()
 
-def render_message(events):
-    from datetime import datetime
-    today = datetime.now().strftime("%m/%d時点")
+# ---------- Bさん: 通知整形ここから ----------
+# 整形テンプレートは templates.py。CONFIG から1回だけ組み立てて使い回す
+_RENDERER = None
 
-    lines = []
-    lines.append(f"🎓 しがくイベント 新着（{today}）")
 
-    for e in events:
-        title = e.get("title", "")
-        date = e.get("date", "")
-        link = e.get("link", "")
+def _renderer():
+    """CONFIG の FORMAT_STYLE 等で組み立てた Renderer（CONFIG が差し替えられたら作り直す）"""
+    global _RENDERER
+    if _RENDERER is None or _RENDERER[0] is not CONFIG:
+        from templates import compile_renderer
+        _RENDERER = (CONFIG, compile_renderer(CONFIG))
+    return _RENDERER[1]
 
-        lines.append(f"● {title}")
-        if date:
-            lines.append(f"└ 日付: {date}")
-        if link:
-            lines.append(f"└ {link}")
-        lines.append("")  # 空行で区切り
 
-    return "\n".join(lines).strip()
-# ---------- Bさん: 通知整形ここまで ----------
+def format_event(e: dict) -> str:
+    """1件のイベントをLINEメッセージ化"""
+    return _renderer().fragment(e).text
 
 
-# --- データベース関連の関数 ---
-def ensure_db():
-    logging.info(f"データベース接続/初期化開始: {DB_PATH}")
-    conn = sqlite3.connect(DB_PATH)
-    conn.execute(
-        """CREATE TABLE IF NOT EXISTS seen(
-        id TEXT PRIMARY KEY, created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
-    )"""
-    )
-    conn.commit()
-    logging.info("データベース 'seen' テーブルの存在確認/作成完了")
-    return conn
+def render_message(events):
+    return _renderer().render(events)
 
 
-def uid_from_event(e):
-    basis = f"{e.get('title','')}|{e.get('date','')}|{e.get('link','')}"
-    return hashlib.sha256(basis.encode("utf-8")).hexdigest()
+# LINE のテキストメッセージは1通5000文字まで（余裕を見て4900）、1リクエスト5通まで
+LINE_TEXT_MAX = 4900
+LINE_MESSAGES_PER_REQUEST = 5
+# ページの形式が変わり、推定したセレクタで初めて抽出したときに通知の先頭に出す注意書き
+INFERRED_NOTE = "⚠ 一覧ページの形式が変わったため、推定した読み取り方で抽出しました（件名・日付が崩れている場合があります）"
 
 
-def filter_new(conn, events):
-    print(f"新着イベントのフィルタリング開始: 全{len(events)}件")
-    cur = conn.cursor()
-    out = []
-    for e in events:
-        uid = uid_from_event(e)
-        if cur.execute("SELECT 1 FROM seen WHERE id=?", (uid,)).fetchone():
-            continue
-        e["_uid"] = uid
-        out.append(e)
-    print(f"新着イベントのフィルタリング完了: {len(out)}件抽出されました")
-    return out
+def render_chunks(events, limit=LINE_TEXT_MAX, note=""):
+    """render_message と同じ内容を、イベントの切れ目で limit 文字以下の複数メッセージに分ける。
+    ヘッダー（と note の注意書き）は最初のメッセージにだけ付ける。"""
+    return _renderer().chunks(events, limit, note=note)
 
 
-def mark_seen(conn, events):
-    print(f"既読としてマークするイベント数: {len(events)}件")
-    cur = conn.cursor()
-    for e in events:
-        cur.execute("INSERT OR IGNORE INTO seen(id) VALUES(?)", (e["_uid"],))
-    conn.commit()
-    print("既読イベントのデータベース登録完了 (コミット済み)")
+def message_batches(texts):
+    """テキストのリストを、1リクエストあたり LINE_MESSAGES_PER_REQUEST 通の messages 配列に分ける"""
+    if isinstance(texts, str):
+        texts = [texts]
+    msgs = [{"type": "text", "text": t} for t in texts]
+    return [msgs[i:i + LINE_MESSAGES_PER_REQUEST] for i in range(0, len(msgs), LINE_MESSAGES_PER_REQUEST)]
+# ---------- Bさん: 通知整形ここまで ----------
 
 
 # --- LINE通知関連の関数 ---
-def push_message(to_id, text):
-    """特定の1ユーザーに push する"""
+_LINE_CLIENT = None
+
+
+def _line():
+    """LINE API クライアント（keep-alive セッションをプロセス内で共有）"""
+    global _LINE_CLIENT
+    if _LINE_CLIENT is None:
+        from line_client import LineClient
+        if CONFIG.line_api_base != Settings().line_api_base:
+            logging.info(f"LINE API の送信先: {CONFIG.line_api_base}")
+        _LINE_CLIENT = LineClient(
+            CONFIG.token,
+            api_base=CONFIG.line_api_base,
+            rate_per_sec=CONFIG.line_rate_per_sec,
+            burst=CONFIG.line_rate_burst,
+            max_retries=CONFIG.line_max_retries,
+        )
+    return _LINE_CLIENT
+
+
+def _raise_for_status(r):
+    from line_client import raise_for_status
+    raise_for_status(r)
+
+
+def _send_error():
+    """送信失敗として扱う例外（requests は実際に送信したときにだけ読み込まれている）"""
+    from requests import RequestException
+    return RequestException
+
+
+def _preview(tag, heading, texts):
+    """DRY_RUN 用: 送信せずにログと GITHUB_STEP_SUMMARY へ出す"""
+    if isinstance(texts, str):
+        texts = [texts]
+    text = "\n--- (次のメッセージ) ---\n".join(texts)
+    logging.info(f"{tag}\n---\n{text}\n---")
+    try:
+        with open(os.getenv("GITHUB_STEP_SUMMARY", ""), "a", encoding="utf-8") as f:
+            f.write(f"## {heading}\n\n")
+            for t in texts:
+                f.write("```\n" + t + "\n```\n")
+    except Exception:
+        pass
+
+
+def push_message(to_id, texts):
+    """特定の1ユーザーに push する（texts は文字列か render_chunks の結果）"""
     # ★ 追加: DRY_RUN のときは送信せずプレビュー出力
-    if IS_DRY:
-        logging.info(f"[DRY_RUN] to={to_id}\n---\n{text}\n---")
-        try:
-            with open(os.getenv("GITHUB_STEP_SUMMARY", ""), "a", encoding="utf-8") as f:
-                f.write("## 通知メッセージ プレビュー\n\n")
-                f.write("```\n" + text + "\n```\n")
-        except Exception:
-            pass
+    if CONFIG.dry_run:
+        _preview(f"[DRY_RUN] to={to_id}", "通知メッセージ プレビュー", texts)
         return
 
-    # ★ 検証モード（validate API）
-    if VALIDATE_ONLY:
-        url = "https://api.line.me/v2/bot/message/validate/push"
-        headers = {"Authorization": f"Bearer {TOKEN}", "Content-Type": "application/json"}
-        body = {
-            "to": (to_id or "U_dummy"),
-            "messages": [{"type": "text", "text": text[:4900]}],
-        }
-        r = requests.post(url, headers=headers, json=body, timeout=20)
-        logging.info(f"LINE validate API応答ステータス: {r.status_code}")
-        logging.info(f"LINE validate API応答ボディ: {r.text}")
-        r.raise_for_status()
-        return
+    for n, messages in enumerate(message_batches(texts)):
+        # ★ 検証モード（validate API）
+        if CONFIG.validate_only:
+            body = {"to": (to_id or "U_dummy"), "messages": messages}
+            r = _line().post("/v2/bot/message/validate/push", body, retry_key=False)
+            logging.info(f"LINE validate API応答ステータス: {r.status_code}")
+            logging.info(f"LINE validate API応答ボディ: {r.text}")
+            _raise_for_status(r)
+            continue
 
-    # ★ 本番 push
-    url = "https://api.line.me/v2/bot/message/push"
-    headers = {"Authorization": f"Bearer {TOKEN}", "Content-Type": "application/json"}
-    body = {"to": to_id, "messages": [{"type": "text", "text": text[:4900]}]}
-    r = requests.post(url, headers=headers, json=body, timeout=20)
-    logging.info(f"LINE API応答ステータス: {r.status_code}")
-    logging.info(f"LINE API応答ボディ: {r.text}")
-    r.raise_for_status()
-    print(f"LINEメッセージ送信成功 (To: {to_id})")
+        # ★ 本番 push
+        body = {"to": to_id, "messages": messages}
+        try:
+            r = _line().post("/v2/bot/message/push", body)
+            logging.info(f"LINE API応答ステータス: {r.status_code}")
+            logging.info(f"LINE API応答ボディ: {r.text}")
+            _raise_for_status(r)
+        except _send_error() as e:
+            e.batches_sent = n
+            raise
+    if not CONFIG.validate_only:
+        print(f"LINEメッセージ送信成功 (To: {to_id})")
 
 
 # ★ 追加: broadcast（一斉送信）用
-def broadcast_message(text: str):
+def broadcast_message(texts):
     """友だち全員に一斉送信する."""
-    if IS_DRY:
-        logging.info(f"[DRY_RUN:broadcast]\n---\n{text}\n---")
-        try:
-            with open(os.getenv("GITHUB_STEP_SUMMARY", ""), "a", encoding="utf-8") as f:
-                f.write("## 通知メッセージ プレビュー（broadcast）\n\n")
-                f.write("```\n" + text + "\n```\n")
-        except Exception:
-            pass
+    if CONFIG.dry_run:
+        _preview("[DRY_RUN:broadcast]", "通知メッセージ プレビュー（broadcast）", texts)
         return
 
-    if VALIDATE_ONLY:
-        # broadcast の検証API
-        url = "https://api.line.me/v2/bot/message/validate/broadcast"
-        headers = {"Authorization": f"Bearer {TOKEN}", "Content-Type": "application/json"}
-        body = {"messages": [{"type": "text", "text": text[:4900]}]}
-        r = requests.post(url, headers=headers, json=body, timeout=20)
-        logging.info(f"LINE validate(broadcast) ステータス: {r.status_code}")
-        logging.info(f"LINE validate(broadcast) ボディ: {r.text}")
-        r.raise_for_status()
+    for messages in message_batches(texts):
+        if CONFIG.validate_only:
+            # broadcast の検証API
+            r = _line().post("/v2/bot/message/validate/broadcast", {"messages": messages}, retry_key=False)
+            logging.info(f"LINE validate(broadcast) ステータス: {r.status_code}")
+            logging.info(f"LINE validate(broadcast) ボディ: {r.text}")
+            _raise_for_status(r)
+            continue
+
+        # 本番 broadcast
+        r = _line().post("/v2/bot/message/broadcast", {"messages": messages})
+        logging.info(f"LINE broadcast ステータス: {r.status_code}")
+        logging.info(f"LINE broadcast ボディ: {r.text}")
+        _raise_for_status(r)
+    if not CONFIG.validate_only:
+        print("LINEメッセージ broadcast 送信成功（友だち全員）")
+
+
+# ★ 追加: multicast（最大500人へ同じ内容を1リクエストで）
+MULTICAST_MAX = 500
+
+
+def multicast_message(to_ids, texts):
+    """複数ユーザー（最大 MULTICAST_MAX 人）に同じ内容を送る"""
+    if CONFIG.dry_run:
+        _preview(f"[DRY_RUN:multicast] to={len(to_ids)}人",
+                 f"通知メッセージ プレビュー（multicast {len(to_ids)}人）", texts)
         return
 
-    # 本番 broadcast
-    url = "https://api.line.me/v2/bot/message/broadcast"
-    headers = {"Authorization": f"Bearer {TOKEN}", "Content-Type": "application/json"}
-    body = {"messages": [{"type": "text", "text": text[:4900]}]}
-    r = requests.post(url, headers=headers, json=body, timeout=20)
-    logging.info(f"LINE broadcast ステータス: {r.status_code}")
-    logging.info(f"LINE broadcast ボディ: {r.text}")
-    r.raise_for_status()
-    print("LINEメッセージ broadcast 送信成功（友だち全員）")
+    for n, messages in enumerate(message_batches(texts)):
+        if CONFIG.validate_only:
+            r = _line().post("/v2/bot/message/validate/multicast", {"messages": messages}, retry_key=False)
+            logging.info(f"LINE validate(multicast) ステータス: {r.status_code}")
+            logging.info(f"LINE validate(multicast) ボディ: {r.text}")
+            _raise_for_status(r)
+            continue
+
+        body = {"to": list(to_ids), "messages": messages}
+        try:
+            r = _line().post("/v2/bot/message/multicast", body)
+            logging.info(f"LINE multicast ステータス: {r.status_code} ({len(to_ids)}人)")
+            logging.info(f"LINE multicast ボディ: {r.text}")
+            _raise_for_status(r)
+        except _send_error() as e:
+            e.batches_sent = n  # 送信済みのリクエスト数（再送はこの続きから）
+            raise
+    if not CONFIG.validate_only:
+        print(f"LINEメッセージ multicast 送信成功 ({len(to_ids)}人)")
+
+
+def push_each(target_ids, text):
+    """1人ずつ push する。(成功数, 失敗数) を返す"""
+    ok = ng = 0
+    for i, tid in enumerate(target_ids, 1):
+        try:
+            push_message(tid, text)
+            ok += 1
+            logging.info(f"送信/検証/プレビュー 完了 {i}/{len(target_ids)} (ID: {tid})")
+        except _send_error() as e:
+            ng += 1
+            sent = getattr(e, "batches_sent", 0)
+            partial = f"（{sent}/{len(message_batches(text))}リクエストは送信済み）" if sent else ""
+            logging.error(f"LINEメッセージ送信失敗 {i}/{len(target_ids)} (ID: {tid}){partial}: {e}")
+    return ok, ng
+
+
+def multicast_each(target_ids, text):
+    """MULTICAST_MAX 人ずつ multicast し、失敗したバッチだけ個別 push で送り直す。
+    (成功数, 失敗数) を返す"""
+    texts = [text] if isinstance(text, str) else list(text)
+    ok = ng = 0
+    batches = [target_ids[i:i + MULTICAST_MAX] for i in range(0, len(target_ids), MULTICAST_MAX)]
+    for n, batch in enumerate(batches, 1):
+        try:
+            multicast_message(batch, texts)
+            ok += len(batch)
+            logging.info(f"multicast バッチ {n}/{len(batches)} 完了 ({len(batch)}人)")
+        except _send_error() as e:
+            # 1回の通知が複数リクエストに分かれるとき、送れたリクエストの分は送り直さない
+            # （送り直すと新しいリトライキーで受け付けられ、同じメッセージが2回届く）
+            sent = getattr(e, "batches_sent", 0)
+            rest = texts[sent * LINE_MESSAGES_PER_REQUEST:]
+            logging.error(f"multicast バッチ {n}/{len(batches)} 失敗 ({len(batch)}人, "
+                          f"リクエスト {sent + 1}/{len(message_batches(texts))}件目): {e} "
+                          f"→ 残りの {len(rest)}通を個別 push で再送します")
+            b_ok, b_ng = push_each(batch, rest)
+            ok += b_ok
+            ng += b_ng
+    return ok, ng
 
 
 # ★ 追加: 実行モードに応じた必須ENVチェック
-def _require_runtime_env():
-    if IS_DRY and USE_FIXTURE:
+def _require_runtime_env(sources=None):
+    if CONFIG.dry_run and (all(s.site.html_fixture for s in sources) if sources else CONFIG.html_fixture):
         # デバッグ（本文整形/パース確認）では何も要らない
         logging.info("デバッグ: DRY_RUN + HTML_FIXTURE → ENVチェックをスキップ")
         return
 
-    if VALIDATE_ONLY:
-        if not TOKEN:
+    if CONFIG.validate_only:
+        if not CONFIG.token:
             raise SystemExit("LINE_CHANNEL_ACCESS_TOKEN が未設定（VALIDATE_ONLY）")
         logging.info("VALIDATE_ONLY: TOKENのみ必須、TARGET_IDSはダミー可")
         return
 
+    if sources:
+        # 宛先は取得先ごと（未指定なら TARGET_IDS / USE_BROADCAST）
+        if not CONFIG.token:
+            raise SystemExit("環境変数 LINE_CHANNEL_ACCESS_TOKEN が未設定です。")
+        for s in sources:
+            broadcast, target_ids = _recipients(s)
+            if not (broadcast or target_ids):
+                raise SystemExit(f"取得先 '{s.name}' の宛先（targets / TARGET_IDS）が未設定です。")
+        logging.info(f"本番: 設定ファイルの取得先 {len(sources)}件")
+        return
+
     # 本番送信
-    if USE_BROADCAST:
-        if not TOKEN:
+    if CONFIG.use_broadcast:
+        if not CONFIG.token:
             raise SystemExit("環境変数 LINE_CHANNEL_ACCESS_TOKEN が未設定です。")
         logging.info("本番: broadcastモード（友だち全員）")
     else:
-        if not (TOKEN and TARGET_IDS):
+        if not (CONFIG.token and CONFIG.target_ids):
             raise SystemExit("環境変数 LINE_CHANNEL_ACCESS_TOKEN / TARGET_IDS が未設定です。")
         logging.info("本番: pushモード（TARGET_IDS宛て）")
 
 
-# ★ B専用デバッグ関連のフラグ
-USE_BROADCAST = os.getenv("USE_BROADCAST", "true").lower() == "true"  # デフォルトで broadcast
-USE_B_SAMPLE = os.getenv("B_FORMAT_SAMPLE", "false").lower() == "true"    # サンプルで整形/送信する
-SEND_B_SAMPLE = os.getenv("B_SEND_SAMPLE", "false").lower() == "true"     # 実際に送るか？（DRY_RUNに従う）
-
+# ★ B専用デバッグ: B_FORMAT_SAMPLE=true で、このサンプルを整形プレビューだけして終了する
 B_SAMPLE_EVENTS = [
     {"title": "帯試験申込開始", "date": "2025/11/07（日）10:00", "link": "https://example.com/123"},
     {"title": "しがくセミナー（東京）", "date": "2025/11/10（月）19:30", "link": "https://example.com/124"},
     {"title": "冬期講習受付スタート", "date": "2025/11/20（水）", "link": "https://example.com/125"},
 ]
 
-if USE_B_SAMPLE and not SEND_B_SAMPLE:
-    # 整形プレビューだけ（従来と同じ）
+# --- メイン処理 ---
+def _configure():
+    """.env.dev（あれば）とロギングの設定を行い、環境変数から CONFIG を作る"""
+    global CONFIG
+    # ★ 追加: .env.dev を任意読み込み（あれば）
+    try:
+        from dotenv import load_dotenv
+        load_dotenv(".env.dev")
+    except Exception:
+        pass
+
+    # ロギング設定
+    logging.basicConfig(
+        level=os.getenv("LOG_LEVEL", "INFO").upper(),
+        format="%(asctime)s %(levelname)s: %(message)s"
+    )
+    logging.info("--- 起動 ---")
+    CONFIG = load_settings()
+    _renderer()  # FORMAT_STYLE 等をここで組み立てる（設定の誤りは起動時に分かる）
+
+
+def preview_b_sample():
+    """整形プレビューだけ（従来と同じ）"""
     logging.info("=== Bデバッグモード: 仮イベント（プレビューのみ・送信しない） ===")
     message = render_message(B_SAMPLE_EVENTS)
     print("\n===== 整形プレビュー =====\n")
     print(message)
     print("\n===== ↑この内容がLINE本文になります（DRY_RUN無関係）=====\n")
-    raise SystemExit(0)
 
 
-# --- メイン処理 ---
 def main():
-    print("=== スクリプト処理開始 ===")
+    _configure()
+    if CONFIG.b_format_sample and not CONFIG.b_send_sample:
+        preview_b_sample()
+        return
 
-    # 実行モードに応じたENVチェック
-    _require_runtime_env()
+    print("=== スクリプト処理開始 ===")
+    print_settings(CONFIG.site, CONFIG.fetch)
 
-    # 1. イベント情報を含むHTMLを取得
-    print("1. HTMLコンテンツの取得開始...")
-    html, final_url = fetch_events_html()
-    print(f"1. HTMLコンテンツの取得完了。最終URL: {final_url}")
+    sources = load_sources(CONFIG.sources_file, CONFIG.site) if CONFIG.sources_file else None
+    if sources:
+        logging.info(f"設定ファイル {CONFIG.sources_file}: 取得先 {', '.join(s.name for s in sources)}")
 
-    # 2. 取得したHTMLからイベント情報を解析し、イベントリストを取得
-    print("2. 取得したHTMLからのイベント情報解析開始...")
-    events = parse_events_generic(html, final_url)
-    print(f"2. イベント情報解析完了。見つかったイベント数: {len(events)}件")
+    # 実行モードに応じたENVチェック
+    _require_runtime_env(sources)
+
+    # 0. データベースへの接続を確立（前回の取得状態を読むため先に開く）
+    print("0. データベース接続確立処理へ...")
+    conn = ensure_db(CONFIG.db_path)
+    if sources:
+        # 取得先ごとの Fetcher（常駐プロセス）を watch の回をまたいで使い回す
+        fetcher = SourceWorkers(sources, CONFIG.source_workers, CONFIG.fetch)
+        check = _measured(lambda: run_sources(conn, fetcher))
+    else:
+        fetcher = Fetcher(CONFIG.site, CONFIG.fetch)
+        check = _measured(lambda: run_once(conn, fetcher))
+    try:
+        if CONFIG.watch:
+            watch(check)
+        else:
+            check()
+    finally:
+        fetcher.close()
+        for crawler in _CRAWLERS.values():
+            crawler.close()
+        if _LINE_CLIENT is not None:
+            _LINE_CLIENT.close()
+        seen_store.close(conn)
+
+
+def _measured(check):
+    """check 1回ごとに計測をやり直し、終わったら実行レポート（RUN_REPORT / GITHUB_STEP_SUMMARY）を出す"""
+    def run():
+        metrics.reset()
+        ok = False
+        try:
+            check()
+            ok = True
+        finally:
+            metrics.emit(CONFIG.run_report, ok=ok, dry_run=CONFIG.dry_run)
+    return run
+
+
+def watch(check):
+    """SIGTERM / SIGINT を受けるまで check（run_once / run_sources）を繰り返す。
+    ブラウザ・HTTPセッション・DB接続・LINEクライアントは回をまたいで使い回す。"""
+    stop = threading.Event()
+
+    def _on_signal(signum, frame):
+        logging.info(f"シグナル {signum} を受信。現在のチェックが終わり次第終了します。")
+        stop.set()
+
+    signal.signal(signal.SIGTERM, _on_signal)
+    signal.signal(signal.SIGINT, _on_signal)
+    logging.info(f"watch モード開始: 間隔 {CONFIG.watch_interval_sec:g}秒 (+0〜{CONFIG.watch_jitter_sec:g}秒)")
+
+    n = 0
+    while not stop.is_set():
+        n += 1
+        logging.info(f"--- チェック #{n} ---")
+        try:
+            check()
+        except Exception:
+            # 1回の失敗で常駐を止めない（次回は新しいコンテキストで取得し直す）
+            logging.exception(f"チェック #{n} でエラーが発生しました")
+        delay = CONFIG.watch_interval_sec + random.uniform(0, CONFIG.watch_jitter_sec)
+        logging.info(f"次のチェックまで {delay:.0f}秒 待機します")
+        stop.wait(delay)
+    logging.info("watch モード終了")
+
+
+def _use_state(source):
+    # フィクスチャ（デバッグ）実行や FORCE_FETCH では前回状態を使わない
+    return not (source.site.html_fixture or CONFIG.force_fetch)
+
+
+def _recipients(source):
+    """(broadcast するか, push / multicast の宛先)"""
+    broadcast = CONFIG.use_broadcast if source.broadcast is None else source.broadcast
+    return broadcast, list(source.targets) or CONFIG.target_ids
+
+
+# 取得先の name -> Crawler（cookie は取得先ごと。キャッシュのディレクトリは共通）
+_CRAWLERS = {}
+
+
+def _crawler(source, fetched):
+    """ページ送り・詳細取得を行うなら Crawler（フィクスチャ実行では None）"""
+    if source.site.html_fixture or not (CONFIG.crawl_max_pages > 1 or CONFIG.crawl_details):
+        return None
+    if source.name not in _CRAWLERS:
+        from crawler import Crawler
+        _CRAWLERS[source.name] = Crawler(CONFIG.crawl_cache_dir, CONFIG.crawl_workers, CONFIG.crawl_cache_ttl_sec,
+                                         user_agent=CONFIG.fetch.user_agent)
+    crawler = _CRAWLERS[source.name]
+    crawler.set_cookies(fetched.cookies)
+    return crawler
+
+
+def run_once(conn, fetcher):
+    """1回分の取得→解析→新着抽出→通知→既読マーク"""
+    source = Source("", CONFIG.site)  # 環境変数だけで動かす従来の1ページ構成
+    state = load_fetch_state(conn, source.site.events_url or "", source.name) if _use_state(source) else None
+    scraped = scrape(source, state or {}, CONFIG.fetch, fetcher, seen_store.load_recipes(conn))
+    notify(conn, source, scraped, state)
+
+
+def run_sources(conn, workers):
+    """設定ファイルの全取得先（workers は SourceWorkers）を並列に取得・解析し、終わった順に通知する。
+    DB と LINE 送信はこのプロセスだけで扱う（既読は取得先ごと）"""
+    sources = workers.sources
+    states = {s.name: load_fetch_state(conn, s.site.events_url, s.name) for s in sources if _use_state(s)}
+    failed = []
+    recipes = seen_store.load_recipes(conn)
+    for source, scraped in workers.scrape_all(states, recipes):
+        logging.info(f"=== 取得先: {source.name} ===")
+        if isinstance(scraped, Exception):
+            logging.error(f"取得先 '{source.name}' の取得に失敗しました: {scraped!r}")
+            failed.append(source.name)
+            continue
+        try:
+            notify(conn, source, scraped, states.get(source.name))
+        except Exception:
+            logging.exception(f"取得先 '{source.name}' の通知処理でエラーが発生しました")
+            failed.append(source.name)
+    if failed:
+        logging.error(f"失敗した取得先: {', '.join(failed)}")
+        if len(failed) == len(sources):
+            raise RuntimeError("すべての取得先で失敗しました")
+
+
+def notify(conn, source, scraped, state):
+    """scrape の結果から新着を抽出して通知し、既読マークと取得状態の保存を行う。
+    state は前回の取得状態（前回状態を使わない実行では None）"""
+    fetched, digest, events = scraped.fetched, scraped.digest, scraped.events
+    state_url = source.site.events_url or ""
+    use_state = state is not None
+    if scraped.fingerprint and scraped.recipe:
+        # 次回同じ構造のページは、このレシピだけで解析する
+        seen_store.save_recipe(conn, scraped.fingerprint, scraped.recipe)
+
+    if events is None:
+        # 変更なし（304 / 一覧のハッシュが前回と同一）
+        if digest is not None and use_state:
+            if (fetched.etag, fetched.last_modified) != (state.get("etag"), state.get("last_modified")):
+                save_fetch_state(conn, state_url, fetched.etag, fetched.last_modified, digest, source.name)
+        print("=== スクリプト処理終了 (変更なし) ===")
+        return
 
     # イベントが一つも見つからなかった場合の処理
     if not events:
@@ -278,15 +472,73 @@ def main():
         print("=== スクリプト処理終了 (警告あり) ===")
         return
 
-    # 3. データベースへの接続を確立
-    print("3. データベース接続確立処理へ...")
-    conn = ensure_db()
+    note = ""
+    if scraped.inferred:
+        # 推定したセレクタの初回は件名・日付の取り違えがありうるが、本当の新着を落とさないよう
+        # 送ったうえで、通知の先頭にその旨を出す（次回からは同じレシピで解析する）
+        note = INFERRED_NOTE
+        logging.warning("推定したセレクタで初めて抽出したイベントを、注意書き付きで通知します。"
+                        "parsers.py に形式を追加してください")
+
+    # 3. ページ送り（1ページ目に既読がなければ、既読が出てくるまで次のページへ）
+    crawler = _crawler(source, fetched)
+    if crawler and CONFIG.crawl_max_pages > 1:
+        def is_known(evs):
+            return bool(seen_store.seen_ids(conn, map(seen_store.uid_from_event, evs), source.name))
+
+        if not is_known(events):
+            print(f"3. 次のページの取得開始（最大 {CONFIG.crawl_max_pages} ページ）...")
+            with metrics.span("crawl_pages"):
+                more = crawler.follow_pages(fetched.html, fetched.final_url, CONFIG.crawl_max_pages, is_known,
+                                            prefer=source.strategy)
+            metrics.count("events_parsed", len(more))
+            # ページ送りの間に一覧がずれて同じイベントが2回出ることがある
+            events = list({seen_store.uid_from_event(e): e for e in events + more}.values())
+            print(f"3. ページ送り完了。イベント数: {len(events)}件")
 
     # 4. 取得したイベントリストから、データベースに未登録の「新着」イベントを抽出
     print("4. 新着イベントのフィルタリング処理へ...")
-    new_events = filter_new(conn, events)
-
-    if not new_events:
+    with metrics.span("dedup"):
+        new_events = filter_new(conn, events, source.name)
+    metrics.count("events_new", len(new_events))
+    if CONFIG.near_dup_threshold > 0 and new_events:
+        # 表記だけ変わった既読イベント（タイトルの誤字修正など）は送らない
+        n = len(new_events)
+        with metrics.span("near_dup"):
+            new_events = seen_store.skip_near_duplicates(conn, new_events, source.name,
+                                                         CONFIG.near_dup_threshold, CONFIG.near_dup_days)
+        metrics.count("events_near_dup", n - len(new_events))
+
+    # 前回の一覧との差分（変更・開催前の削除）。日付が変わったイベントは id も変わるので、
+    # 新着ではなく変更として知らせる
+    diff = changes = None
+    if CONFIG.notify_changes:
+        with metrics.span("diff"):
+            before = seen_store.load_snapshot(conn, source.name)
+            diff = diff_events(before, events)
+            changes = notable(diff, len(before))
+        changed = {event_key(c.event) for c in diff.changed}
+        moved = [e for e in new_events if event_key(e) in changed]
+        if moved:
+            mark_seen(conn, moved, source.name)
+            new_events = [e for e in new_events if event_key(e) not in changed]
+        metrics.count("events_changed", len(changes.changed))
+        metrics.count("events_removed", len(changes.removed))
+        if changes.changed or changes.removed:
+            logging.info(f"前回の一覧からの変更: {len(changes.changed)}件 / 中止・掲載終了: {len(changes.removed)}件")
+        else:
+            changes = None
+
+    # 保持ポリシーに従って古い既読idを削除（いま一覧にあるイベントは残す）
+    if seen_store.prune(conn, CONFIG.seen_max_age_days, CONFIG.seen_keep_last,
+                        keep=[e["_uid"] for e in events], source=source.name):
+        seen_store.compact(conn)
+
+    if not (new_events or changes):
+        if diff:
+            seen_store.save_snapshot_diff(conn, source.name, diff)
+        if use_state:
+            save_fetch_state(conn, state_url, fetched.etag, fetched.last_modified, digest, source.name)
         print("新着イベントなし。通知スキップ。")
         print("=== スクリプト処理終了 (新着なし) ===")
         return
@@ -294,41 +546,64 @@ def main():
 
     # 5. 件数制限
     original_new_count = len(new_events)
-    new_events = new_events[:MAX_POSTS]
-    logging.info(f"5. 通知イベント数を {MAX_POSTS} 件に制限。実際に通知する件数: {len(new_events)}件")
-
-    # 6. 整形
+    if CONFIG.max_posts > 0:
+        new_events = new_events[:CONFIG.max_posts]
+        logging.info(f"5. 通知イベント数を {CONFIG.max_posts} 件に制限。実際に通知する件数: {len(new_events)}件")
+
+    # 詳細ページから会場・締切・本文を補う（新着の分だけ・同時実行数の上限とキャッシュあり）
+    if crawler and CONFIG.crawl_details:
+        logging.info(f"5. 新着 {len(new_events)}件の詳細ページを取得します")
+        with metrics.span("crawl_details"):
+            crawler.enrich(new_events)
+    if crawler:
+        crawler.report()
+
+    # 6. 整形（長い場合はイベントの切れ目で複数メッセージに分割。切り捨てはしない）
     logging.info("6. LINEメッセージへの整形開始...")
-    message = render_message(new_events)
-    logging.info(f"6. メッセージ整形完了。メッセージ全体の文字数: {len(message)}")
+    with metrics.span("render"):
+        message = render_chunks(changes._replace(added=new_events) if changes else new_events, note=note)
+    logging.info(f"6. メッセージ整形完了。文字数: {sum(map(len, message))} / "
+                 f"メッセージ数: {len(message)} / リクエスト数: {len(message_batches(message))}")
 
     # 7. 送信（DRYならプレビュー）
-    if USE_BROADCAST:
-        logging.info("7. LINEメッセージ送信/プレビュー開始（broadcast＝友だち全員）")
-        try:
-            broadcast_message(message)
-            logging.info("broadcast 送信/検証/プレビュー 完了")
-        except requests.exceptions.HTTPError as e:
-            logging.error(f"LINE broadcast 送信失敗: {e}")
-    else:
-        logging.info(f"7. LINEメッセージ送信/プレビュー開始 (対象ID数: {len(TARGET_IDS) or 1})")
-        target_ids = TARGET_IDS or ["U_dummy"]  # DRY/VALIDATE_ONLY 用のダミー
-        for i, tid in enumerate(target_ids, 1):
-            try:
-                push_message(tid, message)
-                logging.info(f"送信/検証/プレビュー 完了 {i}/{len(target_ids)} (ID: {tid})")
-            except requests.exceptions.HTTPError as e:
-                logging.error(f"LINEメッセージ送信失敗 {i}/{len(target_ids)} (ID: {tid}): {e}")
-            time.sleep(1.0)  # API保護
+    with metrics.span("send"):
+        deliver(message, *_recipients(source))
+    metrics.count("events_sent", len(new_events))
 
     # 8. 既読マーク
     logging.info("8. 通知済みイベントの既読マーク処理へ...")
-    mark_seen(conn, new_events)
+    mark_seen(conn, new_events, source.name)
+    if CONFIG.near_dup_threshold > 0:
+        seen_store.index_titles(conn, new_events, source.name)
+    if diff:
+        seen_store.save_snapshot_diff(conn, source.name, diff)
+    # MAX_POSTS で送り残しがある場合は、次回も一覧を処理するよう状態を更新しない
+    if use_state and len(new_events) == original_new_count:
+        save_fetch_state(conn, state_url, fetched.etag, fetched.last_modified, digest, source.name)
 
     # 9. まとめ
     logging.info(f"9. 処理結果: 新規イベント {original_new_count}件中、{len(new_events)}件を送信/既読マーク。")
     logging.info("=== スクリプト処理正常終了 ===")
 
 
+def deliver(message, broadcast, target_ids):
+    """broadcast か、target_ids への multicast / push で送る（DRYならプレビュー）"""
+    if broadcast:
+        logging.info("7. LINEメッセージ送信/プレビュー開始（broadcast＝友だち全員）")
+        try:
+            broadcast_message(message)
+            logging.info("broadcast 送信/検証/プレビュー 完了")
+        except _send_error() as e:
+            logging.error(f"LINE broadcast 送信失敗: {e}")
+    else:
+        logging.info(f"7. LINEメッセージ送信/プレビュー開始 (対象ID数: {len(target_ids) or 1})")
+        target_ids = target_ids or ["U_dummy"]  # DRY/VALIDATE_ONLY 用のダミー
+        if CONFIG.use_multicast and len(target_ids) > 1:
+            ok, ng = multicast_each(target_ids, message)
+        else:
+            ok, ng = push_each(target_ids, message)
+        logging.info(f"7. 送信結果: 成功 {ok}人 / 失敗 {ng}人")
+
+
 if __name__ == "__main__":
     main()
@@ -0,0 +1,121 @@
+# metrics.py
+# 処理段階ごとの所要時間（span）と件数（counter）を記録し、実行レポートにする
+import json
+import logging
+import os
+import sys
+import threading
+import time
+from contextlib import contextmanager
+
+try:
+    import resource
+except ImportError:  # Windows
+    resource = None
+
+_lock = threading.Lock()
+_spans = {}     # name -> {"count", "seconds", "max_seconds", "peak_rss_kb"}
+_counters = {}  # name -> int
+_started = time.time()
+
+
+def peak_rss_kb():
+    """このプロセスの最大常駐メモリ（KB）。取れなければ None"""
+    if resource is None:
+        return None
+    rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return rss // 1024 if sys.platform == "darwin" else rss  # macOS はバイト単位
+
+
+@contextmanager
+def span(name):
+    """with span("parse"): ... の所要時間を name ごとに合計する（同じ name は回数も数える）"""
+    t = time.perf_counter()
+    try:
+        yield
+    finally:
+        _add_span(name, 1, time.perf_counter() - t, peak_rss_kb())
+
+
+def _add_span(name, count, seconds, rss, max_seconds=None):
+    with _lock:
+        s = _spans.setdefault(name, {"count": 0, "seconds": 0.0, "max_seconds": 0.0, "peak_rss_kb": None})
+        s["count"] += count
+        s["seconds"] += seconds
+        s["max_seconds"] = max(s["max_seconds"], seconds if max_seconds is None else max_seconds)
+        if rss is not None:
+            s["peak_rss_kb"] = max(s["peak_rss_kb"] or 0, rss)
+
+
+def count(name, n=1):
+    with _lock:
+        _counters[name] = _counters.get(name, 0) + n
+
+
+def reset():
+    global _started
+    with _lock:
+        _spans.clear()
+        _counters.clear()
+        _started = time.time()
+
+
+def snapshot():
+    """いまの記録（別プロセスから merge で取り込める形）"""
+    with _lock:
+        return {"spans": {k: dict(v) for k, v in _spans.items()}, "counters": dict(_counters)}
+
+
+def merge(snap):
+    """snapshot() の結果（ワーカープロセスの分など）を足し込む"""
+    for name, s in snap.get("spans", {}).items():
+        _add_span(name, s["count"], s["seconds"], s["peak_rss_kb"], s["max_seconds"])
+    for name, n in snap.get("counters", {}).items():
+        count(name, n)
+
+
+def report(**extra):
+    snap = snapshot()
+    return {
+        "started_at": time.strftime("%Y-%m-%dT%H:%M:%S%z", time.localtime(_started)),
+        "wall_seconds": round(time.time() - _started, 3),
+        "peak_rss_kb": peak_rss_kb(),
+        "spans": {k: {**v, "seconds": round(v["seconds"], 4), "max_seconds": round(v["max_seconds"], 4)}
+                  for k, v in snap["spans"].items()},
+        "counters": snap["counters"],
+        **extra,
+    }
+
+
+def _summary_markdown(rep):
+    lines = ["## 実行レポート", "",
+             f"合計 {rep['wall_seconds']:.2f}秒 / 最大メモリ {rep['peak_rss_kb'] or '-'} KB", "",
+             "| 段階 | 回数 | 合計(秒) | 最長(秒) | 最大メモリ(KB) |", "|---|---:|---:|---:|---:|"]
+    for name, s in sorted(rep["spans"].items(), key=lambda kv: -kv[1]["seconds"]):
+        lines.append(f"| {name} | {s['count']} | {s['seconds']:.3f} | {s['max_seconds']:.3f} | {s['peak_rss_kb'] or '-'} |")
+    if rep["counters"]:
+        lines += ["", "| 件数 | 値 |", "|---|---:|"]
+        lines += [f"| {k} | {v:,} |" for k, v in sorted(rep["counters"].items())]
+    return "\n".join(lines) + "\n\n"
+
+
+def emit(path=None, **extra):
+    """レポートを path（JSON）に書き、GITHUB_STEP_SUMMARY があれば表を追記する"""
+    rep = report(**extra)
+    if path:
+        try:
+            with open(path, "w", encoding="utf-8") as f:
+                json.dump(rep, f, ensure_ascii=False, indent=2)
+            logging.info(f"実行レポートを出力しました: {path}")
+        except OSError as e:
+            logging.warning(f"実行レポートを書けませんでした: {e}")
+    summary = os.getenv("GITHUB_STEP_SUMMARY")
+    if summary:
+        try:
+            with open(summary, "a", encoding="utf-8") as f:
+                f.write(_summary_markdown(rep))
+        except OSError:
+            pass
+    spans = ", ".join(f"{k} {v['seconds']:.2f}s" for k, v in sorted(rep["spans"].items(), key=lambda kv: -kv[1]["seconds"]))
+    logging.info(f"所要時間: 合計 {rep['wall_seconds']:.2f}s（{spans or '-'}）")
+    return rep
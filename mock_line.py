@@ -0,0 +1,258 @@
+# mock_line.py
+# ローカルで動く LINE Messaging API の代役（送信テスト・負荷測定・障害注入用）。
+#   python mock_line.py --port 8089 --latency 0.05 --rate 20 --error-rate 0.1 --record received.jsonl
+# を起動して、main.py を LINE_API_BASE=http://127.0.0.1:8089 で動かす
+import argparse
+import json
+import random
+import signal
+import threading
+import time
+import uuid
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import NamedTuple, Optional
+
+# 受け付けるエンドポイント -> 送信先の種類
+ENDPOINTS = {
+    "/v2/bot/message/push": "push",
+    "/v2/bot/message/multicast": "multicast",
+    "/v2/bot/message/broadcast": "broadcast",
+    "/v2/bot/message/validate/push": "validate",
+    "/v2/bot/message/validate/multicast": "validate",
+    "/v2/bot/message/validate/broadcast": "validate",
+}
+# 本物の API の上限
+MAX_MESSAGES = 5
+MAX_TEXT = 5000
+MAX_MULTICAST_TO = 500
+
+
+class MockOptions(NamedTuple):
+    """latency      : 応答までの待ち時間（秒）。jitter 秒までの一様乱数を足す
+    rate           : 1秒あたりに受け付けるリクエスト数（超えたら 429。0 なら制限なし）
+    burst          : rate のバースト
+    retry_after    : 429 / 5xx に付ける Retry-After（秒。None なら付けない）
+    error_rate     : この確率で error_status を返す（送信は受理しない）
+    error_status   : 注入するエラーのステータス
+    fail_first     : 最初のこの件数のリクエストは必ず error_status を返す
+    drop_after_accept : この確率で「受理したのに 500 を返す」（再送で 409 になるかの確認用）
+    seed           : 乱数の種（再現性のため）
+    """
+    latency: float = 0.0
+    jitter: float = 0.0
+    rate: float = 0.0
+    burst: int = 1
+    retry_after: Optional[float] = None
+    error_rate: float = 0.0
+    error_status: int = 500
+    fail_first: int = 0
+    drop_after_accept: float = 0.0
+    seed: Optional[int] = None
+
+
+class MockLineServer:
+    """スレッドで動く模擬 LINE API サーバー。
+
+    with MockLineServer(MockOptions(rate=10)) as mock:
+        LineClient(token, api_base=mock.url) ...
+        mock.received  # 受け取ったリクエストの記録（dict のリスト）
+    """
+
+    def __init__(self, options=MockOptions(), host="127.0.0.1", port=0, record=None):
+        self.options = options
+        self.received = []            # {"at", "path", "kind", "status", "to", "messages", "chars", "retry_key"}
+        self.accepted = {}            # X-Line-Retry-Key -> request-id（受理済み）
+        self._record = open(record, "a", encoding="utf-8") if record else None
+        self._lock = threading.Lock()
+        self._random = random.Random(options.seed)
+        self._tokens = float(max(1, options.burst))
+        self._last = time.monotonic()
+        self._count = 0
+        self.httpd = ThreadingHTTPServer((host, port), _handler(self))
+        self.httpd.daemon_threads = True
+        self._thread = None
+
+    @property
+    def url(self):
+        host, port = self.httpd.server_address[:2]
+        return f"http://{host}:{port}"
+
+    def start(self):
+        self._thread = threading.Thread(target=self.httpd.serve_forever, daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self.httpd.shutdown()
+        self.httpd.server_close()
+        if self._record:
+            self._record.close()
+            self._record = None
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc):
+        self.stop()
+
+    def reset(self):
+        with self._lock:
+            self.received.clear()
+            self.accepted.clear()
+            self._count = 0
+
+    def stats(self):
+        """ステータスごとの件数と、受理した宛先数・メッセージ数"""
+        with self._lock:
+            by_status = {}
+            for r in self.received:
+                by_status[r["status"]] = by_status.get(r["status"], 0) + 1
+            ok = [r for r in self.received if r["status"] == 200 and r["kind"] != "validate"]
+            return {"requests": len(self.received), "by_status": by_status,
+                    "recipients": sum(r["to"] for r in ok), "messages": sum(r["messages"] for r in ok)}
+
+    # --- 1リクエストの処理（ハンドラから呼ばれる）---
+    def _take_token(self):
+        rate = self.options.rate
+        if rate <= 0:
+            return True
+        now = time.monotonic()
+        self._tokens = min(max(1, self.options.burst), self._tokens + (now - self._last) * rate)
+        self._last = now
+        if self._tokens >= 1:
+            self._tokens -= 1
+            return True
+        return False
+
+    def handle(self, path, headers, raw):
+        """(ステータス, 追加ヘッダ, 本文の dict) を返す"""
+        opt = self.options
+        kind = ENDPOINTS.get(path)
+        if kind is None:
+            return 404, {}, {"message": "Not found"}
+        if not (headers.get("Authorization") or "").startswith("Bearer "):
+            return 401, {}, {"message": "Authentication failed. Confirm that the access token in the authorization header is valid."}
+        try:
+            body = json.loads(raw or b"{}")
+        except ValueError:
+            return 400, {}, {"message": "The request body has 1 error(s)"}
+        error = _validate(path, body)
+
+        delay = opt.latency + (self._random.uniform(0, opt.jitter) if opt.jitter else 0)
+        if delay > 0:
+            time.sleep(delay)
+
+        retry_key = headers.get("X-Line-Retry-Key")
+        extra = {"x-line-request-id": str(uuid.uuid4())}
+        with self._lock:
+            self._count += 1
+            if error:
+                status, resp = 400, {"message": error}
+            elif retry_key and retry_key in self.accepted:
+                status, resp = 409, {"message": "The retry key is already accepted"}
+                extra["x-line-accepted-request-id"] = self.accepted[retry_key]
+            elif not self._take_token():
+                status, resp = 429, {"message": "Too Many Requests"}
+            elif self._count <= opt.fail_first or self._random.random() < opt.error_rate:
+                status, resp = opt.error_status, {"message": "Injected error"}
+            else:
+                status, resp = 200, {}
+                if retry_key and kind != "validate":
+                    self.accepted[retry_key] = extra["x-line-request-id"]
+                if self._random.random() < opt.drop_after_accept:
+                    status, resp = 500, {"message": "Injected error after accept"}
+            if status in (429, 500, 502, 503, 504) and opt.retry_after is not None:
+                extra["Retry-After"] = f"{opt.retry_after:g}"
+
+            to = body.get("to")
+            entry = {"at": time.time(), "path": path, "kind": kind, "status": status,
+                     "to": len(to) if isinstance(to, list) else int(bool(to)),
+                     "messages": len(body.get("messages") or ()),
+                     "chars": sum(len(m.get("text", "")) for m in body.get("messages") or ()),
+                     "retry_key": retry_key}
+            self.received.append(entry)
+            if self._record:
+                self._record.write(json.dumps({**entry, "body": body}, ensure_ascii=False) + "\n")
+                self._record.flush()
+        return status, extra, resp
+
+
+def _validate(path, body):
+    """本物の API と同じ上限を確認する。問題がなければ None"""
+    messages = body.get("messages")
+    if not isinstance(messages, list) or not messages:
+        return "The property, 'messages', in the request body is invalid"
+    if len(messages) > MAX_MESSAGES:
+        return f"Size must be between 1 and {MAX_MESSAGES}"
+    for m in messages:
+        if m.get("type") == "text" and len(m.get("text", "")) > MAX_TEXT:
+            return f"Length must be between 0 and {MAX_TEXT}"
+    to = body.get("to")
+    if path.endswith("multicast"):
+        if not isinstance(to, list) or not to or len(to) > MAX_MULTICAST_TO:
+            return f"Size must be between 1 and {MAX_MULTICAST_TO}"
+    elif path.endswith("push") and not to:
+        return "The property, 'to', in the request body is invalid"
+    return None
+
+
+def _handler(server):
+    class Handler(BaseHTTPRequestHandler):
+        protocol_version = "HTTP/1.1"   # keep-alive（LineClient はセッションを使い回す）
+        disable_nagle_algorithm = True  # ヘッダと本文を別々に書くので、Nagle だと応答が40ms遅れる
+
+        def do_POST(self):
+            raw = self.rfile.read(int(self.headers.get("Content-Length") or 0))
+            status, headers, body = server.handle(self.path, self.headers, raw)
+            data = json.dumps(body).encode("utf-8")
+            self.send_response(status)
+            self.send_header("Content-Type", "application/json")
+            self.send_header("Content-Length", str(len(data)))
+            for k, v in headers.items():
+                self.send_header(k, v)
+            self.end_headers()
+            self.wfile.write(data)
+
+        def log_message(self, *args):
+            pass
+
+    return Handler
+
+
+def _cli(argv=None):
+    ap = argparse.ArgumentParser(description="ローカルの模擬 LINE Messaging API")
+    ap.add_argument("--host", default="127.0.0.1")
+    ap.add_argument("--port", type=int, default=8089)
+    ap.add_argument("--latency", type=float, default=0.0, help="応答までの秒数")
+    ap.add_argument("--jitter", type=float, default=0.0, help="latency に足す乱数の最大秒数")
+    ap.add_argument("--rate", type=float, default=0.0, help="受け付ける件数/秒（超えたら 429）")
+    ap.add_argument("--burst", type=int, default=1)
+    ap.add_argument("--retry-after", type=float, default=None, help="429 / 5xx に付ける Retry-After 秒")
+    ap.add_argument("--error-rate", type=float, default=0.0, help="error-status を返す確率")
+    ap.add_argument("--error-status", type=int, default=500)
+    ap.add_argument("--fail-first", type=int, default=0, help="最初の N 件は必ず失敗させる")
+    ap.add_argument("--drop-after-accept", type=float, default=0.0, help="受理したのに 500 を返す確率")
+    ap.add_argument("--seed", type=int, default=None)
+    ap.add_argument("--record", help="受け取ったリクエストを追記する JSONL ファイル")
+    args = ap.parse_args(argv)
+
+    options = MockOptions(args.latency, args.jitter, args.rate, args.burst, args.retry_after,
+                          args.error_rate, args.error_status, args.fail_first, args.drop_after_accept, args.seed)
+    server = MockLineServer(options, args.host, args.port, args.record)
+    print(f"模擬 LINE API を起動しました: LINE_API_BASE={server.url}", flush=True)
+
+    def _on_term(signum, frame):
+        raise KeyboardInterrupt
+
+    signal.signal(signal.SIGTERM, _on_term)
+    try:
+        server.httpd.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        print(json.dumps(server.stats(), ensure_ascii=False))
+        server.stop()
+
+
+if __name__ == "__main__":
+    _cli()
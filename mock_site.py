@@ -0,0 +1,176 @@
+# mock_site.py
+# ローカルで動くログイン付きイベントサイトの代役（セッションの再利用・期限切れ・保存の確認用）。
+#   python mock_site.py --port 8090 --user demo --password demo
+# を起動して、main.py を LOGIN_URL=http://127.0.0.1:8090/login EVENTS_URL=http://127.0.0.1:8090/events で動かす
+#   /login  : GET でログインフォーム、POST で cookie（session）を発行して /events へリダイレクト
+#   /events : cookie がない・期限切れなら /login へリダイレクト。あればイベント一覧（既定はフィクスチャ）
+import argparse
+import json
+import os
+import secrets
+import signal
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlsplit
+
+COOKIE_NAME = "session"
+DEFAULT_EVENTS_HTML = os.path.join(os.path.dirname(os.path.abspath(__file__)), "fixtures", "shigaku_event.html")
+LOGIN_HTML = """<!DOCTYPE html>
+<html lang="ja"><head><meta charset="utf-8"><title>ログイン</title></head>
+<body><form method="post" action="/login">
+<input type="text" name="username"> <input type="password" name="password">
+<button type="submit">ログイン</button>
+</form>{error}</body></html>"""
+
+
+class MockSiteServer:
+    """スレッドで動く模擬ログインサイト。
+
+    with MockSiteServer(user="demo", password="demo") as site:
+        Site(site.url + "/login", site.url + "/events", "demo", "demo", session_state=...) ...
+        site.logins          # ログインに成功した回数
+        site.expire_sessions()  # 発行済みの cookie をすべて無効にする（セッション切れ）
+
+    rotate=True にすると /events を返すたびに cookie を新しい値に差し替え、古い値は無効にする
+    """
+
+    def __init__(self, user="demo", password="demo", events_html=DEFAULT_EVENTS_HTML, host="127.0.0.1", port=0,
+                 rotate=False):
+        self.user = user
+        self.password = password
+        self.rotate = rotate
+        with open(events_html, "r", encoding="utf-8") as f:
+            self.events_html = f.read()
+        self.sessions = set()   # 有効な cookie の値
+        self.logins = 0
+        self.requests = []      # (method, path, status)
+        self._lock = threading.Lock()
+        self.httpd = ThreadingHTTPServer((host, port), _handler(self))
+        self.httpd.daemon_threads = True
+        self._thread = None
+
+    @property
+    def url(self):
+        host, port = self.httpd.server_address[:2]
+        return f"http://{host}:{port}"
+
+    def start(self):
+        self._thread = threading.Thread(target=self.httpd.serve_forever, daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self.httpd.shutdown()
+        self.httpd.server_close()
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc):
+        self.stop()
+
+    def new_session(self) -> str:
+        """ログインしたことにして cookie の値を発行する"""
+        token = secrets.token_hex(16)
+        with self._lock:
+            self.sessions.add(token)
+        return token
+
+    def expire_sessions(self):
+        with self._lock:
+            self.sessions.clear()
+
+    # --- 1リクエストの処理（ハンドラから呼ばれる）---
+    def handle(self, method, path, cookie, form):
+        """(ステータス, 追加ヘッダ, 本文の HTML) を返す"""
+        route = urlsplit(path).path.rstrip("/") or "/"
+        if route == "/login" and method == "POST":
+            if form.get("username") == [self.user] and form.get("password") == [self.password]:
+                token = self.new_session()
+                with self._lock:
+                    self.logins += 1
+                return 303, {"Location": "/events", "Set-Cookie": f"{COOKIE_NAME}={token}; Path=/; HttpOnly"}, ""
+            return 200, {}, LOGIN_HTML.format(error="<p>IDまたはパスワードが違います</p>")
+        if route == "/login":
+            return 200, {}, LOGIN_HTML.format(error="")
+        if route == "/events":
+            with self._lock:
+                valid = cookie in self.sessions
+            if not valid:
+                return 302, {"Location": "/login"}, ""
+            if self.rotate:
+                token = self.new_session()
+                with self._lock:
+                    self.sessions.discard(cookie)
+                return 200, {"Set-Cookie": f"{COOKIE_NAME}={token}; Path=/; HttpOnly"}, self.events_html
+            return 200, {}, self.events_html
+        return 404, {}, "<p>Not found</p>"
+
+
+def _cookie(header, name=COOKIE_NAME):
+    for part in (header or "").split(";"):
+        k, _, v = part.strip().partition("=")
+        if k == name:
+            return v
+    return None
+
+
+def _handler(server):
+    class Handler(BaseHTTPRequestHandler):
+        protocol_version = "HTTP/1.1"
+        disable_nagle_algorithm = True
+
+        def _serve(self, method, form=None):
+            status, headers, body = server.handle(method, self.path, _cookie(self.headers.get("Cookie")), form or {})
+            with server._lock:
+                server.requests.append((method, self.path, status))
+            data = body.encode("utf-8")
+            self.send_response(status)
+            self.send_header("Content-Type", "text/html; charset=utf-8")
+            self.send_header("Content-Length", str(len(data)))
+            for k, v in headers.items():
+                self.send_header(k, v)
+            self.end_headers()
+            self.wfile.write(data)
+
+        def do_GET(self):
+            self._serve("GET")
+
+        def do_POST(self):
+            raw = self.rfile.read(int(self.headers.get("Content-Length") or 0))
+            self._serve("POST", parse_qs(raw.decode("utf-8")))
+
+        def log_message(self, *args):
+            pass
+
+    return Handler
+
+
+def _cli(argv=None):
+    ap = argparse.ArgumentParser(description="ローカルの模擬ログインサイト")
+    ap.add_argument("--host", default="127.0.0.1")
+    ap.add_argument("--port", type=int, default=8090)
+    ap.add_argument("--user", default="demo")
+    ap.add_argument("--password", default="demo")
+    ap.add_argument("--events-html", default=DEFAULT_EVENTS_HTML, help="ログイン後に返すイベント一覧の HTML")
+    ap.add_argument("--rotate", action="store_true", help="イベント一覧を返すたびに cookie を差し替える")
+    args = ap.parse_args(argv)
+
+    server = MockSiteServer(args.user, args.password, args.events_html, args.host, args.port, args.rotate)
+    print(f"模擬ログインサイトを起動しました: LOGIN_URL={server.url}/login EVENTS_URL={server.url}/events", flush=True)
+
+    def _on_term(signum, frame):
+        raise KeyboardInterrupt
+
+    signal.signal(signal.SIGTERM, _on_term)
+    try:
+        server.httpd.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        print(json.dumps({"logins": server.logins, "requests": len(server.requests)}, ensure_ascii=False))
+        server.stop()
+
+
+if __name__ == "__main__":
+    _cli()
@@ -1,118 +1,762 @@
 # parsers.py
-from bs4 import BeautifulSoup
+import hashlib
+import re
+from itertools import chain, islice
 from urllib.parse import urljoin
-from typing import List, Dict, Optional
-import sys
+from typing import Callable, Dict, Iterable, Iterator, List, NamedTuple, Optional, Tuple, Union
+import logging
 
-def parse_events_generic(html: str, base_url: str) -> List[Dict[str, Optional[str]]]:
+import lxml.etree
+import lxml.html
+
+# デバッグ出力は LOG_LEVEL=DEBUG のときだけ（無効なら文字列の整形もしない）
+log = logging.getLogger(__name__)
+
+Event = Dict[str, Optional[str]]
+
+# BeautifulSoup の get_text() と同じく、これらのタグの中身はテキストとして扱わない
+_NON_TEXT_TAGS = frozenset(("script", "style", "template"))
+
+
+class Strategy(NamedTuple):
+    """レイアウト1種類ぶんの抽出ルール。
+
+    tags    : 候補になり得るタグ名（None なら全タグ）。走査時の振り分けに使う
+    match   : 要素が候補（1イベントぶんのコンテナ）かを判定する
+    extract : 候補要素から {"date", "title", "link"} を作る。取れなければ None
+    """
+    name: str
+    tags: Optional[Tuple[str, ...]]
+    match: Callable[[lxml.html.HtmlElement], bool]
+    extract: Callable[[lxml.html.HtmlElement, str], Optional[Event]]
+
+
+# 登録順がそのまま試行順（優先度）になる
+STRATEGIES: List[Strategy] = []
+
+# タグ名 -> そのタグを候補にし得るストラテジ一覧（register_strategy で再構築）
+_BY_TAG: Dict[str, List[Strategy]] = {}
+_ANY_TAG: List[Strategy] = []
+
+# base_url ごとに前回イベントを取れたストラテジ名
+_LAST_WINNER: Dict[str, str] = {}
+
+# この文字数以上のページは木全体を作らず、少しずつ読み込んで解析する（iter_events）
+STREAM_MIN_CHARS = 1_000_000
+_STREAM_CHUNK = 1 << 16
+
+
+def register_strategy(name: str,
+                      match: Callable[[lxml.html.HtmlElement], bool],
+                      extract: Callable[[lxml.html.HtmlElement, str], Optional[Event]],
+                      tags: Optional[Tuple[str, ...]] = None) -> Strategy:
+    """新しいレイアウトを登録する。文書の走査回数は増えない。"""
+    strategy = Strategy(name, tags, match, extract)
+    STRATEGIES.append(strategy)
+    _compile()
+    return strategy
+
+
+def _compile():
+    _BY_TAG.clear()
+    _ANY_TAG.clear()
+    for s in STRATEGIES:
+        if s.tags is None:
+            _ANY_TAG.append(s)
+        else:
+            for t in s.tags:
+                _BY_TAG.setdefault(t, []).append(s)
+
+
+# ---------- 要素まわりの小さなヘルパ ----------
+def _classes(el) -> List[str]:
+    return (el.get("class") or "").split()
+
+
+def _has_ancestor(el, pred) -> bool:
+    for anc in el.iterancestors():
+        if pred(anc):
+            return True
+    return False
+
+
+def _iter_strings(el, skip_tags=_NON_TEXT_TAGS) -> Iterator[str]:
+    if el.text:
+        yield el.text
+    for child in el:
+        # コメント等（tag が文字列でない）と skip_tags の中身は読まない。tail は親のテキスト
+        if isinstance(child.tag, str) and child.tag not in skip_tags:
+            yield from _iter_strings(child, skip_tags)
+        if child.tail:
+            yield child.tail
+
+
+def _text(el, skip_tags=_NON_TEXT_TAGS) -> str:
+    """BeautifulSoup の get_text(strip=True) 相当"""
+    return "".join(s.strip() for s in _iter_strings(el, skip_tags))
+
+
+def _first_descendant(el, pred):
+    for d in el.iterdescendants():
+        if isinstance(d.tag, str) and pred(d):
+            return d
+    return None
+
+
+def _is_link(el) -> bool:
+    return el.tag == "a" and el.get("href") is not None
+
+
+# ---------- 1. テーブル形式: table tbody tr ----------
+def _match_table_row(el) -> bool:
+    for anc in el.iterancestors():
+        if anc.tag == "tbody":
+            return _has_ancestor(anc, lambda x: x.tag == "table")
+    return False
+
+
+def _extract_table_row(tr, base_url: str) -> Optional[Event]:
+    tds = [d for d in tr.iterdescendants("td")]
+    if len(tds) < 2:
+        return None
+    date = _text(tds[0])
+    title = _text(tds[1])
+    a = _first_descendant(tr, _is_link)
+    link = urljoin(base_url, a.get("href")) if a is not None else None
+    if not title:
+        return None
+    return {"date": date, "title": title, "link": link}
+
+
+# ---------- 2. 汎用リスト形式: .events .event, .event-item, .schedule .item, li.event ----------
+def _match_generic_item(el) -> bool:
+    cls = _classes(el)
+    if not cls:
+        return False
+    if "event-item" in cls:
+        return True
+    if "event" in cls:
+        if el.tag == "li" or _has_ancestor(el, lambda x: "events" in _classes(x)):
+            return True
+    if "item" in cls and _has_ancestor(el, lambda x: "schedule" in _classes(x)):
+        return True
+    return False
+
+
+def _extract_generic_item(el, base_url: str) -> Optional[Event]:
+    title_el = _first_descendant(el, lambda d: d.tag in ("h3", "h4", "a") or "title" in _classes(d))
+    date_el = _first_descendant(el, lambda d: d.tag == "time" or "date" in _classes(d))
+    a = _first_descendant(el, _is_link)
+
+    title = _text(title_el) if title_el is not None else None
+    link = urljoin(base_url, a.get("href")) if a is not None else None
+    date = _text(date_el) if date_el is not None else None
+
+    if not title:
+        return None
+    return {"date": date, "title": title, "link": link}
+
+
+# ---------- 3. 特定のリスト形式: .row.ttl > ul > li ----------
+_TITLE_SKIP_TAGS = _NON_TEXT_TAGS | {"span"}
+
+
+def _match_row_ttl_item(el) -> bool:
+    ul = el.getparent()
+    if ul is None or ul.tag != "ul":
+        return False
+    row = ul.getparent()
+    if row is None:
+        return False
+    cls = _classes(row)
+    return "row" in cls and "ttl" in cls
+
+
+def _extract_row_ttl_item(li, base_url: str) -> Optional[Event]:
+    a_tag = _first_descendant(li, _is_link)
+    if a_tag is None:
+        return None
+
+    link = urljoin(base_url, a_tag.get("href"))
+
+    # 日付要素（<a>タグ内の最初の<span>）を取得
+    date_span = _first_descendant(a_tag, lambda d: d.tag == "span" and _is_first_element_child(d))
+    date_text = _text(date_span) if date_span is not None else None
+
+    # 日付や状態を示す<span>の中身を除いた残りのテキストがタイトル。
+    # 元の木をコピー・再パースせず、<span>配下の文字列を読み飛ばすだけで済ませる
+    title = _text(a_tag, _TITLE_SKIP_TAGS).replace('<br>', ' ').strip()
+    if not title:
+        return None
+    return {"date": date_text, "title": title, "link": link}
+
+
+def _is_first_element_child(el) -> bool:
+    """CSS の :first-child 相当（コメント等は兄弟として数えない）"""
+    prev = el.getprevious()
+    while prev is not None:
+        if isinstance(prev.tag, str):
+            return False
+        prev = prev.getprevious()
+    return True
+
+
+register_strategy("table", _match_table_row, _extract_table_row, tags=("tr",))
+register_strategy("generic_list", _match_generic_item, _extract_generic_item)
+register_strategy("row_ttl", _match_row_ttl_item, _extract_row_ttl_item, tags=("li",))
+
+
+# ---------- エンジン本体 ----------
+def _collect_candidates(root) -> Dict[str, list]:
+    """文書を1回だけ走査し、各ストラテジの候補要素を文書順に集める"""
+    candidates: Dict[str, list] = {s.name: [] for s in STRATEGIES}
+    by_tag = _BY_TAG
+    any_tag = _ANY_TAG
+    for el in root.iter():
+        tag = el.tag
+        if not isinstance(tag, str):
+            continue
+        for s in by_tag.get(tag, ()):
+            if s.match(el):
+                candidates[s.name].append(el)
+        for s in any_tag:
+            if s.match(el):
+                candidates[s.name].append(el)
+    return candidates
+
+
+def _matching(el) -> List[Strategy]:
+    tag = el.tag
+    if not isinstance(tag, str):
+        return []
+    return [s for s in _BY_TAG.get(tag, ()) if s.match(el)] + [s for s in _ANY_TAG if s.match(el)]
+
+
+class _CandidateStream:
+    """HTML を少しずつパースし、候補要素を文書順に返す（_collect_candidates のストリーミング版）。
+
+    match は要素自身の属性と祖先しか見ないので、開始タグの時点で判定できる。
+    一番外側の候補が閉じたら、その中の候補をまとめて [(要素, 一致したストラテジ), ...] で返し、
+    呼び出し側が読み終えたらその部分木（と処理済みの兄弟）を木から外す。
+    root は候補が1つもなかったとき用（その場合は何も外していない）。
+    """
+
+    def __init__(self, source: Union[str, bytes, Iterable]):
+        self.source = source
+        self.root = None
+
+    def _chunks(self):
+        src = self.source
+        if isinstance(src, (str, bytes)):
+            return (src[i:i + _STREAM_CHUNK] for i in range(0, len(src), _STREAM_CHUNK))
+        return iter(src)
+
+    def __iter__(self) -> Iterator[List[Tuple[lxml.html.HtmlElement, List[Strategy]]]]:
+        parser = lxml.etree.HTMLPullParser(events=("start", "end"))
+        parser.set_element_class_lookup(lxml.html.HtmlElementClassLookup())
+        group = []  # 開いている一番外側の候補とその中の候補（開始タグ順）
+        depth = 0   # 開いている候補の数
+        opened = set()
+        for chunk in chain(self._chunks(), (None,)):
+            if chunk is None:
+                self.root = parser.close()
+            else:
+                parser.feed(chunk)
+            for action, el in parser.read_events():
+                if action == "start":
+                    matched = _matching(el)
+                    if matched:
+                        group.append((el, matched))
+                        opened.add(el)
+                        depth += 1
+                elif el in opened:
+                    opened.discard(el)
+                    depth -= 1
+                    if depth == 0:
+                        yield group
+                        group = []
+                        _release(el)
+
+
+def _release(el):
+    """処理済みの要素を空にし、前にある兄弟ごと親から外す（木を大きくしない）"""
+    el.clear(keep_tail=False)
+    parent = el.getparent()
+    if parent is not None:
+        while el.getprevious() is not None:
+            del parent[0]
+
+
+def _ordered_strategies(base_url: str, prefer: Optional[str] = None) -> List[Strategy]:
+    winner = prefer or _LAST_WINNER.get(base_url)
+    if winner is None:
+        return STRATEGIES
+    return ([s for s in STRATEGIES if s.name == winner]
+            + [s for s in STRATEGIES if s.name != winner])
+
+
+def parse_events_generic(html: str, base_url: str,
+                         prefer: Optional[str] = None) -> List[Dict[str, Optional[str]]]:
     """
     HTMLからイベント情報（日付、タイトル、リンク）を抽出する。
     1. テーブル形式
     2. 汎用リスト形式
     3. 新しい特定のリスト形式（.row.ttl）
-    の順に試行する。
+    を STRATEGIES に登録しておき、lxml の木を1回だけ走査して候補要素を振り分ける。
+    前回同じ base_url でイベントを取れたストラテジから優先して試す
+    （prefer にストラテジ名を渡すとそれを最優先にする）。
+    どれにも一致しなければ、繰り返し並ぶレコードからセレクタを推定する（parse_page）。
     """
-    print("--- DEBUG: parse_events_generic 開始 ---", file=sys.stderr)
-    soup = BeautifulSoup(html, "lxml")
-    events = []
+    return parse_page(html, base_url, prefer).events
 
-    # --- 1. テーブル形式の解析 ---
-    print("--- DEBUG: 1. テーブル形式の解析を試行中 ---", file=sys.stderr)
-    for i, tr in enumerate(soup.select("table tbody tr")):
-        tds = tr.find_all("td")
-        if len(tds) < 2:
-            continue
-        date = tds[0].get_text(strip=True)
-        title = tds[1].get_text(strip=True)
-        a = tr.select_one("a[href]")
-        link = urljoin(base_url, a["href"]) if a else None
-        if title:
-            events.append({"date": date, "title": title, "link": link})
-    
-    if events:
-        print(f"--- DEBUG: 1. テーブル形式で {len(events)} 件のイベントを検出。処理を終了 ---", file=sys.stderr)
-        return events
-    print("--- DEBUG: 1. テーブル形式ではイベントを検出せず ---", file=sys.stderr)
-
-    # --- 2. 汎用リスト形式の解析 ---
-    print("--- DEBUG: 2. 汎用リスト形式の解析を試行中 ---", file=sys.stderr)
-    # 検索セレクタを修正（元のコードではコメントアウトされていたため）
-    list_elements = soup.select(".events .event, .event-item, .schedule .item, li.event")
-    print(f"--- DEBUG: 2. 検出された汎用リスト要素の数: {len(list_elements)} ---", file=sys.stderr)
-
-    for el in list_elements:
-        # title_el, date_el, a の検索ロジックは元のコードのまま
-        title_el = el.select_one(".title, h3, h4, a")
-        date_el  = el.select_one(".date, time")
-        a = el.select_one("a[href]")
-        
-        # データの抽出
-        title = title_el.get_text(strip=True) if title_el else None
-        link  = urljoin(base_url, a["href"]) if a else None
-        date  = date_el.get_text(strip=True) if date_el else None
-        
-        if title:
-            events.append({"date": date, "title": title, "link": link})
-            
-    if events:
-        print(f"--- DEBUG: 2. 汎用リスト形式で {len(events)} 件のイベントを検出。処理を終了 ---", file=sys.stderr)
-        return events
-    print("--- DEBUG: 2. 汎用リスト形式ではイベントを検出せず ---", file=sys.stderr)
-    
-    # --- 3. 新しい特定のリスト形式 (.row.ttl) の解析 ---
-    print("--- DEBUG: 3. 特定のリスト形式 (.row ttl) の解析を試行中 ---", file=sys.stderr)
-    
-    # イベントリストの要素を取得: <div class="row ttl"> の中の <ul> の中の <li>
-    li_elements = soup.select(".row.ttl > ul > li")
-    print(f"--- DEBUG: 3. 検出された .row ttl > ul > li 要素の数: {len(li_elements)} ---", file=sys.stderr)
-    
-    for i, li in enumerate(li_elements):
-        print(f"--- DEBUG: 3. {i+1} 番目の li 要素の処理開始 ---", file=sys.stderr)
-        a_tag = li.select_one("a[href]")
-        
-        if not a_tag:
-            print(f"--- DEBUG: 3. {i+1} 番目の li に <a> タグなし。スキップ ---", file=sys.stderr)
+
+def _parse_root(root, base_url: str, prefer: Optional[str] = None) -> Tuple[List[Event], Optional[dict]]:
+    """全ストラテジを優先順に試す。(イベント, 取れたストラテジのレシピ)"""
+    candidates = _collect_candidates(root)
+
+    for s in _ordered_strategies(base_url, prefer):
+        nodes = candidates[s.name]
+        events = []
+        tags = set()
+        for el in nodes:
+            ev = s.extract(el, base_url)
+            if ev is not None:
+                events.append(ev)
+                tags.add(el.tag)
+        if events:
+            _LAST_WINNER[base_url] = s.name
+            log.debug("%s 形式で %d 件のイベントを検出 (候補 %d 要素)", s.name, len(events), len(nodes))
+            # 次回は実際にイベントが取れたタグだけを調べる
+            return events, {"strategy": s.name, "tags": sorted(tags)}
+
+    _LAST_WINNER.pop(base_url, None)
+    log.debug("どの形式でもイベントを検出せず")
+    return [], None
+
+
+# ---------- 構造の指紋と抽出レシピ ----------
+# レシピは JSON にできる dict:
+#   {"strategy": "row_ttl", "tags": ["li"]}                   登録済みストラテジ（と候補になったタグ）
+#   {"selector": [["div", ["row", "ttl"]], ["ul", []], ["li", []]]}  推定したレコードの位置（祖先2つ + 自身）
+class ParseResult(NamedTuple):
+    """parse_page の結果。fingerprint はページ構造の指紋（大きなページ・繰り返し要素のないページでは None）、
+    recipe はイベントを取れた抽出方法、cached はそれが recipes から再利用されたものか、
+    inferred は既知の形式に一致せず、推定したセレクタで今回初めて抽出したか（件名・日付の取り違えがありうる）"""
+    events: List[Event]
+    fingerprint: Optional[str]
+    recipe: Optional[dict]
+    cached: bool = False
+    inferred: bool = False
+
+
+# 繰り返しとみなす兄弟の数
+REPEAT_MIN = 3
+# 指紋・推定で見る子要素の数（レコードは同じ形が続くので、先頭だけ見れば足りる）
+_GROUP_SAMPLE = 24
+# 推定したレコードのうち日付を含むものの割合の下限（ナビゲーション等を拾わないように）
+INFER_DATE_RATIO = 0.5
+# 日付（後ろに続く曜日「（土）」と時刻「11:30」「11:30〜13:00」も含める）
+_DATE_RE = re.compile(
+    r"(?:\d{4}\s*[./\-年]\s*\d{1,2}\s*[./\-月]\s*\d{1,2}\s*日?|\d{1,2}\s*月\s*\d{1,2}\s*日|\d{1,2}/\d{1,2})"
+    r"(?:\s*[（(][月火水木金土日祝・]+[)）])?"
+    r"(?:\s*\d{1,2}:\d{2}(?:\s*[〜~～\-]\s*\d{1,2}:\d{2})?)?")
+# これ以下の文字数で子要素を持たない要素は、件名ではなくバッジ（「◎空席あり」「NEW」など）とみなす
+BADGE_MAX_CHARS = 12
+
+
+def _signature(el) -> Tuple[str, Tuple[str, ...]]:
+    return el.tag, tuple(sorted(_classes(el)))
+
+
+def _selector_text(selector) -> str:
+    return " > ".join(tag + "".join(f".{c}" for c in classes) for tag, classes in selector)
+
+
+def _repeated_groups(root) -> List[Tuple[tuple, list]]:
+    """同じタグ・class の兄弟が REPEAT_MIN 個以上並び、その半分以上がリンクを含むまとまり。
+    [(セレクタ（祖先2つ + 自身の signature）, 先頭 _GROUP_SAMPLE 個までの要素)] を文書順に返す"""
+    groups = []
+    done = set()
+    # 子要素が REPEAT_MIN 個以上ある要素だけを C 側で探す（レコードの中身までは Python で回らない）
+    for parent in root.xpath(f"descendant-or-self::*[count(*) >= {REPEAT_MIN}]"):
+        grand = parent.getparent()
+        key = (parent.tag, parent.get("class"),
+               None if grand is None else grand.tag, None if grand is None else grand.get("class"))
+        if key in done:
+            continue  # 同じ形の親（レコード自身が子を3つ以上持つ場合など）は最初の1つだけ見る
+        done.add(key)
+        head = ((_signature(grand),) if grand is not None else ()) + (_signature(parent),)
+        by_sig: Dict[tuple, list] = {}
+        for child in islice(parent.iterchildren("*"), _GROUP_SAMPLE):
+            by_sig.setdefault(_signature(child), []).append(child)
+        for sig, members in by_sig.items():
+            if len(members) < REPEAT_MIN:
+                continue
+            linked = sum(1 for m in members if _is_link(m) or m.find(".//a[@href]") is not None)
+            if linked * 2 < len(members):
+                continue
+            groups.append((head + (sig,), members))
+    return groups
+
+
+def _fingerprint(groups) -> str:
+    """繰り返し並ぶレコードの位置（件数は含めない）の集合のハッシュ。
+    イベントが増減しても変わらず、レイアウトが変わると変わる"""
+    paths = sorted({_selector_text(path) for path, _ in groups})
+    return hashlib.sha256("\n".join(paths).encode("utf-8")).hexdigest()[:16]
+
+
+def page_fingerprint(html: str) -> str:
+    """ページ構造の指紋（recipes のキー）"""
+    return _fingerprint(_repeated_groups(lxml.html.document_fromstring(html)))
+
+
+def _infer_recipe(groups) -> Optional[dict]:
+    """既知の形式に一致しないとき、日付とリンクを含むレコードが最も多く並ぶまとまりを選ぶ"""
+    best, best_score = None, 0
+    for path, members in groups:
+        dated = sum(1 for m in members if _DATE_RE.search(_text(m)))
+        if dated < len(members) * INFER_DATE_RATIO:
             continue
+        if dated > best_score:
+            best, best_score = path, dated
+    if best is None:
+        return None
+    return {"selector": [[tag, list(classes)] for tag, classes in best]}
 
-        # リンクの抽出と絶対URLへの変換
-        link = urljoin(base_url, a_tag["href"])
-        print(f"--- DEBUG: 3. {i+1} 番目の li リンク抽出: {link} ---", file=sys.stderr)
-        
-        # タイトル抽出のため、<a>タグをコピーして余分な<span>タグを削除
-        # コピーを作成
-        # BeautifulSoupでタグをコピーする際は、そのタグを一旦文字列化し、再度BeautifulSoupでパースするのが確実
-        a_copy = BeautifulSoup(str(a_tag), "lxml").select_one('a')
-        print(f"--- DEBUG: 3. {i+1} 番目の li <a> タグをコピーし再パース完了 ---", file=sys.stderr)
-
-
-        # 日付要素（<a>タグ内の最初の<span>）を取得
-        date_span = a_copy.select_one("span:first-child")
-        date_text = date_span.get_text(strip=True) if date_span else None
-        print(f"--- DEBUG: 3. {i+1} 番目の li 日付要素(span:first-child)抽出: {date_text} ---", file=sys.stderr)
-        
-        # 日付や状態を示す全ての<span>タグを削除
-        span_count = len(a_copy.find_all("span"))
-        for span in a_copy.find_all("span"):
-            span.decompose()
-        print(f"--- DEBUG: 3. {i+1} 番目の li {span_count} 個の <span> タグを削除完了 ---", file=sys.stderr)
-            
-        # 残ったテキストがタイトル（<br>タグはスペースに変換）
-        # <br>タグの処理は、get_textの引数separatorで代替可能だが、元のロジックを維持してデバッグ
-        a_copy_text_before_br_replace = a_copy.get_text(strip=True)
-        title = a_copy_text_before_br_replace.replace('<br>', ' ').strip()
-        print(f"--- DEBUG: 3. {i+1} 番目の li 抽出されたタイトル: {title} ---", file=sys.stderr)
-        
-        # タイトルが取得できた場合のみイベントとして追加
-        if title:
-            events.append({
-                "date": date_text,
-                "title": title,
-                "link": link
-            })
-            print(f"--- DEBUG: 3. {i+1} 番目の li イベント情報をリストに追加完了 ---", file=sys.stderr)
+
+def _select(root, selector):
+    """selector（祖先 → 自身の signature の列）に一致する要素"""
+    steps = [(tag, tuple(classes)) for tag, classes in selector]
+    for el in root.iter(steps[-1][0]):
+        node = el
+        for step in reversed(steps):
+            if node is None or _signature(node) != step:
+                break
+            node = node.getparent()
         else:
-            print(f"--- DEBUG: 3. {i+1} 番目の li タイトルが空のためスキップ ---", file=sys.stderr)
+            yield el
+
 
-    print(f"--- DEBUG: 3. 特定のリスト形式で {len(events)} 件のイベントを検出 ---", file=sys.stderr)
-    print("--- DEBUG: parse_events_generic 終了 ---", file=sys.stderr)
+def _title_pieces(el, date, skip=None) -> Iterator[Tuple[str, bool]]:
+    """el のテキストを (文字列, バッジか) で返す。日付を含む要素と skip は除く。
+    バッジは子要素のない BADGE_MAX_CHARS 文字以下の要素"""
+    if el.text:
+        yield el.text, False
+    for child in el:
+        if isinstance(child.tag, str) and child.tag not in _NON_TEXT_TAGS and child is not skip:
+            text = _text(child)
+            if len(child):
+                if date and date in text:
+                    yield from _title_pieces(child, date, skip)  # 日付を含む入れ物は中を見る
+                else:
+                    yield text, False
+            elif not (date and date in text):
+                yield text, len(text) <= BADGE_MAX_CHARS
+        if child.tail:
+            yield child.tail, False
+
+
+def _record_title(el, date, skip=None) -> str:
+    """バッジ以外をつなげたもの。それが空なら最も長いバッジ（件名が短いだけのこともある）"""
+    pieces = list(_title_pieces(el, date, skip))
+    title = "".join(t.strip() for t, badge in pieces if not badge)
+    if date:
+        title = title.replace(date, "").strip()
+    return title or max((t.strip() for t, badge in pieces if badge), key=len, default="")
+
+
+def _extract_record(el, base_url: str) -> Optional[Event]:
+    """推定したレコードから: リンク先、日付（曜日・時刻まで）、件名（リンク文字列から日付とバッジを除いたもの。
+    リンク文字列が「詳細」のように短ければ、レコードのリンク以外の部分の方が長いときはそちら）"""
+    a = el if _is_link(el) else _first_descendant(el, _is_link)
+    if a is None:
+        return None
+    m = _DATE_RE.search(_text(el))
+    date = m.group(0).strip() if m else None
+    title = _record_title(a, date)
+    if len(title) <= BADGE_MAX_CHARS and a is not el:
+        title = max(title, _record_title(el, date, skip=a), key=len)
+    if not title:
+        return None
+    return {"date": date, "title": title, "link": urljoin(base_url, a.get("href"))}
+
+
+def _apply_recipe(root, recipe: dict, base_url: str) -> List[Event]:
+    """レシピだけで抽出する（他のストラテジは試さない）"""
+    events = []
+    if "strategy" in recipe:
+        s = next((s for s in STRATEGIES if s.name == recipe["strategy"]), None)
+        if s is None:
+            return []
+        tags = recipe.get("tags") or s.tags
+        for el in (root.iter(*tags) if tags else root.iter()):
+            if isinstance(el.tag, str) and s.match(el):
+                ev = s.extract(el, base_url)
+                if ev is not None:
+                    events.append(ev)
+    elif "selector" in recipe:
+        for el in _select(root, recipe["selector"]):
+            ev = _extract_record(el, base_url)
+            if ev is not None:
+                events.append(ev)
     return events
+
+
+def parse_page(html: str, base_url: str, prefer: Optional[str] = None,
+               recipes: Optional[Dict[str, dict]] = None) -> ParseResult:
+    """ページを解析する。
+
+    recipes（指紋 -> レシピ。seen_store.load_recipes）を渡すと、ページ構造の指紋を計算し、
+    同じ構造で前回イベントを取れたレシピがあればそれだけで抽出する（他の形式は試さない）。
+    なければ全ストラテジを試し、どれにも一致しなければ繰り返し並ぶレコードから
+    セレクタを推定する。イベントを取れたレシピを結果に入れて返すので、呼び出し側で保存する。
+    """
+    if not html or not html.strip():
+        return ParseResult([], None, None)
+    if len(html) >= STREAM_MIN_CHARS:
+        return ParseResult(list(iter_events(html, base_url, prefer)), None, None)
+    root = lxml.html.document_fromstring(html)
+
+    groups = fingerprint = None
+    if recipes is not None:
+        groups = _repeated_groups(root)
+        # 繰り返し要素がなければ指紋は作らない（どのページも同じ指紋になり、レシピを上書きし合う）
+        fingerprint = _fingerprint(groups) if groups else None
+        recipe = recipes.get(fingerprint) if fingerprint else None
+        if recipe:
+            events = _apply_recipe(root, recipe, base_url)
+            if events:
+                if "strategy" in recipe:
+                    _LAST_WINNER[base_url] = recipe["strategy"]
+                log.debug("指紋 %s のレシピ %s で %d 件のイベントを検出", fingerprint, recipe, len(events))
+                return ParseResult(events, fingerprint, recipe, True)
+            log.info("指紋 %s の保存済みレシピでイベントが取れませんでした。全形式を試します", fingerprint)
+
+    events, recipe = _parse_root(root, base_url, prefer)
+    if events:
+        return ParseResult(events, fingerprint, recipe)
+
+    if groups is None:
+        groups = _repeated_groups(root)
+    recipe = _infer_recipe(groups)
+    if recipe:
+        events = _apply_recipe(root, recipe, base_url)
+        if events:
+            log.warning("既知の形式に一致しないため、推定したセレクタ「%s」で %d 件を抽出しました"
+                        "（parsers.py への形式の追加を推奨）", _selector_text(recipe["selector"]), len(events))
+            return ParseResult(events, fingerprint, recipe, inferred=True)
+    return ParseResult([], fingerprint, None)
+
+
+def iter_events(source: Union[str, bytes, Iterable], base_url: str,
+                prefer: Optional[str] = None) -> Iterator[Event]:
+    """parse_events_generic のジェネレータ版。HTML（文字列か、分割されたチャンクの列）を
+    少しずつパースし、候補要素が閉じるたびにイベントを返して、その部分木は捨てていく。
+    ページが大きくなってもメモリ使用量はほぼ一定。
+
+    結果は parse_events_generic と同じ。最優先のストラテジのイベントはその場で返し、
+    それより後のストラテジのイベントは、最優先のものが1件も取れないと分かるまで保留する。
+    """
+    return _events_from(_CandidateStream(source), base_url, prefer)
+
+
+def _events_from(groups, base_url: str, prefer: Optional[str] = None) -> Iterator[Event]:
+    """iter_events の本体。groups は _CandidateStream（か、それを通すジェネレータ）"""
+    order = _ordered_strategies(base_url, prefer)
+    rank = {s.name: i for i, s in enumerate(order)}
+    best = None   # ここまでにイベントを取れた最も優先度の高いストラテジの順位
+    pending = []  # best のストラテジのイベント（best > 0 の間だけ保留）
+    yielded = 0
+    for group in groups:
+        for el, matched in group:
+            for s in sorted(matched, key=lambda s: rank[s.name]):
+                r = rank[s.name]
+                if best is not None and r > best:
+                    continue
+                ev = s.extract(el, base_url)
+                if ev is None:
+                    continue
+                if best is None or r < best:
+                    best, pending = r, []
+                if r == 0:
+                    yielded += 1
+                    yield ev
+                else:
+                    pending.append(ev)
+                break  # 1つの要素からは最優先のストラテジで1件だけ
+
+    if best is None:
+        _LAST_WINNER.pop(base_url, None)
+        log.debug("どの形式でもイベントを検出せず")
+        return
+    _LAST_WINNER[base_url] = order[best].name
+    log.debug("%s 形式で %d 件のイベントを検出 (ストリーミング)", order[best].name, yielded or len(pending))
+    yield from pending
+
+
+def content_digest(html: str) -> str:
+    """イベント一覧部分（各ストラテジの候補要素）のテキストとリンクを正規化したハッシュ。
+
+    CSRFトークンや広告などページ全体の揺れには影響されないので、
+    前回と同じ値なら一覧は変わっていないとみなせる。
+    大きなページ（STREAM_MIN_CHARS 以上）は木全体を作らずに計算する（値は同じ）。
+    """
+    if not html or not html.strip():
+        return hashlib.sha256().hexdigest()
+    digest = _Digest()
+    if len(html) >= STREAM_MIN_CHARS:
+        stream = _CandidateStream(html)
+        for group in stream:
+            digest.update(group)
+        return digest.hexdigest(stream.root)
+    root = lxml.html.document_fromstring(html)
+    for name, nodes in _collect_candidates(root).items():
+        for el in nodes:
+            digest.parts[name].update(_digest_entry(el))
+            digest.found.add(name)
+    return digest.hexdigest(root)
+
+
+def scan_page(html: str, base_url: str, prefer: Optional[str] = None) -> Tuple[str, List[Event]]:
+    """大きなページ用: content_digest と iter_events の結果を、1回のストリーミングパースで返す。
+    候補要素を読むたびにハッシュへ足してからイベントを取り出すので、木全体もページ2回分の解析も要らない"""
+    if not html or not html.strip():
+        return content_digest(html), []
+    digest = _Digest()
+    stream = _CandidateStream(html)
+
+    def hashed():
+        for group in stream:
+            digest.update(group)
+            yield group
+
+    events = list(_events_from(hashed(), base_url, prefer))
+    return digest.hexdigest(stream.root), events
+
+
+class _Digest:
+    """content_digest の途中経過。ストラテジごとにハッシュしてから連結する
+    （文書を1回読むだけで、木全体から数えた場合と同じ値になるように）"""
+
+    def __init__(self):
+        self.parts = {s.name: hashlib.sha256() for s in STRATEGIES}
+        self.found = set()
+
+    def update(self, group):
+        for el, matched in group:
+            entry = _digest_entry(el)
+            for s in matched:
+                self.parts[s.name].update(entry)
+                self.found.add(s.name)
+
+    def hexdigest(self, root) -> str:
+        h = hashlib.sha256()
+        if not self.found:
+            body = root.find("body") if root is not None else None
+            h.update(_digest_entry(body if body is not None else root) if root is not None else b"")
+            return h.hexdigest()
+        for s in STRATEGIES:
+            if s.name in self.found:
+                h.update(self.parts[s.name].digest())
+        return h.hexdigest()
+
+
+def _digest_entry(el) -> bytes:
+    text = " ".join(" ".join(_iter_strings(el)).split())
+    hrefs = " ".join(a.get("href") for a in el.iter("a") if a.get("href"))
+    return f"{text}\x1f{hrefs}\x1e".encode("utf-8")
+
+
+# ---------- ページ送り・詳細ページ ----------
+# 「次のページ」リンクとみなすテキスト
+_NEXT_LABELS = frozenset(("次へ", "次のページ", "次ページ", "次", "next", "›", "»", "＞", ">"))
+
+
+def find_next_page(html: str, base_url: str) -> Optional[str]:
+    """一覧の「次のページ」のURL。見つからなければ None
+
+    rel="next" → class に next を含むリンク（親要素の class も見る）→ リンク文字列 の順に探す。
+    """
+    if not html or not html.strip():
+        return None
+    root = lxml.html.document_fromstring(html)
+
+    def usable(el) -> Optional[str]:
+        href = (el.get("href") or "").strip()
+        if not href or href.startswith(("#", "javascript:")):
+            return None
+        url = urljoin(base_url, href)
+        return None if url == base_url else url
+
+    def is_rel_next(el):
+        return "next" in (el.get("rel") or "").lower().split()
+
+    def is_next_class(a):
+        parent = a.getparent()
+        return "next" in _classes(a) or (parent is not None and "next" in _classes(parent))
+
+    def is_next_label(a):
+        label = _text(a).strip("<>＜＞«»‹› ").lower() or _text(a)
+        return label in _NEXT_LABELS or label.startswith("次へ")
+
+    links = [el for el in root.iter("a", "link") if el.get("href")]
+    anchors = [el for el in links if el.tag == "a"]
+    for candidates, pred in ((links, is_rel_next), (anchors, is_next_class), (anchors, is_next_label)):
+        for el in candidates:
+            if pred(el):
+                url = usable(el)
+                if url:
+                    return url
+    return None
+
+
+# 詳細ページの項目名（見出し・dt・th、または「会場：…」の行頭）
+_DETAIL_LABELS = {
+    "venue": ("会場", "場所", "開催場所", "開催地", "教室"),
+    "deadline": ("締切", "締め切り", "申込締切", "申込期限", "申し込み締切", "受付期間", "申込期間", "受付締切"),
+}
+# 本文を探す要素（最初に見つかったもの。なければ body）
+_DETAIL_BODY_XPATH = ("//*[contains(concat(' ', normalize-space(@class), ' '), ' detail ')]"
+                      " | //*[contains(concat(' ', normalize-space(@class), ' '), ' event-detail ')]"
+                      " | //article | //main")
+
+
+def _detail_field(label: str) -> Optional[str]:
+    label = label.strip().rstrip(":：").strip()
+    for field, names in _DETAIL_LABELS.items():
+        if label in names:
+            return field
+    return None
+
+
+def parse_event_detail(html: str, base_url: str) -> Event:
+    """イベント詳細ページから {"venue", "deadline", "body"} を取り出す（取れない項目は含めない）"""
+    if not html or not html.strip():
+        return {}
+    root = lxml.html.document_fromstring(html)
+    found = root.xpath(_DETAIL_BODY_XPATH)
+    container = found[0] if found else (root.find("body") if root.find("body") is not None else root)
+
+    out: Event = {}
+    # dt/dd・th/td の組
+    for label_el in container.iter("dt", "th"):
+        field = _detail_field(_text(label_el))
+        value_el = label_el.getnext()
+        while value_el is not None and not isinstance(value_el.tag, str):
+            value_el = value_el.getnext()
+        if field and field not in out and value_el is not None and value_el.tag in ("dd", "td"):
+            value = " ".join(" ".join(_iter_strings(value_el)).split())
+            if value:
+                out[field] = value
+    # 「会場：東京校」のような1行
+    for line in _iter_strings(container):
+        key, sep, value = line.strip().replace("：", ":").partition(":")
+        field = _detail_field(key) if sep else None
+        if field and field not in out and value.strip():
+            out[field] = value.strip()
+
+    body = " ".join(" ".join(_iter_strings(container)).split())
+    if body:
+        out["body"] = body
+    return out
@@ -0,0 +1,281 @@
+# replay.py
+# 保存しておいた一覧ページ（スナップショット）を時刻順に解析し直し、それぞれの時点で
+# 送られていたはずの通知を JSONL に出す（LINE には送らない）。
+#   python replay.py snapshots/ --db seen.db               # 新しい既読DBを過去のページで埋める
+#   python replay.py archive.tar.gz --db /tmp/replay.db    # パーサ変更の回帰確認（出力を diff する）
+#
+# スナップショットの置き方（ディレクトリでも tar / tar.gz でもよい）:
+#   <root>/<source>/<時刻>.html  … source は SOURCES_FILE の name。root 直下のファイルは既定の取得先 ""
+#   時刻はファイル名の 20250107T0900 / 2025-01-07_09-00-00 などから取り、なければ更新時刻を使う。
+#   crawler のキャッシュ（.json: url / html / fetched_at）もそのまま読める
+import argparse
+import json
+import logging
+import os
+import re
+import sys
+import tarfile
+from contextlib import nullcontext, redirect_stdout
+from datetime import datetime
+from typing import List, NamedTuple, Optional
+
+import metrics
+import seen_store
+
+SUFFIXES = (".html", ".htm", ".json")
+# 1ワーカーあたり先に投入しておく件数（tar から読んだ本文をメモリに溜めすぎない）
+INFLIGHT_PER_WORKER = 4
+_TIME_RE = re.compile(r"(\d{4})-?(\d{2})-?(\d{2})(?:[T_ -]?(\d{2})[-:]?(\d{2})(?:[-:]?(\d{2}))?)?")
+
+
+class Snapshot(NamedTuple):
+    """at: 取得時刻（UNIX 秒） / source: 取得先の name / name: root からの相対パス /
+    member: 読み出すときの名前（tar 全体が1つのディレクトリに入っているときのメンバー名。それ以外は name）"""
+    at: float
+    source: str
+    name: str
+    member: str = ""
+
+    @property
+    def key(self):
+        return self.member or self.name
+
+
+def _time_from_name(name) -> Optional[float]:
+    m = _TIME_RE.search(os.path.basename(name))
+    if not m:
+        return None
+    try:
+        return datetime(*(int(g or 0) for g in m.groups())).timestamp()
+    except ValueError:
+        return None
+
+
+def _snapshot(rel, mtime) -> Snapshot:
+    parts = rel.split("/")
+    at = _time_from_name(rel)
+    return Snapshot(mtime if at is None else at, parts[-2] if len(parts) > 1 else "", rel)
+
+
+def collect(path) -> List[Snapshot]:
+    """path（ディレクトリか tar）のスナップショットを時刻順に並べる"""
+    found = []
+    if os.path.isdir(path):
+        for dirpath, _, files in os.walk(path):
+            for f in files:
+                if f.endswith(SUFFIXES):
+                    full = os.path.join(dirpath, f)
+                    rel = os.path.relpath(full, path).replace(os.sep, "/")
+                    found.append((rel, os.path.getmtime(full)))
+    else:
+        with tarfile.open(path, "r:*") as tar:
+            found = [(m.name, m.mtime) for m in tar if m.isfile() and m.name.endswith(SUFFIXES)]
+        # アーカイブ全体が1つのディレクトリに入っているなら、それを root とみなす
+        # （出力の name はディレクトリと同じ root からの相対パス。読み出しはメンバー名で）
+        tops = {n.split("/", 1)[0] for n, _ in found}
+        if len(tops) == 1 and all("/" in n for n, _ in found):
+            return sorted(_snapshot(n.split("/", 1)[1], t)._replace(member=n) for n, t in found)
+    return sorted(_snapshot(rel, mtime) for rel, mtime in found)
+
+
+def _read(path, names):
+    """(name, bytes) を読み出し順に返す。tar は先頭から1回だけ読む"""
+    if os.path.isdir(path):
+        for name in names:
+            yield name, None  # ワーカーが自分で読む
+        return
+    wanted = set(names)
+    with tarfile.open(path, "r:*") as tar:
+        for m in tar:
+            if m.name in wanted:
+                yield m.name, tar.extractfile(m).read()
+
+
+def _parse(root, name, data, base_url, strategy):
+    """子プロセス用: スナップショット1件を解析し、(イベント, 計測) を返す"""
+    from parsers import parse_events_generic
+    metrics.reset()
+    if data is None:
+        with open(os.path.join(root, name), "rb") as f:
+            data = f.read()
+    text = data.decode("utf-8", errors="replace")
+    if name.endswith(".json"):
+        entry = json.loads(text)  # crawler.DiskCache の形式
+        text, base_url = entry.get("html") or "", entry.get("url") or base_url
+    with metrics.span("parse"):
+        events = parse_events_generic(text, base_url or "", prefer=strategy)
+    metrics.count("events_parsed", len(events))
+    return events, metrics.snapshot()
+
+
+def parse_all(path, snapshots, targets, workers):
+    """各スナップショットを並列に解析し、(Snapshot, イベントか例外) を時刻順に返す。
+    targets は source -> (base_url, strategy)"""
+    order = {s.key: i for i, s in enumerate(snapshots)}
+    done, nxt = {}, 0
+
+    def job(name, data):
+        base_url, strategy = targets[snapshots[order[name]].source]
+        return path, name, data, base_url, strategy
+
+    def ready():
+        nonlocal nxt
+        while nxt in done:
+            yield snapshots[nxt], done.pop(nxt)
+            nxt += 1
+
+    def store(name, result):
+        if isinstance(result, tuple):
+            events, snap = result
+            metrics.merge(snap)
+            result = events
+        done[order[name]] = result
+
+    if workers <= 1:
+        for name, data in _read(path, order):
+            try:
+                store(name, _parse(*job(name, data)))
+            except Exception as e:
+                store(name, e)
+            yield from ready()
+        return
+
+    import multiprocessing
+    from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, wait
+
+    methods = multiprocessing.get_all_start_methods()
+    ctx = multiprocessing.get_context("fork" if "fork" in methods else None)
+    sys.stdout.flush()
+    sys.stderr.flush()
+    with ProcessPoolExecutor(max_workers=workers, mp_context=ctx) as pool:
+        pending = {}
+
+        def collect_done(block_until):
+            finished, _ = wait(pending, return_when=block_until)
+            for fut in finished:
+                name = pending.pop(fut)
+                try:
+                    store(name, fut.result())
+                except Exception as e:
+                    store(name, e)
+
+        for name, data in _read(path, order):
+            pending[pool.submit(_parse, *job(name, data))] = name
+            if len(pending) >= workers * INFLIGHT_PER_WORKER:
+                collect_done(FIRST_COMPLETED)
+                yield from ready()
+        while pending:
+            collect_done(FIRST_COMPLETED)
+            yield from ready()
+
+
+def replay(conn, path, snapshots, targets, renderer, out, workers=1, max_posts=0, limit=4900, near_dup=(0.0, 30)):
+    """時刻順に新着を抽出して既読にし、通知が出ていたはずのスナップショットを out に1行ずつ書く。
+    イベントが1件も取れなかったスナップショットも（セレクタ確認のため）書く。集計を返す。
+    near_dup は (NEAR_DUP_THRESHOLD, NEAR_DUP_DAYS)"""
+    threshold, days = near_dup
+    totals = {"snapshots": 0, "notifications": 0, "events_sent": 0, "empty": 0, "failed": 0}
+    for snap, events in parse_all(path, snapshots, targets, workers):
+        totals["snapshots"] += 1
+        at = datetime.fromtimestamp(snap.at)
+        record = {"at": at.isoformat(timespec="seconds"), "source": snap.source, "snapshot": snap.name}
+        if isinstance(events, Exception):
+            logging.error(f"{snap.name}: 解析に失敗しました: {events!r}")
+            totals["failed"] += 1
+            out.write(json.dumps({**record, "error": repr(events)}, ensure_ascii=False) + "\n")
+            continue
+        if not events:
+            logging.warning(f"{snap.name}: イベントが見つかりません")
+            totals["empty"] += 1
+            out.write(json.dumps({**record, "events": 0}, ensure_ascii=False) + "\n")
+            continue
+
+        with metrics.span("dedup"):
+            new_events = list(seen_store.iter_new(conn, events, snap.source))
+        metrics.count("events_new", len(new_events))
+        if threshold > 0 and new_events:
+            new_events = seen_store.skip_near_duplicates(conn, new_events, snap.source, threshold, days)
+        if not new_events:
+            continue
+        # main.notify と同じく MAX_POSTS を超えた分は既読にせず、次のスナップショットへ持ち越す
+        sent = new_events[:max_posts] if max_posts > 0 else new_events
+        with metrics.span("render"):
+            messages = renderer.chunks(sent, limit, at=at)
+        seen_store.mark_seen(conn, sent, snap.source)
+        if threshold > 0:
+            seen_store.index_titles(conn, sent, snap.source)
+        metrics.count("events_sent", len(sent))
+        totals["notifications"] += 1
+        totals["events_sent"] += len(sent)
+        out.write(json.dumps({
+            **record, "events": len(events), "new": len(new_events),
+            "sent": [{k: e.get(k) for k in ("title", "date", "link")} for e in sent],
+            "messages": messages,
+        }, ensure_ascii=False) + "\n")
+    return totals
+
+
+def _targets(config):
+    """source -> (base_url, strategy)。SOURCES_FILE があればその取得先、既定の取得先は EVENTS_URL"""
+    targets = {seen_store.DEFAULT_SOURCE: (config.site.events_url, None)}
+    if config.sources_file:
+        from sources import load_sources
+        for s in load_sources(config.sources_file, config.site):
+            targets[s.name] = (s.site.events_url, s.strategy)
+    return targets
+
+
+def _cli(argv):
+    ap = argparse.ArgumentParser(prog="replay.py", description="保存した一覧ページを解析し直し、出ていたはずの通知を JSONL に出す")
+    ap.add_argument("path", help="スナップショットのディレクトリか tar（.tar / .tar.gz 等）")
+    ap.add_argument("--db", default=os.getenv("DB_PATH", "seen.db"), help="既読DB（既定: $DB_PATH か seen.db）")
+    ap.add_argument("--out", default="replay.jsonl", help="出力する JSONL（- なら標準出力）")
+    ap.add_argument("--workers", type=int, default=os.cpu_count() or 1, help="解析のプロセス数")
+    ap.add_argument("--report", help="実行レポート（JSON）の出力先")
+    ap.add_argument("--base-url", help="基準URLが分からない取得先（SOURCES_FILE にない・EVENTS_URL 未設定）のリンクの基準URL")
+    args = ap.parse_args(argv)
+
+    from main import LINE_TEXT_MAX
+    from settings import load_settings
+    from templates import compile_renderer
+
+    logging.basicConfig(level=os.getenv("LOG_LEVEL", "INFO").upper(),
+                        format="%(asctime)s %(levelname)s: %(message)s")
+    config = load_settings()
+    snapshots = collect(args.path)
+    if not snapshots:
+        raise SystemExit(f"{args.path}: スナップショット（{' / '.join(SUFFIXES)}）が見つかりません")
+    sources = sorted({s.source for s in snapshots})
+    targets = _targets(config)
+    # 基準URLがないと相対リンクのまま id が作られ、本番の既読DBと一致しない（.json は url を持っている）
+    unknown = sorted({s.source for s in snapshots if not s.name.endswith(".json") and not targets.get(s.source, (None,))[0]})
+    if unknown and not args.base_url:
+        raise SystemExit(f"取得先 {', '.join(s or '(既定)' for s in unknown)} の基準URLが分かりません。"
+                         "SOURCES_FILE / EVENTS_URL を設定するか --base-url を指定してください")
+    for source in sources:
+        base_url, strategy = targets.get(source, (None, None))
+        targets[source] = (base_url or args.base_url, strategy)
+    logging.info(f"{len(snapshots)}件のスナップショット（取得先: {', '.join(s or '(既定)' for s in sources)}）を "
+                 f"{max(1, args.workers)} プロセスで解析します")
+
+    conn = seen_store.ensure_db(args.db)
+    out = sys.stdout if args.out == "-" else open(args.out, "w", encoding="utf-8")
+    try:
+        # 標準出力に JSONL を書くときは、途中の print（既読マーク等）を標準エラーへ
+        with redirect_stdout(sys.stderr) if out is sys.stdout else nullcontext():
+            totals = replay(conn, args.path, snapshots, targets, compile_renderer(config), out,
+                            args.workers, config.max_posts, LINE_TEXT_MAX,
+                            (config.near_dup_threshold, config.near_dup_days))
+    finally:
+        if out is not sys.stdout:
+            out.close()
+        seen_store.close(conn)
+    logging.info(f"スナップショット {totals['snapshots']}件: 通知 {totals['notifications']}回 / "
+                 f"送信イベント {totals['events_sent']}件 / イベントなし {totals['empty']}件 / 失敗 {totals['failed']}件"
+                 + (f" -> {args.out}" if args.out != "-" else ""))
+    metrics.emit(args.report, **totals)
+    return 1 if totals["failed"] else 0
+
+
+if __name__ == "__main__":
+    sys.exit(_cli(sys.argv[1:]))
@@ -1,143 +1,516 @@
 import os
-from playwright.sync_api import sync_playwright
-
-# 1. 環境変数の取得と表示
-print("--- 環境変数の設定確認 ---")
-LOGIN_URL  = os.getenv("LOGIN_URL")
-EVENTS_URL = os.getenv("EVENTS_URL")
-USER       = os.getenv("CCONSUL_ID")
-PASS       = os.getenv("CCCONSUL_PASSWORD") or os.getenv("CCONSUL_PASSWORD")  # 互換
-USER_AGENT = os.getenv("USER_AGENT", "Mozilla/5.0 (compatible; CConsulScraper/1.0)")
-WAIT_SELECTOR = os.getenv("WAIT_SELECTOR", "table, .events, .schedule, .list")
-HTML_FIXTURE = os.getenv("HTML_FIXTURE")
-
-print(f"LOGIN_URL: {LOGIN_URL}")
-print(f"EVENTS_URL: {EVENTS_URL}")
-print(f"USER (ID): {'***' if USER else '未設定'}")
-print(f"USER_AGENT: {USER_AGENT}")
-print(f"WAIT_SELECTOR: {WAIT_SELECTOR}")
-print("--------------------------")
+import json
+from typing import FrozenSet, NamedTuple, Optional, Tuple
+from urllib.parse import urlsplit
+
+import metrics
+
+# requests / playwright / lxml は使う経路（HTTPモード / ブラウザ）に入ったときに読み込む
+DEFAULT_WAIT_SELECTOR = "table, .events, .schedule, .list"
+
+
+class Site(NamedTuple):
+    """取得先1件ぶんの設定（環境変数からは settings.load_settings で作る）"""
+    login_url: Optional[str]
+    events_url: Optional[str]
+    user: Optional[str]
+    password: Optional[str]
+    wait_selector: str = DEFAULT_WAIT_SELECTOR
+    # ログイン済みセッション（cookie / localStorage）の保存先。None なら毎回ログイン
+    session_state: Optional[str] = None
+    html_fixture: Optional[str] = None
+
+
+class FetchOptions(NamedTuple):
+    """取得方法の設定（全取得先で共通）"""
+    user_agent: str = "Mozilla/5.0 (compatible; CConsulScraper/1.0)"
+    # "browser"（毎回Playwright） | "http"（ログイン後のcookieで素のHTTP GET）
+    fetch_mode: str = "browser"
+    # Playwright で読み込まないリソース種別（resource_type）。空にすると全て読み込む
+    block_resources: FrozenSet[str] = frozenset(("image", "media", "font", "stylesheet"))
+    # LOGIN_URL / EVENTS_URL と別ホストのスクリプトを読み込まない
+    block_third_party_scripts: bool = True
+    # 上記に関わらず常に読み込むURL（部分一致）
+    allow_urls: Tuple[str, ...] = ()
+    # wait_selector 全体で待つ最大時間（ミリ秒）
+    wait_timeout_ms: int = 8000
+
+
+def print_settings(site, options):
+    """取得まわりの設定を表示する（パスワードは出さない）"""
+    print("--- 環境変数の設定確認 ---")
+    print(f"LOGIN_URL: {site.login_url}")
+    print(f"EVENTS_URL: {site.events_url}")
+    print(f"USER (ID): {'***' if site.user else '未設定'}")
+    print(f"USER_AGENT: {options.user_agent}")
+    print(f"WAIT_SELECTOR: {site.wait_selector}")
+    print(f"SESSION_STATE: {site.session_state or '未設定'}")
+    print(f"FETCH_MODE: {options.fetch_mode}")
+    print(f"BLOCK_RESOURCES: {','.join(sorted(options.block_resources)) or 'なし'} / "
+          f"3rd-party script: {'ブロック' if options.block_third_party_scripts else '許可'}")
+    print("--------------------------")
+
+
+class FetchResult(NamedTuple):
+    """取得結果。not_modified=True（304）のとき html は None。
+    cookies はログイン済みセッションの cookie（Playwright 形式。詳細ページ等の取得用）"""
+    html: Optional[str]
+    final_url: str
+    etag: Optional[str] = None
+    last_modified: Optional[str] = None
+    not_modified: bool = False
+    cookies: Optional[list] = None
+
 
 def fetch_events_html():
-    # ★ 追加: フィクスチャ指定時はログインせずにローカルHTMLを返す
-    if HTML_FIXTURE:
-        with open(HTML_FIXTURE, "r", encoding="utf-8") as f:
-            html = f.read()
-        final_url = EVENTS_URL or "https://example.com/mypage/shigaku/schedule/events/"
-        return html, final_url
-
-    # （本番・検証用）従来どおりログインして取得
-    if not all([LOGIN_URL, EVENTS_URL, USER, PASS]):
-        print("エラー: 必要な環境変数が設定されていません。")
-        raise RuntimeError("環境変数 LOGIN_URL / EVENTS_URL / CCONSUL_ID / CCONSUL_PASSWORD を設定してください。")
-
-    print("Playwrightを起動します...")
-    with sync_playwright() as p:
-        browser = p.chromium.launch(headless=True)
-        print("ブラウザを起動しました。")
-        ctx = browser.new_context(user_agent=USER_AGENT)
-        page = ctx.new_page()
-        print(f"新しいページコンテキストを作成しました (User-Agent: {USER_AGENT})。")
-
-        # 2. ログインページへのアクセス
-        print(f"ログインURLへ移動中: {LOGIN_URL}")
+    """環境変数の設定でイベントページを取得し (html, final_url) を返す"""
+    from settings import load_settings
+    settings = load_settings()
+    result = fetch_events(site=settings.site, options=settings.fetch)
+    return result.html, result.final_url
+
+
+def fetch_events(validators=None, site=None, options=FetchOptions()) -> FetchResult:
+    """イベントページを1回取得する（ブラウザを使った場合は終了時に閉じる）。
+
+    validators に前回の {"etag", "last_modified"} を渡すと、HTTPモードでは
+    条件付きリクエストを送り、変更がなければ not_modified=True を返す。
+    """
+    with Fetcher(site, options) as fetcher:
+        return fetcher.fetch(validators)
+
+
+class Fetcher:
+    """イベントページの取得器。
+
+    ブラウザとログイン済みコンテキストは最初に必要になった時に起動し、close() まで
+    使い回す（watch モードでは取得のたびに起動・ログインし直さない）。
+    """
+
+    def __init__(self, site, options=FetchOptions()):
+        self.site = site
+        self.options = options
+        self._pw = None
+        self._browser = None
+        self._ctx = None
+        self._page = None
+        self._traffic = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def fetch(self, validators=None) -> FetchResult:
+        site = self.site
+        # ★ 追加: フィクスチャ指定時はログインせずにローカルHTMLを返す
+        if site.html_fixture:
+            with open(site.html_fixture, "r", encoding="utf-8") as f:
+                html = f.read()
+            final_url = site.events_url or "https://example.com/mypage/shigaku/schedule/events/"
+            return FetchResult(html, final_url)
+
+        # （本番・検証用）従来どおりログインして取得
+        if not all([site.login_url, site.events_url, site.user, site.password]):
+            print("エラー: 必要な環境変数が設定されていません。")
+            raise RuntimeError("環境変数 LOGIN_URL / EVENTS_URL / CCONSUL_ID / CCONSUL_PASSWORD を設定してください。")
+
+        # ★ HTTPモード: cookie が生きていればブラウザを起動せずに取得する
+        if self.options.fetch_mode == "http":
+            result = _fetch_via_http(site, self.options, validators)
+            if result is not None:
+                return result
+            print("HTTPでの取得ができなかったため、Playwrightでログインし直します。")
+
         try:
-            page.goto(LOGIN_URL, wait_until="domcontentloaded", timeout=30000)
-            print(f"ログインページに到達しました。現在のURL: {page.url}")
-        except Exception as e:
-            print(f"エラー: ログインURLへの移動中にタイムアウトまたはエラーが発生しました: {e}")
-            browser.close()
+            html, final_url, cookies = self._fetch_with_browser()
+        except Exception:
+            # 途中で失敗したコンテキストは次回作り直す
+            self._close_context()
             raise
+        return FetchResult(html, final_url, cookies=cookies)
 
-        # 3. ログイン処理
-        print("--- ログイン情報の入力開始 ---")
-        user_fields = ['input[name="username"]','input[name="loginId"]','#username','#login_id','input[type="email"]']
-        pass_fields = ['input[name="password"]','#password','input[type="password"]']
-        submit_btns = ['button[type="submit"]','input[type="submit"]','.btn-login','button:has-text("ログイン")']
-
-        user_filled = False
-        for sel in user_fields:
-            if page.locator(sel).count():
-                page.fill(sel, USER)
-                print(f"ユーザー名を入力しました。セレクタ: {sel}")
-                user_filled = True
-                break
-        if not user_filled:
-            print("警告: ユーザー名入力欄のセレクタが見つかりませんでした。")
-        
-        pass_filled = False
-        for sel in pass_fields:
-            if page.locator(sel).count():
-                page.fill(sel, PASS)
-                print(f"パスワードを入力しました。セレクタ: {sel}")
-                pass_filled = True
-                break
-        if not pass_filled:
-            print("警告: パスワード入力欄のセレクタが見つかりませんでした。")
-
-        submit_clicked = False
-        for sel in submit_btns:
-            if page.locator(sel).count():
-                page.click(sel)
-                print(f"ログインボタンをクリックしました。セレクタ: {sel}")
-                submit_clicked = True
-                break
+    def close(self):
+        self._close_context()
+        if self._browser is not None:
+            self._browser.close()
+            self._pw.stop()
+            self._browser = self._pw = None
+            print("ブラウザを閉じました。処理を終了します。")
+
+    def _close_context(self):
+        if self._ctx is not None:
+            try:
+                self._ctx.close()
+            except Exception:
+                pass
+        self._ctx = self._page = self._traffic = None
+
+    def _open_context(self):
+        if self._browser is None:
+            print("Playwrightを起動します...")
+            from playwright.sync_api import sync_playwright
+            self._pw = sync_playwright().start()
+            self._browser = self._pw.chromium.launch(headless=True)
+            print("ブラウザを起動しました。")
+
+        # ★ 保存済みセッションがあれば cookie / localStorage を復元してログインを省略する
+        state_path = self.site.session_state
+        user_agent = self.options.user_agent
+        reuse = bool(state_path) and os.path.exists(state_path)
+        ctx = None
+        if reuse:
+            try:
+                ctx = self._browser.new_context(user_agent=user_agent, storage_state=state_path)
+            except Exception as e:
+                print(f"警告: 保存済みセッションを読み込めませんでした（通常ログインします）: {e}")
+                reuse = False
+        if ctx is None:
+            ctx = self._browser.new_context(user_agent=user_agent)
+        self._ctx = ctx
+        self._traffic = _install_request_policy(ctx, self.site, self.options)
+        self._page = ctx.new_page()
+        print(f"新しいページコンテキストを作成しました (User-Agent: {user_agent})。")
+        if reuse:
+            print(f"保存済みセッションを使用します: {state_path}")
+        return reuse
+
+    def _fetch_with_browser(self):
+        if self._ctx is None:
+            reuse = self._open_context()
         else:
-            print("警告: 適切なログインボタンが見つからなかったため、Enterキーを押下します。")
-            page.keyboard.press("Enter")
-            submit_clicked = True
+            reuse = True  # 前回の取得でログイン済みのコンテキスト
+            print("既存のブラウザコンテキストを再利用します。")
+        site = self.site
+        ctx, page, traffic = self._ctx, self._page, self._traffic
+        traffic.update(allowed=0, blocked=0, blocked_by_type={}, bytes=0)
 
-        print("ログイン処理完了。次のページ読み込みを待機します...")
-        try:
-            page.wait_for_load_state("domcontentloaded", timeout=30000)
-            print(f"ログイン後のページ読み込み完了。現在のURL: {page.url}")
-        except Exception as e:
-            print(f"エラー: ログイン後のページ読み込み中にタイムアウトまたはエラーが発生しました: {e}")
-            # ログイ失敗の可能性
-            # browser.close()
-            # raise
-
-        # 4. イベントURLへのアクセス
-        print(f"イベントURLへ移動中: {EVENTS_URL}")
-        try:
-            page.goto(EVENTS_URL, wait_until="domcontentloaded", timeout=30000)
-            print(f"イベントページに到達しました。現在のURL: {page.url}")
-        except Exception as e:
-            print(f"エラー: イベントURLへの移動中にタイムアウトまたはエラーが発生しました: {e}")
-            browser.close()
-            raise
+        logged_in = False
+        if reuse:
+            _goto_events(page, site)
+            if _is_login_page(page, site):
+                print("セッションが切れていたため（ログインページへリダイレクト）、通常のログインを行います。")
+            else:
+                print("ログイン済みのセッションでイベントページに到達しました。ログインを省略します。")
+                logged_in = True
+
+        if not logged_in:
+            with metrics.span("login"):
+                _login(page, site)
+                _goto_events(page, site)
 
-        # 5. 待機セレクタの確認
-        wait_selectors = [s.strip() for s in WAIT_SELECTOR.split(",") if s.strip()]
+        # 5. 待機セレクタの確認（全セレクタをまとめて1回だけ待つ＝最初に現れたもので終了）
+        wait_selectors = [s.strip() for s in site.wait_selector.split(",") if s.strip()]
         print(f"表示完了を待機するセレクタ: {wait_selectors}")
-        
-        selector_found = False
-        for css in wait_selectors:
+
+        if wait_selectors:
             try:
-                print(f"セレクタ '{css}' の出現を待機中 (最大8秒)...")
-                page.wait_for_selector(css, timeout=8000)
-                print(f"セレクタ '{css}' が見つかりました。待機を終了します。")
-                selector_found = True
-                break
-            except:
-                print(f"セレクタ '{css}' は見つかりませんでした。次を試行します。")
-                pass
-        
-        if not selector_found and wait_selectors:
-            print("警告: 指定された待機セレクタがすべて見つからなかったため、ページの取得に進みます。")
+                timeout_ms = self.options.wait_timeout_ms
+                print(f"いずれかのセレクタの出現を待機中 (最大{timeout_ms / 1000:g}秒)...")
+                with metrics.span("wait_for_selector"):
+                    page.wait_for_selector(", ".join(wait_selectors), timeout=timeout_ms)
+                print("待機セレクタに該当する要素が見つかりました。待機を終了します。")
+            except Exception:
+                print("警告: 指定された待機セレクタがすべて見つからなかったため、ページの取得に進みます。")
 
-        # 6. HTMLの取得と終了
+        # 6. HTMLの取得
         print("ページのHTMLコンテンツを取得します...")
         html = page.content()
         final_url = page.url
-        
+
         print(f"最終的なURL: {final_url}")
         print(f"取得したHTMLの長さ: {len(html)} 文字")
+        _report_traffic(traffic)
+        metrics.count("bytes_received", traffic["bytes"])
+        metrics.count("requests_blocked", traffic["blocked"])
         #print(f"取得したHTML: {html} 文字")
-        
-        browser.close()
-        print("ブラウザを閉じました。処理を終了します。")
-        return html, final_url
+
+        # 7. 次回のためにセッションを保存（ログイン画面のままなら保存しない）
+        if _is_login_page(page, site):
+            if site.session_state:
+                print("警告: ログインページのままのため、セッションは保存しません。")
+        else:
+            if site.session_state:
+                _save_session(ctx, site.session_state)
+            if self.options.fetch_mode == "http":
+                load_cookies(_http_session(site, self.options), ctx.cookies())
+                print("ログイン済みcookieをHTTPセッションへ引き継ぎました。")
+
+        return html, final_url, ctx.cookies()
+
+
+def _install_request_policy(ctx, site, options):
+    """画像・フォント・CSS・外部スクリプト等を読み込まないようにする。統計を返す"""
+    stats = {"allowed": 0, "blocked": 0, "blocked_by_type": {}, "bytes": 0}
+    own_hosts = {urlsplit(u).hostname for u in (site.login_url, site.events_url) if u}
+
+    def handle(route):
+        req = route.request
+        url = req.url
+        rtype = req.resource_type
+        block = False
+        if not any(a in url for a in options.allow_urls):
+            if rtype in options.block_resources:
+                block = True
+            elif (rtype == "script" and options.block_third_party_scripts
+                  and urlsplit(url).hostname not in own_hosts):
+                block = True
+        if block:
+            stats["blocked"] += 1
+            stats["blocked_by_type"][rtype] = stats["blocked_by_type"].get(rtype, 0) + 1
+            route.abort()
+        else:
+            stats["allowed"] += 1
+            route.continue_()
+
+    def on_response(resp):
+        # 読み込んだリクエストの受信量（Content-Length があるものだけ）。
+        # ブロックしたリクエストは応答を受け取らないので大きさは分からず、節約量はここに含まれない
+        try:
+            stats["bytes"] += int(resp.headers.get("content-length") or 0)
+        except ValueError:
+            pass
+
+    if options.block_resources or options.block_third_party_scripts:
+        ctx.route("**/*", handle)
+    ctx.on("response", on_response)
+    return stats
+
+
+def _report_traffic(stats):
+    by_type = ", ".join(f"{k}={v}" for k, v in sorted(stats["blocked_by_type"].items())) or "なし"
+    print(f"リクエスト: 読み込み {stats['allowed']} 件 / ブロック {stats['blocked']} 件 ({by_type})")
+    print(f"読み込んだリクエストの受信量 (Content-Length 合計): {stats['bytes']:,} バイト")
+
+
+def _is_login_url(url, site) -> bool:
+    cur, login = urlsplit(url), urlsplit(site.login_url)
+    return (cur.netloc, cur.path.rstrip("/")) == (login.netloc, login.path.rstrip("/"))
+
+
+def _is_login_page(page, site) -> bool:
+    """ログインページにいる（＝セッション切れでリダイレクトされた）かを判定する"""
+    if _is_login_url(page.url, site):
+        return True
+    return page.locator('input[type="password"]').count() > 0
+
+
+# ---------- HTTPモード（ブラウザなし） ----------
+# 取得先（Site）ごとの requests.Session。アカウントごとに cookie を分ける
+_HTTP_SESSIONS = {}
+
+
+def _http_session(site, options):
+    """keep-alive する requests.Session（プロセス内で使い回す）"""
+    if site not in _HTTP_SESSIONS:
+        import requests
+        from requests.adapters import HTTPAdapter
+        s = requests.Session()
+        adapter = HTTPAdapter(pool_connections=4, pool_maxsize=8)
+        s.mount("https://", adapter)
+        s.mount("http://", adapter)
+        s.headers["User-Agent"] = options.user_agent
+        # 前回保存したセッションがあれば cookie を読み込む
+        if site.session_state and os.path.exists(site.session_state):
+            try:
+                with open(site.session_state, "r", encoding="utf-8") as f:
+                    load_cookies(s, json.load(f).get("cookies", []))
+            except (OSError, ValueError) as e:
+                print(f"警告: 保存済みセッションのcookieを読み込めませんでした: {e}")
+        _HTTP_SESSIONS[site] = s
+    return _HTTP_SESSIONS[site]
+
+
+def load_cookies(session, cookies):
+    """Playwright 形式の cookie（ctx.cookies() / storage_state）を requests に移す"""
+    for c in cookies:
+        expires = c.get("expires")
+        session.cookies.set(
+            c["name"], c["value"],
+            domain=c.get("domain", ""),
+            path=c.get("path", "/"),
+            secure=bool(c.get("secure")),
+            expires=int(expires) if expires and expires > 0 else None,
+            rest={"HttpOnly": None} if c.get("httpOnly") else {},
+        )
+
+
+def _dump_cookies(session):
+    """requests の cookie を Playwright 形式（load_cookies の逆）にする"""
+    return [{"name": c.name, "value": c.value, "domain": c.domain, "path": c.path,
+             "secure": c.secure, "expires": c.expires or -1,
+             "httpOnly": c.has_nonstandard_attr("HttpOnly")} for c in session.cookies]
+
+
+def _has_wait_marker(html, site) -> bool:
+    """HTML に WAIT_SELECTOR のいずれかに該当する要素があるか。
+    Playwright 専用のセレクタ（text=… や :has-text() など）は lxml では確かめられないので飛ばし、
+    ほかに該当がなければ False（ブラウザで取得し直す）"""
+    wait_selectors = [s.strip() for s in site.wait_selector.split(",") if s.strip()]
+    if not wait_selectors:
+        return True
+    import lxml.html
+    from cssselect import SelectorError
+    root = lxml.html.document_fromstring(html)
+    for css in wait_selectors:
+        try:
+            if root.cssselect(css):
+                return True
+        except SelectorError:
+            print(f"警告: 待機セレクタ {css!r} はHTTPモードでは確認できません"
+                  "（Playwright専用の書き方のため）。ほかに該当がなければブラウザで取得します。")
+    return False
+
+
+def _save_http_session(session, path):
+    """HTTPモードで更新された cookie を保存済みセッション（storage_state 形式）へ書き戻す"""
+    state = {"cookies": [], "origins": []}
+    try:
+        with open(path, "r", encoding="utf-8") as f:
+            state.update(json.load(f))
+    except (OSError, ValueError):
+        pass
+    # ブラウザが保存した項目（sameSite など）は残し、値・期限だけ新しいものにする
+    saved = {(c.get("name"), c.get("domain"), c.get("path")): c for c in state["cookies"]}
+    cookies = [{**saved.get((c["name"], c["domain"], c["path"]), {}), **c} for c in _dump_cookies(session)]
+    if cookies == state["cookies"]:
+        return
+    state["cookies"] = cookies
+    with open(path, "w", encoding="utf-8") as f:
+        json.dump(state, f, ensure_ascii=False)
+    try:
+        os.chmod(path, 0o600)  # cookie を含むので本人以外読めないように
+    except OSError:
+        pass
+    print(f"HTTPモード: 更新されたcookieをセッションに保存しました: {path}")
+
+
+def _fetch_via_http(site, options, validators=None):
+    """cookie だけで EVENTS_URL を GET する。セッション切れなら None"""
+    import requests
+    session = _http_session(site, options)
+    if not session.cookies:
+        print("HTTPモード: 有効なcookieがありません。")
+        return None
+
+    # 前回の ETag / Last-Modified があれば条件付きリクエストにする
+    headers = {}
+    if validators:
+        if validators.get("etag"):
+            headers["If-None-Match"] = validators["etag"]
+        if validators.get("last_modified"):
+            headers["If-Modified-Since"] = validators["last_modified"]
+
+    print(f"HTTPモード: イベントURLへGET中: {site.events_url}")
+    try:
+        r = session.get(site.events_url, headers=headers, timeout=30)
+    except requests.RequestException as e:
+        print(f"HTTPモード: 取得中にエラーが発生しました: {e}")
+        return None
+    metrics.count("bytes_received", len(r.content))
+    print(f"HTTPモード: ステータス {r.status_code} / 最終URL: {r.url}")
+
+    if r.status_code == 304:
+        print("HTTPモード: 304 Not Modified（前回から変更なし）")
+        if site.session_state:
+            _save_http_session(session, site.session_state)
+        return FetchResult(None, r.url,
+                           r.headers.get("ETag") or validators.get("etag"),
+                           r.headers.get("Last-Modified") or validators.get("last_modified"),
+                           not_modified=True, cookies=_dump_cookies(session))
+    if r.status_code != 200:
+        return None
+    if _is_login_url(r.url, site):
+        print("HTTPモード: ログインページへリダイレクトされました（セッション切れ）。")
+        return None
+    if "charset" not in r.headers.get("Content-Type", "").lower():
+        r.encoding = r.apparent_encoding
+    html = r.text
+    if not html.strip() or not _has_wait_marker(html, site):
+        print("HTTPモード: 待機セレクタに該当する要素がありません（セッション切れの可能性）。")
+        return None
+
+    print(f"取得したHTMLの長さ: {len(html)} 文字")
+    if site.session_state:
+        _save_http_session(session, site.session_state)
+    return FetchResult(html, r.url, r.headers.get("ETag"), r.headers.get("Last-Modified"),
+                       cookies=_dump_cookies(session))
+
+
+def _save_session(ctx, path):
+    ctx.storage_state(path=path)
+    try:
+        os.chmod(path, 0o600)  # cookie を含むので本人以外読めないように
+    except OSError:
+        pass
+    print(f"セッションを保存しました: {path}")
+
+
+def _goto_events(page, site):
+    # 4. イベントURLへのアクセス
+    print(f"イベントURLへ移動中: {site.events_url}")
+    try:
+        page.goto(site.events_url, wait_until="domcontentloaded", timeout=30000)
+        print(f"イベントページに到達しました。現在のURL: {page.url}")
+    except Exception as e:
+        print(f"エラー: イベントURLへの移動中にタイムアウトまたはエラーが発生しました: {e}")
+        raise
+
+
+def _login(page, site):
+    # 2. ログインページへのアクセス
+    print(f"ログインURLへ移動中: {site.login_url}")
+    try:
+        page.goto(site.login_url, wait_until="domcontentloaded", timeout=30000)
+        print(f"ログインページに到達しました。現在のURL: {page.url}")
+    except Exception as e:
+        print(f"エラー: ログインURLへの移動中にタイムアウトまたはエラーが発生しました: {e}")
+        raise
+
+    # 3. ログイン処理
+    print("--- ログイン情報の入力開始 ---")
+    user_fields = ['input[name="username"]','input[name="loginId"]','#username','#login_id','input[type="email"]']
+    pass_fields = ['input[name="password"]','#password','input[type="password"]']
+    submit_btns = ['button[type="submit"]','input[type="submit"]','.btn-login','button:has-text("ログイン")']
+
+    user_filled = False
+    for sel in user_fields:
+        if page.locator(sel).count():
+            page.fill(sel, site.user)
+            print(f"ユーザー名を入力しました。セレクタ: {sel}")
+            user_filled = True
+            break
+    if not user_filled:
+        print("警告: ユーザー名入力欄のセレクタが見つかりませんでした。")
+
+    pass_filled = False
+    for sel in pass_fields:
+        if page.locator(sel).count():
+            page.fill(sel, site.password)
+            print(f"パスワードを入力しました。セレクタ: {sel}")
+            pass_filled = True
+            break
+    if not pass_filled:
+        print("警告: パスワード入力欄のセレクタが見つかりませんでした。")
+
+    for sel in submit_btns:
+        if page.locator(sel).count():
+            page.click(sel)
+            print(f"ログインボタンをクリックしました。セレクタ: {sel}")
+            break
+    else:
+        print("警告: 適切なログインボタンが見つからなかったため、Enterキーを押下します。")
+        page.keyboard.press("Enter")
+
+    print("ログイン処理完了。次のページ読み込みを待機します...")
+    try:
+        page.wait_for_load_state("domcontentloaded", timeout=30000)
+        print(f"ログイン後のページ読み込み完了。現在のURL: {page.url}")
+    except Exception as e:
+        print(f"エラー: ログイン後のページ読み込み中にタイムアウトまたはエラーが発生しました: {e}")
+        # ログイン失敗の可能性
+
 
 # スクリプトとして実行された場合のログを追記することもできます
 if __name__ == '__main__':
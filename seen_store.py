@@ -0,0 +1,452 @@
+# seen_store.py
+# 既読イベント（seen）と取得状態（fetch_state）を保存する SQLite ストア
+import hashlib
+import json
+import logging
+from array import array
+from itertools import islice
+import os
+import sqlite3
+import sys
+
+from changes import event_key
+from identity import band_keys, identity_basis, normalize_date, signature, similarity
+
+# 1回の IN (...) に入れる件数（SQLite の変数上限 999 より十分小さく）
+CHUNK_SIZE = 500
+# id は SHA-256 の先頭16バイト（BLOB）。旧形式は64文字の16進 TEXT
+ID_BYTES = 16
+# 既読は取得先（source）ごとに管理する。環境変数だけで動かす従来の1ページ構成は ""
+DEFAULT_SOURCE = ""
+_SEEN_SCHEMA = """CREATE TABLE IF NOT EXISTS seen(
+        source TEXT NOT NULL DEFAULT '', id BLOB NOT NULL,
+        created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+        PRIMARY KEY(source, id)
+    ) WITHOUT ROWID"""
+# タイトルの類似インデックス（near_sig: 署名 / near_band: LSH の帯キー -> id）。
+# 既読にしたイベントだけを入れ、seen から消えた id は prune のときに一緒に消す
+_NEAR_SCHEMA = (
+    """CREATE TABLE IF NOT EXISTS near_sig(
+        source TEXT NOT NULL, id BLOB NOT NULL, sig BLOB NOT NULL, title TEXT,
+        created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+        PRIMARY KEY(source, id)
+    ) WITHOUT ROWID""",
+    """CREATE TABLE IF NOT EXISTS near_band(
+        source TEXT NOT NULL, band INTEGER NOT NULL, id BLOB NOT NULL,
+        PRIMARY KEY(source, band, id)
+    ) WITHOUT ROWID""",
+)
+# 前回取得時の ETag / Last-Modified と一覧部分のハッシュ（変更なし判定用）。
+# 同じ URL でもアカウントが違えば内容が違うので、seen と同じく取得先ごとに持つ
+_FETCH_STATE_SCHEMA = """CREATE TABLE IF NOT EXISTS fetch_state(
+        source TEXT NOT NULL DEFAULT '', url TEXT NOT NULL, etag TEXT, last_modified TEXT, digest TEXT,
+        updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+        PRIMARY KEY(source, url)
+    )"""
+# 取得先ごとの前回の一覧（changes.event_key -> イベントの JSON）。NOTIFY_CHANGES のときだけ使う
+_SNAPSHOT_SCHEMA = """CREATE TABLE IF NOT EXISTS event_snapshot(
+        source TEXT NOT NULL, key TEXT NOT NULL, event TEXT NOT NULL,
+        updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+        PRIMARY KEY(source, key)
+    ) WITHOUT ROWID"""
+# 保存しておく抽出レシピの数（古いものから消す）
+RECIPES_KEEP = 200
+# 空きページがこの割合を超えたら VACUUM する
+VACUUM_FREE_RATIO = 0.25
+
+
+def ensure_db(path):
+    logging.info(f"データベース接続/初期化開始: {path}")
+    conn = sqlite3.connect(path)
+    # WAL + synchronous=NORMAL: 1回の書き込みトランザクションあたりの fsync を減らす
+    conn.execute("PRAGMA journal_mode=WAL")
+    conn.execute("PRAGMA synchronous=NORMAL")
+    conn.execute("PRAGMA temp_store=MEMORY")
+    _migrate_seen(conn)
+    conn.execute(_SEEN_SCHEMA)
+    _migrate_fetch_state(conn)
+    conn.execute(_FETCH_STATE_SCHEMA)
+    # ページ構造の指紋 -> イベントを取れた抽出レシピ（parsers.parse_page）
+    conn.execute(
+        """CREATE TABLE IF NOT EXISTS parse_recipe(
+        fingerprint TEXT PRIMARY KEY, recipe TEXT NOT NULL,
+        updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+    )"""
+    )
+    for ddl in _NEAR_SCHEMA:
+        conn.execute(ddl)
+    conn.execute(_SNAPSHOT_SCHEMA)
+    conn.commit()
+    logging.info("データベース 'seen' テーブルの存在確認/作成完了")
+    return conn
+
+
+def _migrate_seen(conn):
+    """旧形式の seen テーブルを (source, id BLOB 16バイト) 形式へ移行する。
+
+    - 初期形式: id TEXT（16進64文字）のみ
+    - source 列のない形式: id BLOB のみ
+    """
+    cols = {row[1]: row[2] for row in conn.execute("PRAGMA table_info(seen)")}
+    if not cols or "source" in cols:
+        return
+    text_ids = cols.get("id", "").upper() == "TEXT"
+    rows = conn.execute("SELECT id, created_at FROM seen").fetchall()
+    logging.info(f"seen テーブルを新形式へ移行します: {len(rows)}件")
+    with conn:
+        conn.execute("ALTER TABLE seen RENAME TO seen_old")
+        conn.execute(_SEEN_SCHEMA)
+        conn.executemany(
+            "INSERT OR IGNORE INTO seen(source, id, created_at) VALUES(?, ?, ?)",
+            ((DEFAULT_SOURCE, bytes.fromhex(i)[:ID_BYTES] if text_ids else i, ts) for i, ts in rows),
+        )
+        conn.execute("DROP TABLE seen_old")
+    conn.execute("VACUUM")
+    logging.info("seen テーブルの移行完了")
+
+
+def _migrate_fetch_state(conn):
+    """url だけをキーにした旧形式の fetch_state を (source, url) 形式へ移行する。
+    旧形式の行は既定の取得先 "" のものとして引き継ぐ（他の取得先は次回一覧を処理し直すだけ）"""
+    cols = {row[1] for row in conn.execute("PRAGMA table_info(fetch_state)")}
+    if not cols or "source" in cols:
+        return
+    with conn:
+        conn.execute("ALTER TABLE fetch_state RENAME TO fetch_state_old")
+        conn.execute(_FETCH_STATE_SCHEMA)
+        conn.execute("""INSERT INTO fetch_state(source, url, etag, last_modified, digest, updated_at)
+            SELECT ?, url, etag, last_modified, digest, updated_at FROM fetch_state_old""", (DEFAULT_SOURCE,))
+        conn.execute("DROP TABLE fetch_state_old")
+    logging.info("fetch_state テーブルを取得先ごとの形式へ移行しました")
+
+
+def uid_from_event(e):
+    """正規化した タイトル|日付|リンク（identity.identity_basis）の SHA-256 先頭 ID_BYTES バイト"""
+    return hashlib.sha256(identity_basis(e).encode("utf-8")).digest()[:ID_BYTES]
+
+
+def _raw_uid(e):
+    """正規化を入れる前の id（その頃に既読にしたイベントの照合用）"""
+    basis = f"{e.get('title','')}|{e.get('date','')}|{e.get('link','')}"
+    return hashlib.sha256(basis.encode("utf-8")).digest()[:ID_BYTES]
+
+
+def seen_ids(conn, uids, source=DEFAULT_SOURCE):
+    """uids のうち既に seen にあるものの集合（CHUNK_SIZE 件ずつ IN で問い合わせ）"""
+    uids = list(dict.fromkeys(uids))
+    found = set()
+    for i in range(0, len(uids), CHUNK_SIZE):
+        chunk = uids[i:i + CHUNK_SIZE]
+        marks = ",".join("?" * len(chunk))
+        found.update(r[0] for r in conn.execute(
+            f"SELECT id FROM seen WHERE source=? AND id IN ({marks})", [source, *chunk]))
+    return found
+
+
+def iter_new(conn, events, source=DEFAULT_SOURCE):
+    """events（リストでもジェネレータでもよい）を CHUNK_SIZE 件ずつ照合し、
+    未読のものだけを返す。各イベントには _uid を付ける。
+    parsers.iter_events と組み合わせると、ページ全体を持たずに新着を取り出せる。
+    正規化前の id で既読になっているものは既読とみなし、新しい id も登録する"""
+    it = iter(events)
+    while True:
+        chunk = list(islice(it, CHUNK_SIZE))
+        if not chunk:
+            return
+        for e in chunk:
+            e["_uid"] = uid_from_event(e)
+        known = seen_ids(conn, (e["_uid"] for e in chunk), source)
+        rest = {_raw_uid(e): e for e in chunk if e["_uid"] not in known}
+        legacy = seen_ids(conn, rest, source) if rest else ()
+        if legacy:
+            with conn:
+                conn.executemany("INSERT OR IGNORE INTO seen(source, id) VALUES(?, ?)",
+                                 ((source, rest[r]["_uid"]) for r in legacy))
+            known.update(rest[r]["_uid"] for r in legacy)
+        for e in chunk:
+            if e["_uid"] not in known:
+                yield e
+
+
+def filter_new(conn, events, source=DEFAULT_SOURCE):
+    print(f"新着イベントのフィルタリング開始: 全{len(events)}件")
+    out = list(iter_new(conn, events, source))
+    print(f"新着イベントのフィルタリング完了: {len(out)}件抽出されました")
+    return out
+
+
+def mark_seen(conn, events, source=DEFAULT_SOURCE):
+    print(f"既読としてマークするイベント数: {len(events)}件")
+    with conn:
+        conn.executemany("INSERT OR IGNORE INTO seen(source, id) VALUES(?, ?)",
+                         ((source, e["_uid"]) for e in events))
+    print("既読イベントのデータベース登録完了 (コミット済み)")
+
+
+def load_fetch_state(conn, url, source=DEFAULT_SOURCE):
+    row = conn.execute(
+        "SELECT etag, last_modified, digest FROM fetch_state WHERE source=? AND url=?", (source, url)
+    ).fetchone()
+    if not row:
+        return {}
+    return {"etag": row[0], "last_modified": row[1], "digest": row[2]}
+
+
+def save_fetch_state(conn, url, etag, last_modified, digest, source=DEFAULT_SOURCE):
+    conn.execute(
+        """INSERT INTO fetch_state(source, url, etag, last_modified, digest, updated_at)
+        VALUES(?, ?, ?, ?, ?, CURRENT_TIMESTAMP)
+        ON CONFLICT(source, url) DO UPDATE SET etag=excluded.etag,
+            last_modified=excluded.last_modified, digest=excluded.digest,
+            updated_at=excluded.updated_at""",
+        (source, url, etag, last_modified, digest),
+    )
+    conn.commit()
+
+
+def load_recipes(conn):
+    """{指紋: レシピ(dict)}"""
+    return {fp: json.loads(recipe) for fp, recipe in conn.execute("SELECT fingerprint, recipe FROM parse_recipe")}
+
+
+def save_recipe(conn, fingerprint, recipe):
+    with conn:
+        conn.execute(
+            """INSERT INTO parse_recipe(fingerprint, recipe, updated_at) VALUES(?, ?, CURRENT_TIMESTAMP)
+            ON CONFLICT(fingerprint) DO UPDATE SET recipe=excluded.recipe, updated_at=excluded.updated_at""",
+            (fingerprint, json.dumps(recipe, ensure_ascii=False, sort_keys=True)),
+        )
+        conn.execute(
+            """DELETE FROM parse_recipe WHERE fingerprint NOT IN (
+                SELECT fingerprint FROM parse_recipe ORDER BY updated_at DESC LIMIT ?)""",
+            (RECIPES_KEEP,),
+        )
+
+
+# ---------- 前回の一覧（スナップショット） ----------
+def load_snapshot(conn, source=DEFAULT_SOURCE):
+    """{changes.event_key: イベント(dict)}"""
+    return {key: json.loads(event) for key, event in
+            conn.execute("SELECT key, event FROM event_snapshot WHERE source=?", (source,))}
+
+
+def save_snapshot_diff(conn, source, diff):
+    """changes.EventDiff の分だけスナップショットを書き換える（変わっていない行には触れない）"""
+    upsert = [(source, event_key(e), json.dumps({k: v for k, v in e.items() if not k.startswith("_")},
+                                                 ensure_ascii=False, sort_keys=True))
+              for e in [*diff.added, *(c.event for c in diff.changed)]]
+    with conn:
+        conn.executemany(
+            """INSERT INTO event_snapshot(source, key, event, updated_at) VALUES(?, ?, ?, CURRENT_TIMESTAMP)
+            ON CONFLICT(source, key) DO UPDATE SET event=excluded.event, updated_at=excluded.updated_at""",
+            upsert)
+        conn.executemany("DELETE FROM event_snapshot WHERE source=? AND key=?",
+                         ((source, event_key(e)) for e in diff.removed))
+
+
+# ---------- タイトルの類似インデックス ----------
+def split_near_duplicates(conn, events, source=DEFAULT_SOURCE, threshold=0.8, max_age_days=30):
+    """events を (通知するもの, 最近 max_age_days 日に既読にしたイベントとほぼ同じもの) に分ける。
+
+    同じ日付でタイトルの推定類似度が threshold 以上なら「ほぼ同じ」とし、
+    そのイベントに _near = (似ていた既読イベントのタイトル, 類似度) を付ける。
+    照合は LSH の帯キーの索引を引くので、インデックスの件数によらずほぼ一定の時間で済む"""
+    fresh, dups = [], []
+    for e in events:
+        sig = signature(e.get("title"))
+        best = None
+        if sig is not None:
+            keys = band_keys(sig, normalize_date(e.get("date")))
+            marks = ",".join("?" * len(keys))
+            rows = conn.execute(
+                f"""SELECT s.title, s.sig FROM near_sig s WHERE s.source=? AND s.id IN (
+                    SELECT id FROM near_band WHERE source=? AND band IN ({marks}))
+                AND s.created_at >= datetime('now', ?)""",
+                [source, source, *keys, f"-{int(max_age_days)} days"])
+            for title, raw in rows:
+                score = similarity(sig, array("I", raw))
+                if score >= threshold and (best is None or score > best[1]):
+                    best = (title, score)
+        if best:
+            e["_near"] = best
+            dups.append(e)
+        else:
+            fresh.append(e)
+    return fresh, dups
+
+
+def index_titles(conn, events, source=DEFAULT_SOURCE):
+    """既読にしたイベントのタイトルを類似インデックスに入れる（_uid が付いていること）"""
+    sigs, bands = [], []
+    for e in events:
+        sig = signature(e.get("title"))
+        if sig is None:
+            continue
+        sigs.append((source, e["_uid"], sig.tobytes(), e.get("title")))
+        bands.extend((source, k, e["_uid"]) for k in band_keys(sig, normalize_date(e.get("date"))))
+    with conn:
+        conn.executemany("INSERT OR IGNORE INTO near_sig(source, id, sig, title) VALUES(?, ?, ?, ?)", sigs)
+        conn.executemany("INSERT OR IGNORE INTO near_band(source, band, id) VALUES(?, ?, ?)", bands)
+
+
+def skip_near_duplicates(conn, events, source=DEFAULT_SOURCE, threshold=0.8, max_age_days=30):
+    """ほぼ同じイベントを通知対象から外して既読にし、残りを返す（NEAR_DUP_THRESHOLD）"""
+    fresh, dups = split_near_duplicates(conn, events, source, threshold, max_age_days)
+    for e in dups:
+        title, score = e["_near"]
+        logging.info(f"既読のイベントとほぼ同じため通知しません: 「{e.get('title')}」≒「{title}」（類似度 {score:.2f}）")
+    if dups:
+        mark_seen(conn, dups, source)
+        index_titles(conn, dups, source)
+    return fresh
+
+
+def _prune_near(conn):
+    """seen から消えた id を類似インデックスからも消す"""
+    conn.execute("""DELETE FROM near_sig WHERE NOT EXISTS (
+        SELECT 1 FROM seen WHERE seen.source = near_sig.source AND seen.id = near_sig.id)""")
+    conn.execute("""DELETE FROM near_band WHERE NOT EXISTS (
+        SELECT 1 FROM near_sig WHERE near_sig.source = near_band.source AND near_sig.id = near_band.id)""")
+
+
+# ---------- 保持期間・圧縮 ----------
+def prune(conn, max_age_days=None, keep_last=None, keep=(), source=None):
+    """古い既読idを削除する。削除件数を返す。
+
+    max_age_days : created_at がこれより古いものを削除
+    keep_last    : source ごとに、新しい順にこの件数だけ残す
+    keep         : 条件に関わらず残す id（いま一覧に載っているイベントなど。
+                   消すと次回また「新着」扱いになるため）
+    source       : 対象の source（None なら全 source）
+    """
+    if max_age_days is None and keep_last is None:
+        return 0
+    with conn:
+        conn.execute("CREATE TEMP TABLE IF NOT EXISTS keep_ids(id BLOB PRIMARY KEY)")
+        conn.execute("DELETE FROM keep_ids")
+        conn.executemany("INSERT OR IGNORE INTO keep_ids(id) VALUES(?)", ((k,) for k in keep))
+        deleted = 0
+        if max_age_days is not None:
+            deleted += conn.execute(
+                """DELETE FROM seen WHERE created_at < datetime('now', ?1)
+                AND (?2 IS NULL OR source = ?2)
+                AND id NOT IN (SELECT id FROM keep_ids)""",
+                (f"-{int(max_age_days)} days", source),
+            ).rowcount
+        if keep_last is not None:
+            deleted += conn.execute(
+                """DELETE FROM seen WHERE (source, id) IN (
+                    SELECT source, id FROM (
+                        SELECT source, id, ROW_NUMBER() OVER (
+                            PARTITION BY source ORDER BY created_at DESC) AS rn
+                        FROM seen WHERE (?1 IS NULL OR source = ?1))
+                    WHERE rn > ?2)
+                AND id NOT IN (SELECT id FROM keep_ids)""",
+                (source, int(keep_last)),
+            ).rowcount
+        if deleted:
+            _prune_near(conn)
+    if deleted:
+        logging.info(f"保持期間外の既読idを削除しました: {deleted}件")
+    return deleted
+
+
+def compact(conn, force=False):
+    """空きページが多ければ VACUUM する。実行したら True"""
+    page_count = conn.execute("PRAGMA page_count").fetchone()[0]
+    freelist = conn.execute("PRAGMA freelist_count").fetchone()[0]
+    if not force and (not page_count or freelist / page_count <= VACUUM_FREE_RATIO):
+        return False
+    conn.execute("VACUUM")
+    conn.execute("PRAGMA optimize")
+    logging.info(f"VACUUM 完了 (空きページ {freelist}/{page_count})")
+    return True
+
+
+def size_report(conn):
+    rows, oldest, newest = conn.execute(
+        "SELECT COUNT(*), MIN(created_at), MAX(created_at) FROM seen").fetchone()
+    by_source = dict(conn.execute("SELECT source, COUNT(*) FROM seen GROUP BY source ORDER BY source"))
+    page_size = conn.execute("PRAGMA page_size").fetchone()[0]
+    page_count = conn.execute("PRAGMA page_count").fetchone()[0]
+    freelist = conn.execute("PRAGMA freelist_count").fetchone()[0]
+    return {
+        "rows": rows, "oldest": oldest, "newest": newest, "by_source": by_source,
+        "bytes": page_size * page_count, "free_bytes": page_size * freelist,
+    }
+
+
+# ---------- ソート済みダイジェストファイル ----------
+def export_digests(conn, path):
+    """既読idを1行1件・昇順でテキスト出力する（git で差分が行単位になる）。
+    行は「16進id」、既定以外の source は「source<TAB>16進id」"""
+    n = 0
+    with open(path, "w", encoding="utf-8", newline="\n") as f:
+        for source, uid in conn.execute("SELECT source, id FROM seen ORDER BY source, id"):
+            f.write((f"{source}\t" if source else "") + uid.hex() + "\n")
+            n += 1
+    return n
+
+
+def import_digests(conn, path):
+    rows = []
+    with open(path, "r", encoding="utf-8") as f:
+        for line in f:
+            line = line.rstrip("\n")
+            if not line.strip():
+                continue
+            source, _, hexid = line.rpartition("\t")
+            rows.append((source, bytes.fromhex(hexid.strip())))
+    with conn:
+        before = conn.total_changes
+        conn.executemany("INSERT OR IGNORE INTO seen(source, id) VALUES(?, ?)", rows)
+        return conn.total_changes - before
+
+
+def close(conn):
+    """WAL をDB本体へ書き戻してから閉じる（seen.db 単体でコミットできるように）"""
+    conn.execute("PRAGMA wal_checkpoint(TRUNCATE)")
+    conn.close()
+
+
+def _cli(argv):
+    import argparse
+    ap = argparse.ArgumentParser(prog="seen_store.py", description="既読管理DBの保守")
+    ap.add_argument("--db", default=os.getenv("DB_PATH", "seen.db"), help="DBファイル（既定: $DB_PATH か seen.db）")
+    sub = ap.add_subparsers(dest="cmd", required=True)
+    sub.add_parser("report", help="件数とサイズを表示")
+    p = sub.add_parser("prune", help="保持ポリシーで古いidを削除")
+    p.add_argument("--max-age-days", type=int)
+    p.add_argument("--keep-last", type=int, help="source ごとに残す件数")
+    p.add_argument("--source", help="対象の source（省略時は全て）")
+    sub.add_parser("vacuum", help="VACUUM で圧縮")
+    sub.add_parser("export", help="ソート済みダイジェストファイルへ出力").add_argument("file")
+    sub.add_parser("import", help="ダイジェストファイルから取り込み").add_argument("file")
+    args = ap.parse_args(argv)
+
+    conn = ensure_db(args.db)
+    try:
+        if args.cmd == "report":
+            r = size_report(conn)
+            print(f"DB: {args.db}")
+            print(f"  既読id: {r['rows']:,} 件 ({r['oldest']} 〜 {r['newest']})")
+            for source, n in r["by_source"].items():
+                print(f"    {source or '(既定)'}: {n:,} 件")
+            print(f"  ファイル: {os.path.getsize(args.db):,} バイト / 空き: {r['free_bytes']:,} バイト")
+        elif args.cmd == "prune":
+            print(f"削除: {prune(conn, args.max_age_days, args.keep_last, source=args.source)} 件")
+            compact(conn)
+        elif args.cmd == "vacuum":
+            compact(conn, force=True)
+            print("VACUUM 完了")
+        elif args.cmd == "export":
+            print(f"出力: {export_digests(conn, args.file)} 件 -> {args.file}")
+        elif args.cmd == "import":
+            print(f"取り込み: {import_digests(conn, args.file)} 件 <- {args.file}")
+    finally:
+        close(conn)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(_cli(sys.argv[1:]))
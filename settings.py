@@ -0,0 +1,135 @@
+# settings.py
+# 環境変数から実行設定（Settings）を作る。読み込むのは load_settings() を呼んだときだけ
+import os
+from typing import Mapping, NamedTuple, Optional, Tuple
+
+from scraper_login import DEFAULT_WAIT_SELECTOR, FetchOptions, Site
+
+
+class Settings(NamedTuple):
+    """main.py の実行設定。既定値は環境変数が未設定のときの値"""
+    # LINE
+    token: Optional[str] = None
+    target_ids: Tuple[str, ...] = ()
+    use_broadcast: bool = True            # 友だち全員に broadcast
+    use_multicast: bool = True            # push モードで multicast にまとめる
+    # LINE のレート制限（チャネルごと）は push / broadcast が 2,000件/秒、multicast が 200件/秒。
+    # 1つの流量制御で両方を送るので、厳しい multicast に合わせる（0 で無効。429 は Retry-After に従って再送）
+    line_rate_per_sec: float = 200.0
+    line_rate_burst: int = 20
+    line_max_retries: int = 4
+    line_api_base: str = "https://api.line.me"  # 模擬サーバー（mock_line.py）で試すときに変える
+    # 実行モード
+    dry_run: bool = False
+    validate_only: bool = False
+    force_fetch: bool = False             # 前回から変更なしでも解析・通知処理を最後まで行う
+    watch: bool = False                   # 終了せずに watch_interval_sec ごとにチェックする
+    watch_interval_sec: float = 600.0
+    watch_jitter_sec: float = 60.0        # 毎回 0〜この秒数をランダムに足す
+    b_format_sample: bool = False         # サンプルイベントで整形プレビューだけ行う
+    b_send_sample: bool = False
+    # 既読DB
+    db_path: str = "seen.db"
+    max_posts: int = 0                    # 0 以下なら件数制限なし（長い通知は複数メッセージに分けて全件送る）
+    seen_max_age_days: Optional[int] = None
+    seen_keep_last: Optional[int] = None
+    near_dup_threshold: float = 0.0       # タイトルの類似度がこれ以上の既読イベントがあれば送らない（0で無効）
+    near_dup_days: int = 30               # 類似を調べる既読イベントの期間
+    notify_changes: bool = False          # 前回の一覧と比べ、日付などの変更と開催前の削除も通知する
+    # 取得先（sources_file がなければ site の1ページ構成）
+    site: Site = Site(None, None, None, None)
+    fetch: FetchOptions = FetchOptions()
+    sources_file: Optional[str] = None
+    source_workers: int = 4               # 並列に取得・解析するプロセス数（1なら順番に）
+    # クロール
+    crawl_max_pages: int = 1              # 1 ならページ送りしない
+    crawl_details: bool = False
+    crawl_workers: int = 4                # 同時に取得するページ数の上限
+    crawl_cache_dir: str = ".crawl_cache"
+    crawl_cache_ttl_sec: float = 86400.0  # 詳細ページをこの間は再取得しない
+    # 通知の整形
+    format_style: str = "list"            # "list" | "cards" | "compact"
+    header_title: str = "🎓 しがくイベント 新着"  # 後ろに（MM/DD時点）が付く
+    separator: str = "\n\n"
+    bullet: str = "● "
+    show_header: bool = True
+    detail_body_chars: int = 60           # 詳細本文の抜粋の文字数（0で出さない）
+    # 計測
+    run_report: Optional[str] = "run_report.json"  # 実行レポート（JSON）の出力先。空なら書かない
+
+    @property
+    def html_fixture(self) -> Optional[str]:
+        return self.site.html_fixture
+
+
+def _flag(env, name, default):
+    return env.get(name, "true" if default else "false").lower() == "true"
+
+
+def _list(env, name):
+    return tuple(s.strip() for s in env.get(name, "").split(",") if s.strip())
+
+
+def load_settings(env: Optional[Mapping[str, str]] = None) -> Settings:
+    """env（既定は os.environ）から Settings を作る"""
+    env = os.environ if env is None else env
+    d = Settings()
+    site = Site(
+        login_url=env.get("LOGIN_URL"),
+        events_url=env.get("EVENTS_URL"),
+        user=env.get("CCONSUL_ID"),
+        password=env.get("CCCONSUL_PASSWORD") or env.get("CCONSUL_PASSWORD"),  # 互換
+        wait_selector=env.get("WAIT_SELECTOR", DEFAULT_WAIT_SELECTOR),
+        session_state=env.get("SESSION_STATE"),
+        html_fixture=env.get("HTML_FIXTURE") or None,
+    )
+    fetch = FetchOptions(
+        user_agent=env.get("USER_AGENT", d.fetch.user_agent),
+        fetch_mode=env.get("FETCH_MODE", d.fetch.fetch_mode).lower(),
+        block_resources=frozenset(_list(env, "BLOCK_RESOURCES")) if "BLOCK_RESOURCES" in env
+        else d.fetch.block_resources,
+        block_third_party_scripts=_flag(env, "BLOCK_THIRD_PARTY_SCRIPTS", d.fetch.block_third_party_scripts),
+        allow_urls=_list(env, "ALLOW_URLS"),
+        wait_timeout_ms=int(env.get("WAIT_TIMEOUT_MS", d.fetch.wait_timeout_ms)),
+    )
+    return Settings(
+        token=env.get("LINE_CHANNEL_ACCESS_TOKEN"),
+        target_ids=_list(env, "TARGET_IDS"),
+        use_broadcast=_flag(env, "USE_BROADCAST", d.use_broadcast),
+        use_multicast=_flag(env, "USE_MULTICAST", d.use_multicast),
+        line_rate_per_sec=float(env.get("LINE_RATE_PER_SEC", d.line_rate_per_sec)),
+        line_rate_burst=int(env.get("LINE_RATE_BURST", d.line_rate_burst)),
+        line_max_retries=int(env.get("LINE_MAX_RETRIES", d.line_max_retries)),
+        line_api_base=env.get("LINE_API_BASE") or d.line_api_base,
+        dry_run=_flag(env, "DRY_RUN", d.dry_run),
+        validate_only=_flag(env, "VALIDATE_ONLY", d.validate_only),
+        force_fetch=_flag(env, "FORCE_FETCH", d.force_fetch),
+        watch=_flag(env, "WATCH", d.watch),
+        watch_interval_sec=float(env.get("WATCH_INTERVAL_SEC", d.watch_interval_sec)),
+        watch_jitter_sec=float(env.get("WATCH_JITTER_SEC", d.watch_jitter_sec)),
+        b_format_sample=_flag(env, "B_FORMAT_SAMPLE", d.b_format_sample),
+        b_send_sample=_flag(env, "B_SEND_SAMPLE", d.b_send_sample),
+        db_path=env.get("DB_PATH", d.db_path),
+        max_posts=int(env.get("MAX_POSTS", d.max_posts)),
+        seen_max_age_days=int(env.get("SEEN_MAX_AGE_DAYS", "0")) or None,
+        seen_keep_last=int(env.get("SEEN_KEEP_LAST", "0")) or None,
+        near_dup_threshold=float(env.get("NEAR_DUP_THRESHOLD", d.near_dup_threshold)),
+        near_dup_days=int(env.get("NEAR_DUP_DAYS", d.near_dup_days)),
+        notify_changes=_flag(env, "NOTIFY_CHANGES", d.notify_changes),
+        site=site,
+        fetch=fetch,
+        sources_file=env.get("SOURCES_FILE") or None,
+        source_workers=int(env.get("SOURCE_WORKERS", d.source_workers)),
+        crawl_max_pages=int(env.get("CRAWL_MAX_PAGES", d.crawl_max_pages)),
+        crawl_details=_flag(env, "CRAWL_DETAILS", d.crawl_details),
+        crawl_workers=int(env.get("CRAWL_WORKERS", d.crawl_workers)),
+        crawl_cache_dir=env.get("CRAWL_CACHE_DIR", d.crawl_cache_dir),
+        crawl_cache_ttl_sec=float(env.get("CRAWL_CACHE_TTL_SEC", d.crawl_cache_ttl_sec)),
+        format_style=env.get("FORMAT_STYLE", d.format_style),
+        header_title=env.get("HEADER_TITLE", d.header_title),
+        separator=env.get("SEPARATOR", d.separator),
+        bullet=env.get("BULLET", d.bullet),
+        show_header=_flag(env, "SHOW_HEADER", d.show_header),
+        detail_body_chars=int(env.get("DETAIL_BODY_CHARS", d.detail_body_chars)),
+        run_report=env.get("RUN_REPORT", d.run_report) or None,
+    )
@@ -0,0 +1,286 @@
+# sources.py
+# 複数の取得先（学校・ページ）を設定ファイルから読み込み、並列に取得・解析する
+import json
+import logging
+import os
+import signal
+import sys
+from typing import List, NamedTuple, Optional, Tuple
+
+import metrics
+from scraper_login import FetchOptions, FetchResult, Fetcher, Site
+
+# tomllib / parsers(lxml) / multiprocessing は使う関数の中で読み込む（import を軽く保つ）
+
+
+class Source(NamedTuple):
+    """取得先1件ぶんの設定。
+
+    name      : 既読DB（seen.source）のキー。既定の1ページ構成は ""
+    strategy  : 優先して試すパーサのストラテジ名（None なら自動）
+    targets   : push / multicast の宛先（空なら TARGET_IDS）
+    broadcast : True/False で USE_BROADCAST を上書き（None なら従う）
+    """
+    name: str
+    site: Site
+    strategy: Optional[str] = None
+    targets: Tuple[str, ...] = ()
+    broadcast: Optional[bool] = None
+
+
+def load_sources(path, base: Site) -> List[Source]:
+    """.toml / .json の設定ファイルを読む。
+
+    [defaults] の値は各 [[sources]] に引き継がれる。wait_selector / session_state の
+    既定は base（環境変数の設定）から取る。ID・パスワード・宛先はファイルに
+    書かず、user_env / password_env / targets_env で環境変数名を指定する。
+    """
+    from parsers import STRATEGIES
+    with open(path, "rb") as f:
+        if path.endswith(".toml"):
+            import tomllib
+            conf = tomllib.load(f)
+        else:
+            conf = json.load(f)
+
+    defaults = conf.get("defaults", {})
+    names = {s.name for s in STRATEGIES}
+    sources = []
+    for i, entry in enumerate(conf.get("sources", []), 1):
+        c = {**defaults, **entry}
+        name = c.get("name")
+        if not name:
+            raise ValueError(f"{path}: {i}件目の取得先に name がありません")
+        if any(s.name == name for s in sources):
+            raise ValueError(f"{path}: name '{name}' が重複しています")
+        if not (c.get("events_url") or c.get("html_fixture")):
+            raise ValueError(f"{path}: '{name}' に events_url がありません")
+        strategy = c.get("strategy")
+        if strategy is not None and strategy not in names:
+            raise ValueError(f"{path}: '{name}' の strategy '{strategy}' は未登録です（{', '.join(sorted(names))}）")
+
+        targets = c.get("targets") or []
+        if c.get("targets_env"):
+            targets = [s.strip() for s in os.getenv(c["targets_env"], "").split(",") if s.strip()]
+        site = Site(
+            login_url=c.get("login_url"),
+            events_url=c.get("events_url"),
+            user=os.getenv(c["user_env"]) if c.get("user_env") else None,
+            password=os.getenv(c["password_env"]) if c.get("password_env") else None,
+            wait_selector=c.get("wait_selector", base.wait_selector),
+            # 取得先ごとに別ファイルにしないとセッションが上書きし合う
+            session_state=c.get("session_state") or (_per_source(base.session_state, name) if base.session_state else None),
+            html_fixture=c.get("html_fixture"),
+        )
+        sources.append(Source(name, site, strategy, tuple(targets), c.get("broadcast")))
+    if not sources:
+        raise ValueError(f"{path}: [[sources]] が1件もありません")
+    return sources
+
+
+def _per_source(path, name) -> str:
+    """.session_state.json → .session_state.<name>.json（.gitignore の .session_state*.json に一致させる）"""
+    stem, suffix = os.path.splitext(path)
+    return f"{stem}.{name}{suffix}"
+
+
+class Scraped(NamedTuple):
+    """取得・解析の結果。変更なし（304 / ハッシュ一致）のとき events は None。
+    fingerprint / recipe はページ構造の指紋と、イベントを取れた抽出レシピ（保存用）。
+    inferred は推定したセレクタで初めて抽出したイベントか（parsers.ParseResult）"""
+    fetched: FetchResult
+    digest: Optional[str]
+    events: Optional[list]
+    fingerprint: Optional[str] = None
+    recipe: Optional[dict] = None
+    inferred: bool = False
+
+
+def scrape(source, state, options=FetchOptions(), fetcher=None, recipes=None) -> Scraped:
+    """1件の取得先を取得し、前回から変わっていれば解析する。
+
+    state は前回の {"etag", "last_modified", "digest"}（使わないなら {}）。
+    recipes は保存済みの抽出レシピ（seen_store.load_recipes。None なら使わない）。
+    fetcher を渡さなければその場で起動し、終わったら閉じる。
+    """
+    if fetcher is None:
+        with Fetcher(source.site, options) as fetcher:
+            return scrape(source, state, options, fetcher, recipes)
+    from parsers import STREAM_MIN_CHARS, ParseResult, content_digest, parse_page, scan_page
+
+    tag = f"[{source.name}] " if source.name else ""
+    # 1. イベント情報を含むHTMLを取得（前回の ETag 等があれば条件付き）
+    print(f"{tag}1. HTMLコンテンツの取得開始...")
+    with metrics.span("fetch"):
+        fetched = fetcher.fetch(validators=state)
+    if fetched.not_modified:
+        print(f"{tag}1. 前回から変更なし (304)。解析・通知をスキップします。")
+        return Scraped(fetched, None, None)
+    print(f"{tag}1. HTMLコンテンツの取得完了。最終URL: {fetched.final_url}")
+
+    # 一覧部分のハッシュが前回と同じなら、解析もDB照合も不要
+    # 大きなページはハッシュとイベントを1回のストリーミングパースで取る（一覧が変わっていなければイベントは捨てる）
+    large = len(fetched.html or "") >= STREAM_MIN_CHARS
+    with metrics.span("parse" if large else "digest"):
+        if large:
+            digest, events = scan_page(fetched.html, fetched.final_url, prefer=source.strategy)
+        else:
+            digest = content_digest(fetched.html)
+    if state.get("digest") and digest == state["digest"]:
+        print(f"{tag}1. イベント一覧の内容が前回と同一。解析・通知をスキップします。")
+        return Scraped(fetched, digest, None)
+
+    # 2. 取得したHTMLからイベント情報を解析し、イベントリストを取得
+    print(f"{tag}2. 取得したHTMLからのイベント情報解析開始...")
+    with metrics.span("parse"):
+        if large:
+            parsed = ParseResult(events, None, None)  # parse_page の大きなページと同じ（レシピは使わない）
+        else:
+            parsed = parse_page(fetched.html, fetched.final_url, prefer=source.strategy, recipes=recipes)
+    events = parsed.events
+    metrics.count("events_parsed", len(events))
+    if parsed.cached:
+        metrics.count("recipe_hits")
+    print(f"{tag}2. イベント情報解析完了。見つかったイベント数: {len(events)}件")
+    return Scraped(fetched, digest, events, parsed.fingerprint, parsed.recipe, parsed.inferred)
+
+
+def _source_worker(conn, source, options):
+    """常駐プロセス: 取得先1件の Fetcher を持ち続け、(state, recipes) を受け取るたびに scrape して
+    (Scraped, 計測) か例外を返す。None を受け取るか親が終了（EOF）したら Fetcher を閉じて終わる"""
+    signal.signal(signal.SIGINT, signal.SIG_IGN)  # Ctrl+C は親が受け、チェックの区切りで閉じに来る
+    with Fetcher(source.site, options) as fetcher:
+        while True:
+            try:
+                msg = conn.recv()
+            except EOFError:
+                break
+            if msg is None:
+                break
+            state, recipes = msg
+            metrics.reset()  # 前回（初回は fork で複製された親）の記録は捨てる
+            try:
+                result = (scrape(source, state, options, fetcher, recipes), metrics.snapshot())
+            except Exception as e:
+                result = e
+            try:
+                conn.send(result)
+            except OSError:
+                break  # 親が終了した
+            except Exception:
+                # pickle できない例外（Playwright の例外など）は文字列にして返す
+                conn.send(RuntimeError(repr(result)))
+
+
+class SourceWorkers:
+    """取得先ごとの Fetcher（ブラウザ・ログイン済みコンテキスト）を、回をまたいで使い回して scrape する。
+
+    Playwright の同期APIはスレッドをまたいで使えないため、workers > 1 なら取得先ごとに常駐プロセスを
+    最初の取得時に起動し、close() まで使い回す（HTML の解析も各プロセスで並列に行われる）。
+    同時に取得するのは workers 件まで。workers == 1 ならこのプロセスで順番に取得する。
+    """
+
+    def __init__(self, sources, workers, options=FetchOptions()):
+        self.sources = sources
+        self.workers = max(1, min(workers, len(sources)))
+        self.options = options
+        self._fetchers = {}  # name -> Fetcher（workers == 1 のとき）
+        self._procs = {}     # name -> (Process, 親側の Connection)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def scrape_all(self, states, recipes=None):
+        """全取得先を scrape し、終わった順に (source, Scraped か例外) を返す。
+        states は取得先の name -> 前回の取得状態"""
+        if self.workers == 1:
+            for s in self.sources:
+                if s.name not in self._fetchers:
+                    self._fetchers[s.name] = Fetcher(s.site, self.options)
+                try:
+                    yield s, scrape(s, states.get(s.name, {}), self.options, self._fetchers[s.name], recipes)
+                except Exception as e:
+                    yield s, e
+            return
+
+        from multiprocessing.connection import wait
+
+        if not self._procs:
+            logging.info(f"{len(self.sources)}件の取得先を {self.workers} プロセスで並列取得します")
+        queue = list(self.sources)
+        running = {}  # 親側の Connection -> Source
+        try:
+            while queue or running:
+                while queue and len(running) < self.workers:
+                    s = queue.pop(0)
+                    conn = self._worker(s)
+                    try:
+                        conn.send((states.get(s.name, {}), recipes))
+                    except OSError as e:
+                        self._stop(s.name, timeout=0)
+                        yield s, e
+                        continue
+                    running[conn] = s
+                for conn in wait(list(running)):
+                    s = running.pop(conn)
+                    try:
+                        result = conn.recv()
+                    except EOFError:
+                        self._stop(s.name, timeout=0)  # 次回は起動し直す
+                        result = RuntimeError(f"取得先 '{s.name}' のプロセスが終了しました")
+                    if isinstance(result, tuple):
+                        scraped, snap = result
+                        metrics.merge(snap)
+                        result = scraped
+                    yield s, result
+        finally:
+            # 途中でやめた場合、取得中のプロセスの結果が次回に混ざらないよう止める
+            for s in running.values():
+                self._stop(s.name, timeout=0)
+
+    def _worker(self, source):
+        """取得先の常駐プロセス（なければ起動する）の Connection"""
+        proc, conn = self._procs.get(source.name, (None, None))
+        if proc is not None and proc.is_alive():
+            return conn
+        self._stop(source.name, timeout=0)
+        import multiprocessing
+
+        # fork なら子プロセスでモジュールを読み込み直さずに済む（設定は引数で渡す）
+        methods = multiprocessing.get_all_start_methods()
+        ctx = multiprocessing.get_context("fork" if "fork" in methods else None)
+        parent, child = ctx.Pipe()
+        # 未出力のバッファが子プロセスに複製されないように
+        sys.stdout.flush()
+        sys.stderr.flush()
+        proc = ctx.Process(target=_source_worker, args=(child, source, self.options),
+                           name=f"source-{source.name}", daemon=True)
+        proc.start()
+        child.close()
+        self._procs[source.name] = (proc, parent)
+        return parent
+
+    def _stop(self, name, timeout=30):
+        proc, conn = self._procs.pop(name, (None, None))
+        if proc is None:
+            return
+        try:
+            conn.send(None)
+        except OSError:
+            pass
+        proc.join(timeout)
+        if proc.is_alive():
+            proc.terminate()
+            proc.join()
+        conn.close()
+
+    def close(self):
+        """ブラウザ（常駐プロセス）をすべて閉じる"""
+        for fetcher in self._fetchers.values():
+            fetcher.close()
+        self._fetchers.clear()
+        for name in list(self._procs):
+            self._stop(name)
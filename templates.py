@@ -0,0 +1,168 @@
+# templates.py
+# 通知メッセージの整形。FORMAT_STYLE のテンプレートを起動時に1回だけ組み立て（compile）、
+# イベントごとの整形結果（断片）と文字数をキャッシュする
+from datetime import datetime
+from string import Formatter
+from typing import Dict, List, NamedTuple, Tuple
+
+from changes import EventDiff
+
+# スタイル -> (1件分の各行のテンプレート, 行の区切り)。
+# 行は {フィールド} を1つだけ含み、その値が空なら行ごと省く。使えるフィールドは
+# title / date / link と、詳細ページから取れた venue / deadline / body（CRAWL_DETAILS）。
+# {bullet} は BULLET の値（フィールドではないので行の省略には関係しない）
+STYLES: Dict[str, Tuple[Tuple[str, ...], str]] = {
+    "list": (("{bullet}{title}", "└ 日付: {date}", "└ 会場: {venue}", "└ 締切: {deadline}",
+              "└ {body}", "└ {link}"), "\n"),
+    "cards": (("【{title}】", "日付: {date}", "会場: {venue}", "締切: {deadline}", "{body}", "{link}"), "\n"),
+    "compact": (("{title}", "({date})", "{link}"), " "),
+}
+
+# 変更・削除も知らせるとき（NOTIFY_CHANGES）の区分の見出しと、変更内容の行（{changes} に「日付 A → B」）
+SECTIONS = (("added", "🆕 新着"), ("changed", "✏️ 変更"), ("removed", "🚫 中止・掲載終了"))
+CHANGE_LINES = {"list": "└ 変更: {changes}", "cards": "変更: {changes}", "compact": "(変更: {changes})"}
+FIELD_LABELS = {"title": "件名", "date": "日付", "venue": "会場", "deadline": "締切"}
+
+# 整形済み断片のキャッシュの上限（watch モードで増え続けないように）
+CACHE_MAX = 10_000
+
+
+class Fragment(NamedTuple):
+    """1件分の整形結果と、その文字数（メッセージ分割の計算に使う）"""
+    text: str
+    length: int
+
+
+class _Line(NamedTuple):
+    prefix: str
+    field: str
+    suffix: str
+
+
+def _compile_line(template: str, bullet: str) -> _Line:
+    """"└ 日付: {date}" → _Line("└ 日付: ", "date", "")。{bullet} はここで埋め込む"""
+    head, field, tail = [], None, []
+    for literal, name, _, _ in Formatter().parse(template):
+        (tail if field else head).append(literal)
+        if name == "bullet":
+            (tail if field else head).append(bullet)
+        elif name is not None:
+            if field:
+                raise ValueError(f"テンプレートの行にはフィールドを1つだけ書いてください: {template!r}")
+            field = name
+    if not field:
+        raise ValueError(f"テンプレートの行にフィールドがありません: {template!r}")
+    return _Line("".join(head), field, "".join(tail))
+
+
+class Renderer:
+    """スタイルを組み立て済みの整形器。
+
+    fragment(e) は1件分の断片を表示する項目の値ごとにキャッシュするので、
+    再送・分割・宛先ごとの送信で同じイベントを何度整形しても文字列は1回しか作らない。
+    """
+
+    def __init__(self, style="list", header_title="🎓 しがくイベント 新着", separator="\n\n",
+                 bullet="● ", show_header=True, detail_body_chars=60):
+        if style not in STYLES:
+            raise ValueError(f"FORMAT_STYLE '{style}' は未対応です（{', '.join(STYLES)}）")
+        templates, self._line_sep = STYLES[style]
+        self.style = style
+        self.header_title = header_title
+        self.separator = separator
+        self.show_header = show_header
+        self.detail_body_chars = detail_body_chars
+        self._lines: Tuple[_Line, ...] = tuple(_compile_line(t, bullet) for t in templates)
+        self._fields = tuple(line.field for line in self._lines)
+        self._change_line = CHANGE_LINES[style]
+        self._cache: Dict[tuple, Fragment] = {}
+
+    def _render(self, e) -> str:
+        out = []
+        for line in self._lines:
+            value = e.get(line.field)
+            if line.field == "title":
+                value = value or "(件名未取得)"
+            elif line.field == "body" and value:
+                n = self.detail_body_chars
+                if n <= 0:
+                    continue
+                value = f"{value[:n]}…" if len(value) > n else value
+            if value:
+                out.append(f"{line.prefix}{value}{line.suffix}")
+        return self._line_sep.join(out)
+
+    def fragment(self, e) -> Fragment:
+        # 既読の uid は正規化後の値なので、表記の違うイベントが同じ uid になりうる。キーは表示する値そのもの
+        key = tuple(e.get(f) for f in self._fields)
+        frag = self._cache.get(key)
+        if frag is None:
+            if len(self._cache) >= CACHE_MAX:
+                self._cache.clear()
+            text = self._render(e)
+            frag = self._cache[key] = Fragment(text, len(text))
+        return frag
+
+    def change_fragment(self, change) -> Fragment:
+        """changes.Change の断片（今回の内容 + 変わった項目の前後）"""
+        desc = " / ".join(f"{FIELD_LABELS.get(f, f)} {change.before.get(f)} → {change.event.get(f)}"
+                          for f in change.fields)
+        text = self._line_sep.join([self.fragment(change.event).text, self._change_line.format(changes=desc)])
+        return Fragment(text, len(text))
+
+    def _fragments(self, events):
+        """events（イベントのリストか changes.EventDiff）の断片を順に返す。
+        EventDiff なら区分ごとに、最初の1件の前に見出しを付ける（見出しだけがメッセージ末尾に残らないように）"""
+        if not isinstance(events, EventDiff):
+            yield from (self.fragment(e) for e in events)
+            return
+        for name, title in SECTIONS:
+            items = getattr(events, name)
+            for i, item in enumerate(items):
+                frag = self.change_fragment(item) if name == "changed" else self.fragment(item)
+                if i == 0:
+                    text = f"▼ {title}（{len(items)}件）\n{frag.text}"
+                    frag = Fragment(text, len(text))
+                yield frag
+
+    def header(self, at=None, note="") -> str:
+        """at は「何日時点」に使う日時（既定は現在。replay.py ではスナップショットの時刻）。
+        note は見出しの次の行に出す注意書き（SHOW_HEADER=false でも出す）"""
+        title = f"{self.header_title}（{(at or datetime.now()).strftime('%m/%d時点')}）" if self.show_header else ""
+        return "\n".join(s for s in (title, note) if s)
+
+    def render(self, events, note="") -> str:
+        """ヘッダー + 全イベント（1通にまとめる）。events は changes.EventDiff でもよい"""
+        body = self.separator.join(frag.text for frag in self._fragments(events))
+        return f"{self.header(note=note)}\n{body}".strip()
+
+    def chunks(self, events, limit, at=None, note="") -> List[str]:
+        """render と同じ内容を、イベントの切れ目で limit 文字以下の複数メッセージに分ける。
+        ヘッダーは最初のイベントの断片に付ける（ヘッダーだけのメッセージにはしない）。文字数は断片の length で数える"""
+        chunks = []
+        header = self.header(at, note)
+        cur, cur_len = [], 0
+        for i, (text, length) in enumerate(self._fragments(events)):
+            if i == 0 and header:
+                text, length = f"{header}\n{text}", len(header) + 1 + length  # ヘッダー直後は改行1つ
+            glue = len(self.separator) if cur else 0
+            if cur and cur_len + glue + length > limit:
+                chunks.append("".join(cur).strip())
+                cur, cur_len, glue = [], 0, 0
+            # 1件だけで上限を超える場合は文字数で分割（通常は起こらない）
+            while length > limit:
+                chunks.append(text[:limit])
+                text, length = text[limit:], length - limit
+            cur.append((self.separator if glue else "") + text)
+            cur_len += glue + length
+        if cur:
+            chunks.append("".join(cur).strip())
+        elif not chunks and header:
+            chunks.append(header)
+        return [c for c in chunks if c]
+
+
+def compile_renderer(settings) -> Renderer:
+    """Settings（FORMAT_STYLE / HEADER_TITLE / SEPARATOR / BULLET / SHOW_HEADER / DETAIL_BODY_CHARS）から作る"""
+    return Renderer(settings.format_style, settings.header_title, settings.separator,
+                    settings.bullet, settings.show_header, settings.detail_body_chars)
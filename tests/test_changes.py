@@ -0,0 +1,51 @@
+# 前回の一覧（スナップショット）との差分（changes.diff_events / notable）を確認する
+from datetime import date
+
+from changes import diff_events, event_key, notable
+
+TODAY = date(2025, 11, 1)
+
+
+def _event(i, day="2025.11.20（木）10:00", **fields):
+    return {"title": f"説明会{i}", "date": day, "link": f"https://example.com/reserve/?id={i}", **fields}
+
+
+def _before(events):
+    return {event_key(e): e for e in events}
+
+
+def test_diff_events_added_changed_removed():
+    before = _before([_event(1), _event(2), _event(3)])
+    events = [
+        _event(1, "２０２５/11/20 10:00"),        # 書き方が違うだけ → 変更なし
+        _event(2, "2025.11.27（木）10:00"),       # 日付の変更
+        _event(2),                                # 同じリンクが2回載っている → 2回目は見ない
+        _event(4),
+    ]
+    diff = diff_events(before, events)
+    assert [e["title"] for e in diff.added] == ["説明会4"]
+    assert [(c.event["title"], c.fields, c.before["date"]) for c in diff.changed] == \
+        [("説明会2", ("date",), "2025.11.20（木）10:00")]
+    assert [e["title"] for e in diff.removed] == ["説明会3"]
+    assert diff.size == 3
+
+
+def test_event_key_ignores_tracking_query():
+    assert event_key(_event(1)) == event_key({**_event(1), "link": _event(1)["link"] + "&utm_source=line"})
+
+
+def test_notable_drops_past_removals():
+    before = [_event(i) for i in range(10)] + [_event(10, "2025.10.25（土）10:00"), _event(11, "")]
+    diff = diff_events(_before(before), before[1:10])
+    # 開催日を過ぎたもの・日付が読めないものは通常の入れ替わり
+    assert [e["title"] for e in notable(diff, len(before), TODAY).removed] == ["説明会0"]
+
+
+def test_notable_suppresses_removals_when_half_the_listing_vanishes():
+    before = [_event(i) for i in range(10)]
+    diff = diff_events(_before(before), before[:4] + [_event(99)])
+    assert len(diff.removed) == 6
+    kept = notable(diff, len(before), TODAY)
+    assert kept.removed == [] and [e["title"] for e in kept.added] == ["説明会99"]
+    # ちょうど半分までは通知する
+    assert len(notable(diff_events(_before(before), before[:5]), len(before), TODAY).removed) == 5
@@ -0,0 +1,63 @@
+# 表記ゆれの正規化（identity）と、それによって既読イベントを送り直さないことを確認する
+import pytest
+
+import seen_store
+from identity import canonical_url, normalize_date, normalize_text, signature, similarity
+
+EVENT = {"title": "学校説明会（東京会場）", "date": "2025.11.07（金）10:00",
+         "link": "https://example.com/mypage/shigaku/reserve/?id=123&area=13"}
+
+
+def test_normalize_text():
+    assert normalize_text("ＡＢＣ　１２３  説明会\n") == "ABC 123 説明会"
+    assert normalize_text(None) == ""
+
+
+@pytest.mark.parametrize("date", ["2025.11.07（金）10:00", "２０２５／１１／７ 10:00", "2025年11月7日 10時00分",
+                                  " 2025/11/07 (金) 10:00 "])
+def test_normalize_date(date):
+    assert normalize_date(date) == "2025-11-07T10:00"
+
+
+def test_canonical_url_drops_tracking_and_default_port():
+    assert canonical_url("HTTPS://Example.com:443/mypage/?utm_source=line&id=1&fbclid=x#top") == \
+        "https://example.com/mypage/?id=1"
+    assert canonical_url("https://example.com/?b=2&a=1") == canonical_url("https://example.com:443/?a=1&b=2")
+    assert canonical_url("http://example.com:8080/") == "http://example.com:8080/"
+
+
+@pytest.mark.parametrize("variant", [
+    {"title": "学校説明会（東京会場） "},                          # 前後の空白だけの変更
+    {"title": "学校説明会(東京会場)"},                             # 全角括弧 → 半角
+    {"date": "２０２５．１１．０７（金） 10:00"},                   # 全角数字
+    {"link": EVENT["link"].replace("id=123&area=13", "area=13&id=123&utm_campaign=x")},
+])
+def test_trivially_edited_event_is_not_renotified(tmp_path, variant):
+    conn = seen_store.ensure_db(str(tmp_path / "seen.db"))
+    try:
+        new = list(seen_store.iter_new(conn, [dict(EVENT)]))
+        assert len(new) == 1  # 初回は新着
+        seen_store.mark_seen(conn, new)
+        edited = {**EVENT, **variant}
+        assert seen_store.uid_from_event(edited) == seen_store.uid_from_event(EVENT)
+        assert list(seen_store.iter_new(conn, [edited])) == []
+    finally:
+        seen_store.close(conn)
+
+
+def test_near_duplicate_title_is_flagged(tmp_path):
+    conn = seen_store.ensure_db(str(tmp_path / "seen.db"))
+    try:
+        seen = {**EVENT, "title": "2025年度 学校説明会（東京会場）第1回"}
+        seen_store.mark_seen(conn, list(seen_store.iter_new(conn, [seen])))
+        seen_store.index_titles(conn, [seen])
+        # 末尾に記号が付いただけ（id は変わる）/ 同じタイトルで日付が違う回 / 別のイベント
+        edited = {**seen, "title": "2025年度 学校説明会（東京会場）第1回※"}
+        next_month = {**seen, "date": "2025.12.05（金）10:00"}
+        other = {**EVENT, "title": "オープンキャンパス（大阪）"}
+        fresh, dups = seen_store.split_near_duplicates(conn, [edited, next_month, other])
+        assert dups == [edited] and fresh == [next_month, other]
+        assert edited["_near"][0] == seen["title"] and 0.8 <= edited["_near"][1] < 1.0
+        assert similarity(signature(seen["title"]), signature(other["title"])) < 0.8
+    finally:
+        seen_store.close(conn)
@@ -0,0 +1,53 @@
+# LineClient の再送（429 / 5xx / 受理済みの 409）を、模擬 LINE API（mock_line.py）に対して確認する
+import time
+
+from line_client import LineClient, raise_for_status
+from mock_line import MockLineServer, MockOptions
+
+PUSH = "/v2/bot/message/push"
+BODY = {"to": "U1", "messages": [{"type": "text", "text": "テスト"}]}
+
+
+def _client(mock, max_retries=4):
+    # バックオフ 0: Retry-After に従わなければ待たずに再送してしまう
+    return LineClient("token", api_base=mock.url, rate_per_sec=0, max_retries=max_retries, backoff_base=0)
+
+
+def test_retry_after_is_honored():
+    with MockLineServer(MockOptions(rate=3, burst=1, retry_after=0.4)) as mock:
+        client = _client(mock)
+        assert client.post(PUSH, BODY).status_code == 200
+        start = time.monotonic()
+        r = client.post(PUSH, BODY)  # バケットが空なので 429（Retry-After: 0.4）
+        elapsed = time.monotonic() - start
+    assert r.status_code == 200
+    assert [x["status"] for x in mock.received] == [200, 429, 200]
+    assert client.retries == 1
+    assert elapsed >= 0.4
+
+
+def test_5xx_is_retried_up_to_max_retries_then_returned():
+    with MockLineServer(MockOptions(error_rate=1.0, error_status=503)) as mock:
+        client = _client(mock, max_retries=2)
+        r = client.post(PUSH, BODY)
+    assert r.status_code == 503
+    assert len(mock.received) == 3  # 最初の1回 + 再送2回
+    assert client.retries == 2
+
+
+def test_retry_key_is_kept_across_retries():
+    with MockLineServer(MockOptions(fail_first=2, error_status=500)) as mock:
+        r = _client(mock).post(PUSH, BODY)
+    assert r.status_code == 200
+    keys = [x["retry_key"] for x in mock.received]
+    assert len(keys) == 3 and keys[0] and len(set(keys)) == 1
+
+
+def test_drop_after_accept_ends_with_accepted_409():
+    # 受理したのに 500 → 同じ Retry-Key の再送は 409（受理済み）→ 送信済みとして扱う
+    with MockLineServer(MockOptions(drop_after_accept=1.0)) as mock:
+        r = _client(mock).post(PUSH, BODY)
+    assert [x["status"] for x in mock.received] == [500, 409]
+    assert r.status_code == 409 and r.headers["x-line-accepted-request-id"]
+    raise_for_status(r)  # 例外にならない
+    assert len(mock.accepted) == 1
@@ -0,0 +1,119 @@
+# main.run_once の通知の流れを、フィクスチャのページと一時的な既読DBで確認する（LINE には送らない）
+import json
+import os
+
+import pytest
+
+import main
+import seen_store
+from scraper_login import Fetcher
+from settings import load_settings
+
+FIXTURES = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "fixtures")
+NEW_ITEM = """<li>
+              <a href="/mypage/shigaku/reserve/?id=99999" ontouchstart="">
+                <span>2025.12.01（月）10:00</span>                  <span class="nomal">◎空席あり</span>
+                                <br>新しい説明会（東京）              </a>
+            </li>
+"""
+
+
+@pytest.fixture
+def sent(monkeypatch):
+    """deliver に渡された通知（メッセージのリスト）を記録する"""
+    out = []
+    monkeypatch.setattr(main, "deliver", lambda message, broadcast, target_ids: out.append(message))
+    return out
+
+
+@pytest.fixture
+def conn(tmp_path):
+    c = seen_store.ensure_db(str(tmp_path / "seen.db"))
+    yield c
+    seen_store.close(c)
+
+
+def _run(conn, fixture, monkeypatch):
+    config = load_settings({"HTML_FIXTURE": str(fixture), "DRY_RUN": "true", "RUN_REPORT": ""})
+    monkeypatch.setattr(main, "CONFIG", config, raising=False)
+    with Fetcher(config.site, config.fetch) as fetcher:
+        main.run_once(conn, fetcher)
+
+
+def test_drifted_layout_still_notifies_new_event(conn, sent, monkeypatch, tmp_path):
+    original = os.path.join(FIXTURES, "shigaku_event.html")
+    _run(conn, original, monkeypatch)
+    assert len(sent) == 1  # 初回は一覧の34件
+
+    # class 名が変わって既知の形式に一致しなくなった一覧に、本当の新着が1件増えた
+    with open(original, encoding="utf-8") as f:
+        html = f.read().replace("row ttl", "row newlist")
+    at = html.index("<ul>", html.index('class="row newlist"')) + len("<ul>")
+    html = html[:at] + "\n" + NEW_ITEM + html[at:]
+    drifted = tmp_path / "drifted.html"
+    drifted.write_text(html, encoding="utf-8")
+    _run(conn, drifted, monkeypatch)
+    assert len(sent) == 2
+    text = "\n".join(sent[1])
+    assert main.INFERRED_NOTE in text
+    assert "新しい説明会（東京）" in text
+    assert text.count("reserve/?id=") == 1  # 既読の34件は送り直さない
+
+    # 次回は保存したレシピで解析し、新着がなければ送らない
+    _run(conn, drifted, monkeypatch)
+    assert len(sent) == 2
+
+
+# ---------- multicast_each（500人ずつの multicast と、失敗したバッチだけの個別 push）----------
+@pytest.fixture
+def line(monkeypatch, tmp_path):
+    """模擬 LINE API に送る CONFIG と、受け取ったリクエスト（本文付き）を読む関数"""
+    from mock_line import MockLineServer, MockOptions
+
+    def start(options):
+        record = tmp_path / "received.jsonl"
+        mock = MockLineServer(options, record=str(record)).start()
+        servers.append(mock)
+        config = load_settings({"LINE_CHANNEL_ACCESS_TOKEN": "token", "LINE_API_BASE": mock.url,
+                                "LINE_RATE_PER_SEC": "0", "LINE_MAX_RETRIES": "0", "RUN_REPORT": ""})
+        monkeypatch.setattr(main, "CONFIG", config, raising=False)
+        monkeypatch.setattr(main, "_LINE_CLIENT", None)
+
+        def received():
+            with open(record, encoding="utf-8") as f:
+                return [json.loads(line) for line in f]
+        return received
+
+    servers = []
+    yield start
+    if main._LINE_CLIENT is not None:
+        main._LINE_CLIENT.close()
+    for mock in servers:
+        mock.stop()
+
+
+def _pushed_to(requests):
+    return [r["body"]["to"] for r in requests if r["kind"] == "push" and r["status"] == 200]
+
+
+def test_multicast_each_pushes_only_failed_batch(line, caplog):
+    from mock_line import MockOptions
+    received = line(MockOptions(fail_first=1, error_status=400))  # 1つ目の multicast だけ失敗
+    ids = [f"U{i:04d}" for i in range(1100)]
+    with caplog.at_level("INFO"):
+        assert main.multicast_each(ids, ["通知"]) == (1100, 0)
+    requests = received()
+    multicast = [r for r in requests if r["kind"] == "multicast"]
+    assert [(r["status"], r["to"]) for r in multicast] == [(400, 500), (200, 500), (200, 100)]
+    assert _pushed_to(requests) == ids[:500]
+    assert "multicast バッチ 1/3 失敗 (500人" in caplog.text
+    assert "multicast バッチ 2/3 完了 (500人)" in caplog.text
+    assert "multicast バッチ 3/3 完了 (100人)" in caplog.text
+
+
+def test_multicast_each_counts_failed_pushes(line):
+    from mock_line import MockOptions
+    received = line(MockOptions(fail_first=3, error_status=400))  # multicast 1つ目と、その個別 push の最初の2人
+    ids = [f"U{i:04d}" for i in range(600)]
+    assert main.multicast_each(ids, ["通知"]) == (598, 2)
+    assert _pushed_to(received()) == ids[2:500]
@@ -0,0 +1,68 @@
+# parsers の出力が、BeautifulSoup 版（ベースライン）で作った期待値と一致することを確認する。
+# 期待値は fixtures/*.expected.json（ベースラインの parse_events_generic の出力そのまま）
+import json
+import os
+
+import pytest
+
+from parsers import content_digest, iter_events, parse_events_generic, parse_page, scan_page
+
+FIXTURES = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "fixtures")
+BASE_URL = "https://example.com/mypage/shigaku/schedule/events/"
+CASES = [
+    "shigaku_event",        # 実際のページ（34件）
+    "row_ttl_edge_cases",   # 入れ子の span・コメント・先頭でない span・文字列の &lt;br&gt; など
+]
+
+
+def _load(name):
+    with open(os.path.join(FIXTURES, f"{name}.html"), encoding="utf-8") as f:
+        html = f.read()
+    with open(os.path.join(FIXTURES, f"{name}.expected.json"), encoding="utf-8") as f:
+        return html, json.load(f)
+
+
+@pytest.mark.parametrize("name", CASES)
+def test_parse_events_generic_matches_baseline(name):
+    html, expected = _load(name)
+    assert parse_events_generic(html, BASE_URL) == expected
+
+
+@pytest.mark.parametrize("name", CASES)
+@pytest.mark.parametrize("prefer", [None, "row_ttl"])
+def test_iter_events_matches_baseline(name, prefer):
+    html, expected = _load(name)
+    assert list(iter_events(html, BASE_URL, prefer)) == expected
+
+
+@pytest.mark.parametrize("name", CASES)
+def test_iter_events_small_chunks(name):
+    # 要素の途中で区切られても同じ結果になる
+    html, expected = _load(name)
+    chunks = (html[i:i + 97] for i in range(0, len(html), 97))
+    assert list(iter_events(chunks, BASE_URL)) == expected
+
+
+def test_shigaku_event_count():
+    _, expected = _load("shigaku_event")
+    assert len(expected) == 34
+
+
+def test_inferred_selector_matches_row_ttl_output():
+    # class 名が変わって既知の形式に一致しなくなっても、推定したセレクタで同じ日付・件名が取れる
+    html, expected = _load("shigaku_event")
+    result = parse_page(html.replace("row ttl", "row newlist"), BASE_URL, recipes={})
+    assert result.inferred and not result.cached
+    assert result.events == expected
+
+
+def test_no_fingerprint_without_repeated_groups():
+    html = "<html><body><p><a href='/x'>2025/11/01 説明会</a></p></body></html>"
+    assert parse_page(html, BASE_URL, recipes={}).fingerprint is None
+
+
+@pytest.mark.parametrize("name", CASES)
+def test_scan_page_matches_digest_and_events(name):
+    # 大きなページ用の1回のパースで、content_digest と parse_events_generic と同じ結果になる
+    html, expected = _load(name)
+    assert scan_page(html, BASE_URL) == (content_digest(html), expected)
@@ -0,0 +1,161 @@
+# 既読DB（seen_store）のスキーマ移行・取得状態・保持ポリシーを、一時ファイルの SQLite で確認する
+import hashlib
+import json
+import os
+import sqlite3
+
+import pytest
+
+import seen_store
+
+FIXTURES = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "fixtures")
+
+
+def _fixture_events():
+    with open(os.path.join(FIXTURES, "shigaku_event.expected.json"), encoding="utf-8") as f:
+        return json.load(f)
+
+
+def _baseline_db(path, events):
+    """最初の版の main.py が作る既読DB（id は タイトル|日付|リンク の SHA-256 16進 TEXT）"""
+    old = sqlite3.connect(path)
+    old.execute("CREATE TABLE seen(id TEXT PRIMARY KEY, created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP)")
+    old.executemany("INSERT INTO seen(id) VALUES(?)", (
+        (hashlib.sha256(f"{e['title']}|{e['date']}|{e['link']}".encode("utf-8")).hexdigest(),) for e in events))
+    old.commit()
+    old.close()
+
+
+@pytest.fixture
+def db(tmp_path):
+    return str(tmp_path / "seen.db")
+
+
+@pytest.fixture
+def conn(db):
+    c = seen_store.ensure_db(db)
+    yield c
+    seen_store.close(c)
+
+
+# ---------- fetch_state ----------
+def test_fetch_state_is_kept_per_source(conn):
+    url = "https://example.com/events/"
+    seen_store.save_fetch_state(conn, url, '"a"', None, "digest-a", "tokyo")
+    seen_store.save_fetch_state(conn, url, '"b"', None, "digest-b", "osaka")  # 同じ URL・別アカウント
+    assert seen_store.load_fetch_state(conn, url, "tokyo")["digest"] == "digest-a"
+    assert seen_store.load_fetch_state(conn, url, "osaka")["digest"] == "digest-b"
+    assert seen_store.load_fetch_state(conn, url) == {}
+
+
+def test_fetch_state_migrates_url_keyed_table(db):
+    old = sqlite3.connect(db)
+    old.execute("""CREATE TABLE fetch_state(url TEXT PRIMARY KEY, etag TEXT, last_modified TEXT, digest TEXT,
+                   updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP)""")
+    old.execute("INSERT INTO fetch_state(url, etag, last_modified, digest) VALUES('https://example.com/', 'e', 'lm', 'd')")
+    old.commit()
+    old.close()
+    conn = seen_store.ensure_db(db)
+    try:
+        assert seen_store.load_fetch_state(conn, "https://example.com/") == \
+            {"etag": "e", "last_modified": "lm", "digest": "d"}
+    finally:
+        seen_store.close(conn)
+
+
+# ---------- seen の移行（TEXT → BLOB）----------
+def test_baseline_db_is_migrated_without_renotifying(db):
+    events = _fixture_events()
+    _baseline_db(db, events)
+    conn = seen_store.ensure_db(db)
+    try:
+        cols = {row[1]: row[2] for row in conn.execute("PRAGMA table_info(seen)")}
+        assert cols["id"] == "BLOB" and "source" in cols
+        assert conn.execute("SELECT COUNT(*), MIN(length(id)), MAX(length(id)) FROM seen").fetchone() == \
+            (34, seen_store.ID_BYTES, seen_store.ID_BYTES)
+        # 正規化前の id（_raw_uid）で既読なので新着にならず、正規化後の id も登録される
+        assert list(seen_store.iter_new(conn, events)) == []
+        uids = [seen_store.uid_from_event(e) for e in events]
+        assert seen_store.seen_ids(conn, uids) == set(uids)
+    finally:
+        seen_store.close(conn)
+
+
+def test_new_event_after_migration_is_new(db):
+    events = _fixture_events()
+    _baseline_db(db, events[1:])
+    conn = seen_store.ensure_db(db)
+    try:
+        assert [e["link"] for e in seen_store.iter_new(conn, events)] == [events[0]["link"]]
+    finally:
+        seen_store.close(conn)
+
+
+def test_blob_ids_without_source_are_migrated(db):
+    events = _fixture_events()[:3]
+    old = sqlite3.connect(db)
+    old.execute("CREATE TABLE seen(id BLOB PRIMARY KEY, created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP) WITHOUT ROWID")
+    old.executemany("INSERT INTO seen(id) VALUES(?)", ((seen_store.uid_from_event(e),) for e in events))
+    old.commit()
+    old.close()
+    conn = seen_store.ensure_db(db)
+    try:
+        assert conn.execute("SELECT DISTINCT source FROM seen").fetchall() == [(seen_store.DEFAULT_SOURCE,)]
+        assert list(seen_store.iter_new(conn, events)) == []
+    finally:
+        seen_store.close(conn)
+
+
+# ---------- 保持ポリシー・圧縮・書き出し ----------
+def _seed(conn, events, source=seen_store.DEFAULT_SOURCE, days_ago=400):
+    for e in events:
+        e["_uid"] = seen_store.uid_from_event(e)
+    seen_store.mark_seen(conn, events, source)
+    conn.execute("UPDATE seen SET created_at=datetime('now', ?) WHERE source=?", (f"-{days_ago} days", source))
+    conn.commit()
+
+
+def test_prune_keeps_current_listing(conn):
+    events = _fixture_events()
+    _seed(conn, events)
+    listing = events[:5]  # いま一覧に載っているイベント
+    deleted = seen_store.prune(conn, max_age_days=180, keep=[seen_store.uid_from_event(e) for e in listing])
+    assert deleted == len(events) - 5
+    assert list(seen_store.iter_new(conn, listing)) == []
+
+
+def test_prune_keep_last_is_per_source(conn):
+    events = _fixture_events()
+    _seed(conn, events[:10], "tokyo")
+    _seed(conn, events[10:14], "osaka")
+    assert seen_store.prune(conn, keep_last=5) == 5
+    counts = dict(conn.execute("SELECT source, COUNT(*) FROM seen GROUP BY source"))
+    assert counts == {"tokyo": 5, "osaka": 4}
+    assert seen_store.prune(conn) == 0  # 条件がなければ何もしない
+
+
+def test_compact_after_prune(conn):
+    events = [{"title": f"イベント{i}", "date": "2025/11/01", "link": f"https://example.com/{i}"} for i in range(5000)]
+    _seed(conn, events)
+    assert seen_store.prune(conn, keep_last=10) == 4990
+    assert seen_store.compact(conn)
+    assert conn.execute("PRAGMA freelist_count").fetchone()[0] == 0
+    assert not seen_store.compact(conn)  # 空きがなければ VACUUM しない
+
+
+def test_export_import_round_trip(conn, tmp_path):
+    events = _fixture_events()
+    _seed(conn, events[:3])
+    _seed(conn, events[3:5], "tokyo")
+    path = tmp_path / "seen.txt"
+    assert seen_store.export_digests(conn, str(path)) == 5
+    lines = path.read_text(encoding="utf-8").splitlines()
+    assert lines == sorted(lines) and sum(line.startswith("tokyo\t") for line in lines) == 2
+
+    other = seen_store.ensure_db(str(tmp_path / "other.db"))
+    try:
+        assert seen_store.import_digests(other, str(path)) == 5
+        assert seen_store.import_digests(other, str(path)) == 0  # 2回目は重複なし
+        assert list(seen_store.iter_new(other, events[3:5], "tokyo")) == []
+    finally:
+        seen_store.close(other)
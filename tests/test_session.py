@@ -0,0 +1,147 @@
+# ログイン済みセッションの再利用・期限切れ・保存を、模擬ログインサイト（mock_site.py）で確認する。
+# ブラウザの経路は Playwright と Chromium が入っている環境でだけ動く（なければ skip）:
+#   pip install playwright && python -m playwright install chromium
+#   python -m pytest -q tests/test_session.py
+import json
+import os
+import stat
+
+import pytest
+
+from mock_site import COOKIE_NAME, DEFAULT_EVENTS_HTML, MockSiteServer
+from scraper_login import _HTTP_SESSIONS, FetchOptions, Fetcher, Site, _fetch_via_http, _has_wait_marker
+
+EVENT_TITLE = "ﾊﾞｰｽﾃﾞｲｻｲｴﾝｽｾﾐﾅｰ"
+
+
+@pytest.fixture
+def mock_site():
+    with MockSiteServer(user="demo", password="secret") as server:
+        yield server
+
+
+def _site(server, state_path):
+    return Site(server.url + "/login", server.url + "/events", "demo", "secret", session_state=str(state_path))
+
+
+def _write_state(path, token):
+    with open(path, "w", encoding="utf-8") as f:
+        json.dump({"cookies": [{"name": COOKIE_NAME, "value": token, "domain": "127.0.0.1", "path": "/",
+                                "expires": -1, "httpOnly": True, "secure": False}], "origins": []}, f)
+
+
+def _saved_token(path):
+    with open(path, "r", encoding="utf-8") as f:
+        cookies = json.load(f)["cookies"]
+    return next(c["value"] for c in cookies if c["name"] == COOKIE_NAME)
+
+
+# ---------- HTTPモード（ブラウザなし） ----------
+def test_http_mode_reuses_saved_cookie(mock_site, tmp_path):
+    state = tmp_path / "state.json"
+    _write_state(state, mock_site.new_session())
+    with Fetcher(_site(mock_site, state), FetchOptions(fetch_mode="http")) as fetcher:
+        result = fetcher.fetch()
+    assert EVENT_TITLE in result.html
+    assert result.final_url == mock_site.url + "/events"
+    assert mock_site.logins == 0
+
+
+def test_http_mode_detects_expired_cookie(mock_site, tmp_path):
+    state = tmp_path / "state.json"
+    _write_state(state, mock_site.new_session())
+    mock_site.expire_sessions()
+    # /login へリダイレクトされたらセッション切れとして None（呼び出し側がブラウザでログインし直す）
+    assert _fetch_via_http(_site(mock_site, state), FetchOptions(fetch_mode="http")) is None
+    assert ("GET", "/login", 200) in mock_site.requests
+
+
+def test_http_mode_saves_rotated_cookie(tmp_path):
+    state = tmp_path / "state.json"
+    with MockSiteServer(user="demo", password="secret", rotate=True) as server:
+        old = server.new_session()
+        _write_state(state, old)
+        os.chmod(state, 0o644)
+        site = _site(server, state)
+        assert _fetch_via_http(site, FetchOptions(fetch_mode="http")) is not None
+        # 差し替えられた cookie が保存され、次回の実行（別プロセス）もログインせずに取得できる
+        assert _saved_token(state) != old and _saved_token(state) in server.sessions
+        assert stat.S_IMODE(os.stat(state).st_mode) == 0o600
+        with open(state, "r", encoding="utf-8") as f:
+            assert json.load(f)["origins"] == []
+        _HTTP_SESSIONS.clear()
+        assert _fetch_via_http(site, FetchOptions(fetch_mode="http")) is not None
+        assert server.logins == 0
+
+
+@pytest.mark.parametrize("selector, found", [
+    ("text=ログアウト", False),                      # Playwright 専用 → 確かめられないのでブラウザへ
+    ('li:has-text("説明会")', False),
+    ("text=ログアウト, div.row.ttl", True),          # lxml で確かめられるものが該当すれば HTTP で取得
+])
+def test_playwright_only_wait_selector_falls_back(selector, found, capsys):
+    with open(DEFAULT_EVENTS_HTML, "r", encoding="utf-8") as f:
+        html = f.read()
+    site = Site(None, None, None, None, wait_selector=selector)
+    assert _has_wait_marker(html, site) is found
+    assert "HTTPモードでは確認できません" in capsys.readouterr().out
+
+
+# ---------- ブラウザ（Playwright） ----------
+@pytest.fixture(scope="module")
+def chromium():
+    sync_api = pytest.importorskip("playwright.sync_api")
+    try:
+        pw = sync_api.sync_playwright().start()
+    except Exception as e:
+        pytest.skip(f"Playwright を起動できません: {e}")
+    try:
+        pw.chromium.launch(headless=True).close()
+    except Exception as e:
+        pytest.skip(f"Chromium を起動できません（python -m playwright install chromium）: {e}")
+    finally:
+        pw.stop()
+
+
+def _fetch(site):
+    with Fetcher(site, FetchOptions(wait_timeout_ms=2000)) as fetcher:
+        return fetcher.fetch()
+
+
+def test_browser_logs_in_and_saves_session(chromium, mock_site, tmp_path):
+    state = tmp_path / "state.json"
+    result = _fetch(_site(mock_site, state))
+    assert EVENT_TITLE in result.html
+    assert mock_site.logins == 1
+    assert _saved_token(state) in mock_site.sessions
+    assert stat.S_IMODE(os.stat(state).st_mode) == 0o600
+
+
+def test_browser_reuses_saved_session(chromium, mock_site, tmp_path):
+    state = tmp_path / "state.json"
+    _fetch(_site(mock_site, state))
+    result = _fetch(_site(mock_site, state))  # 別の Fetcher（＝次回の実行）
+    assert EVENT_TITLE in result.html
+    assert mock_site.logins == 1
+
+
+def test_browser_logs_in_again_when_session_expired(chromium, mock_site, tmp_path):
+    state = tmp_path / "state.json"
+    _fetch(_site(mock_site, state))
+    old = _saved_token(state)
+    mock_site.expire_sessions()
+    result = _fetch(_site(mock_site, state))
+    assert EVENT_TITLE in result.html
+    assert mock_site.logins == 2
+    assert _saved_token(state) != old and _saved_token(state) in mock_site.sessions
+
+
+def test_fetcher_keeps_context_between_fetches(chromium, mock_site, tmp_path):
+    site = _site(mock_site, tmp_path / "state.json")
+    with Fetcher(site, FetchOptions(wait_timeout_ms=2000)) as fetcher:
+        fetcher.fetch()
+        fetcher.fetch()
+        assert mock_site.logins == 1
+        mock_site.expire_sessions()  # watch モードの途中でセッションが切れた
+        assert EVENT_TITLE in fetcher.fetch().html
+    assert mock_site.logins == 2
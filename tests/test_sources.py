@@ -0,0 +1,57 @@
+# SourceWorkers が取得先ごとの常駐プロセス（Fetcher）を回をまたいで使い回すことを、フィクスチャの取得先で確認する
+import os
+
+import pytest
+
+from scraper_login import Site
+from sources import Scraped, Source, SourceWorkers, load_sources
+
+FIXTURES = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "fixtures")
+
+
+def _sources():
+    return [Source(name, Site(None, f"https://example.com/{name}/", None, None,
+                              html_fixture=os.path.join(FIXTURES, f"{fixture}.html")))
+            for name, fixture in (("a", "shigaku_event"), ("b", "row_ttl_edge_cases"))]
+
+
+def _events(workers):
+    return {s.name: len(r.events) for s, r in workers.scrape_all({})}
+
+
+@pytest.mark.parametrize("n", [1, 2])
+def test_scrape_all_returns_every_source(n):
+    with SourceWorkers(_sources(), n) as workers:
+        results = dict(workers.scrape_all({}))
+    assert all(isinstance(r, Scraped) for r in results.values())
+    assert {s.name: len(r.events) for s, r in results.items()} == {"a": 34, "b": 7}
+
+
+def test_workers_are_kept_between_checks():
+    with SourceWorkers(_sources(), 2) as workers:
+        _events(workers)
+        pids = {name: proc.pid for name, (proc, _) in workers._procs.items()}
+        assert _events(workers) == {"a": 34, "b": 7}
+        assert {name: proc.pid for name, (proc, _) in workers._procs.items()} == pids
+    assert not workers._procs
+
+
+def test_dead_worker_is_restarted():
+    with SourceWorkers(_sources(), 2) as workers:
+        _events(workers)
+        proc, _ = workers._procs["a"]
+        proc.terminate()
+        proc.join()
+        assert _events(workers) == {"a": 34, "b": 7}
+        assert workers._procs["a"][0].pid != proc.pid
+
+
+def test_session_state_per_source_keeps_suffix(tmp_path):
+    conf = tmp_path / "sources.toml"
+    conf.write_text('[[sources]]\nname = "tokyo"\nevents_url = "https://example.com/t/"\n'
+                    '[[sources]]\nname = "osaka"\nevents_url = "https://example.com/o/"\n'
+                    'session_state = "osaka.json"\n', encoding="utf-8")
+    base = Site(None, None, None, None, session_state=".session_state.json")
+    tokyo, osaka = load_sources(str(conf), base)
+    assert tokyo.site.session_state == ".session_state.tokyo.json"  # .gitignore の .session_state* に一致
+    assert osaka.site.session_state == "osaka.json"
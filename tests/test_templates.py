@@ -0,0 +1,46 @@
+# 通知の分割（Renderer.chunks / main.message_batches）が LINE の上限を守り、内容を変えないことを確認する
+import json
+import os
+
+import pytest
+
+from main import INFERRED_NOTE, LINE_MESSAGES_PER_REQUEST, LINE_TEXT_MAX, message_batches
+from templates import STYLES, Renderer
+
+FIXTURES = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "fixtures")
+
+
+def _events(n):
+    with open(os.path.join(FIXTURES, "shigaku_event.expected.json"), encoding="utf-8") as f:
+        base = json.load(f)
+    return [{**e, "link": f"{e['link']}&n={i}"} for i in range(n // len(base) + 1) for e in base][:n]
+
+
+@pytest.mark.parametrize("style", list(STYLES))
+@pytest.mark.parametrize("note", ["", INFERRED_NOTE])
+def test_chunks_fit_limits_and_keep_content(style, note):
+    renderer = Renderer(style)
+    events = _events(500)
+    chunks = renderer.chunks(events, LINE_TEXT_MAX, note=note)
+    assert len(chunks) > 1
+    assert all(len(c) <= LINE_TEXT_MAX for c in chunks)
+    assert all(len(batch) <= LINE_MESSAGES_PER_REQUEST for batch in message_batches(chunks))
+    assert sum(len(batch) for batch in message_batches(chunks)) == len(chunks)
+    # 分割の切れ目はイベントの区切りなので、区切りでつなぎ直すと1通にまとめた場合と同じ
+    assert renderer.separator.join(chunks) == renderer.render(events, note=note)
+
+
+def test_header_is_attached_to_oversized_first_event():
+    renderer = Renderer()
+    huge = {"title": "長" * 6000, "date": "2025.11.01（土）11:30", "link": "https://example.com/1"}
+    chunks = renderer.chunks([huge, *_events(3)], LINE_TEXT_MAX)
+    header = renderer.header()
+    assert all(len(c) <= LINE_TEXT_MAX for c in chunks)
+    assert chunks[0].startswith(header + "\n● 長長")  # ヘッダーだけのメッセージにはしない
+    assert "".join(chunks[:2]).startswith(f"{header}\n● {huge['title']}")
+
+
+def test_header_only_without_events():
+    renderer = Renderer()
+    assert renderer.chunks([], LINE_TEXT_MAX) == [renderer.header()]
+    assert Renderer(show_header=False).chunks([], LINE_TEXT_MAX) == []